@@ -0,0 +1,435 @@
+from datetime import datetime
+from elasticsearch import BadRequestError, ConflictError, NotFoundError, helpers
+import telemetry
+from main import (
+    CORRELATION_SOURCE, EDGE_PROPERTIES, OPEN_INCIDENTS_QUERY, SOURCE_FEED, SOURCE_LIST, SOURCE_NO_EMBEDDING,
+    GraphBase, IncidentManagerBase, _encode_page_token, _read_bootstrap_marker, _source_params, _write_bootstrap_marker,
+    embedding_dims,
+)
+
+@telemetry.trace_methods("graph")
+class AsyncElasticsearchGraph(GraphBase):
+    """
+    The graph on an AsyncElasticsearch client, for the calls made while serving requests
+    (node reads and writes, vector search). Request bodies, mappings and the node cache
+    come from GraphBase, shared with ElasticsearchGraph. Bulk loads, archiving, migrations
+    and traversals are batch jobs and only exist on the synchronous graph (main.py).
+    Call `await graph.bootstrap()` once before use.
+    """
+    def _bootstrap(self, mode):
+        # index checks have to be awaited; see bootstrap()
+        self._bootstrap_mode = mode
+
+    async def bootstrap(self):
+        """Async _bootstrap: check the indices unless INDEX_BOOTSTRAP or a cached check says not to."""
+        if self._bootstrap_mode == "never":
+            return
+        if self._bootstrap_mode == "auto":
+            entry = _read_bootstrap_marker(self._bootstrap_key())
+            if entry is not None:
+                self.vector_indexed = entry.get("vector_indexed")
+                return
+        await self.init_indices()
+
+    async def init_indices(self):
+        await self._create_indices()
+        _write_bootstrap_marker(self._bootstrap_key(), self.vector_indexed)
+
+    async def _create_indices(self):
+        """Async _create_indices: node index with an indexed embedding, edge index with keyword endpoints."""
+        dims = embedding_dims()
+        if not await self.es.indices.exists(index=self.node_index):
+            await self.es.indices.create(index=self.node_index, body=self._node_index_body(dims))
+            self.vector_indexed = True
+        else:
+            try:
+                props = self._mapped_properties(await self.es.indices.get_mapping(index=self.node_index))
+                if "embedding" not in props:
+                    await self.es.indices.put_mapping(
+                        index=self.node_index,
+                        body={"properties": {"embedding": self._embedding_mapping(dims)}}
+                    )
+                    self.vector_indexed = True
+                else:
+                    self.vector_indexed = props["embedding"].get("index") is True
+            except Exception:
+                pass
+        if not await self.es.indices.exists(index=self.edge_index):
+            await self.es.indices.create(index=self.edge_index, body={"mappings": {"properties": EDGE_PROPERTIES}})
+        if self.history_index:
+            await self.es.indices.put_index_template(name=self.history_index, body=self._history_template())
+            if not await self.es.indices.exists_alias(name=self.history_index):
+                index, body = self._first_history_index()
+                await self.es.indices.create(index=index, body=body)
+
+    async def add_node(self, node_id, properties):
+        body = self._node_document(node_id, properties)
+        await self.es.index(index=self.node_index, id=node_id, document=body)
+        self._cache_node(node_id, body)
+
+    async def create_node(self, node_id, properties):
+        if await self.find_archived([node_id], source=False):
+            return False
+        body = self._node_document(node_id, properties)
+        try:
+            await self.es.create(index=self.node_index, id=node_id, document=body)
+        except ConflictError:
+            return False
+        self._cache_node(node_id, body)
+        return True
+
+    async def upsert_node(self, node_id, doc, upsert, increments=None):
+        script, body = self._upsert_request(node_id, doc, upsert, increments)
+        resp = await self.es.update(index=self.node_index, id=node_id, script=script, upsert=body, retry_on_conflict=5)
+        self._invalidate_node(node_id)
+        if resp.get("result") == "created" and await self.restore_archived([node_id], {node_id: (doc, increments)}):
+            resp = dict(resp, result="updated")
+        return resp
+
+    async def bulk_upsert_nodes(self, upserts, chunk_size=500):
+        """Async bulk_upsert_nodes: yields (ok, node_id, error) for every node."""
+        merges = {}
+        created = []
+        async for ok, item in helpers.async_streaming_bulk(
+            self.es, self._upsert_actions(upserts, merges), chunk_size=chunk_size,
+            raise_on_error=False, raise_on_exception=False,
+        ):
+            info = self._bulk_item(item)
+            self._invalidate_node(info.get("_id"))
+            if ok and info.get("result") == "created":
+                created.append(info.get("_id"))
+            yield ok, info.get("_id"), None if ok else info.get("error")
+        if created and self.history_index:
+            await self.restore_archived(created, merges)
+
+    async def get_node(self, node_id, source=None, history=False):
+        cached = self._cached_node(node_id, source)
+        if cached is not None:
+            return cached
+        try:
+            node = (await self.es.get(index=self.node_index, id=node_id, **_source_params(source)))["_source"]
+        except NotFoundError:
+            if not history:
+                return None
+            hit = (await self.find_archived([node_id], source)).get(node_id)
+            return hit["_source"] if hit else None
+        except Exception:
+            return None
+        self._cache_node(node_id, node, source)
+        return dict(node)
+
+    async def get_nodes(self, node_ids, source=None, history=False):
+        found = {}
+        missing = []
+        for node_id in dict.fromkeys(node_ids):
+            cached = self._cached_node(node_id, source)
+            if cached is not None:
+                found[node_id] = cached
+            else:
+                missing.append(node_id)
+        if missing:
+            resp = await self.es.mget(index=self.node_index, ids=missing, **_source_params(source))
+            for doc in resp.get("docs", []):
+                if doc.get("found"):
+                    found[doc["_id"]] = doc["_source"]
+                    self._cache_node(doc["_id"], doc["_source"], source)
+            if history:
+                for node_id, hit in (await self.find_archived([i for i in missing if i not in found], source)).items():
+                    found[node_id] = hit["_source"]
+        return found
+
+    async def find_archived(self, node_ids, source=None):
+        found = {}
+        missing = list(dict.fromkeys(node_ids)) if self.history_index else []
+        while missing:
+            resp = await self.es.search(index=self.history_index, body=self._find_archived_body(missing, source))
+            missing = self._collect_archived(resp, missing, found)
+        return found
+
+    async def restore_archived(self, node_ids, merges=None):
+        """Async restore_archived: moves archived nodes back to the node index, returns their IDs."""
+        archived = await self.find_archived(node_ids)
+        if not archived:
+            return []
+        restored = []
+        async for ok, item in helpers.async_streaming_bulk(
+            self.es, self._restore_actions(archived, merges), raise_on_error=False, raise_on_exception=False
+        ):
+            if ok:
+                restored.append(self._bulk_item(item).get("_id"))
+        deletes = self._delete_actions([archived[node_id] for node_id in restored])
+        async for _ in helpers.async_streaming_bulk(self.es, deletes, raise_on_error=False, raise_on_exception=False):
+            pass
+        for node_id in restored:
+            self._invalidate_node(node_id)
+        return restored
+
+    async def update_node(self, node_id, properties=None, script=None):
+        kwargs = self._update_kwargs(properties, script)
+        try:
+            await self.es.update(index=self.node_index, id=node_id, **kwargs)
+        except NotFoundError:
+            if not await self.restore_archived([node_id]):
+                raise
+            await self.es.update(index=self.node_index, id=node_id, **kwargs)
+        self._invalidate_node(node_id)
+
+    async def add_edge(self, edge_id, source, target, properties):
+        body = self._edge_document(edge_id, source, target, properties)
+        await self.es.index(index=self.edge_index, id=edge_id, document=body)
+
+    async def get_edge(self, edge_id):
+        try:
+            return (await self.es.get(index=self.edge_index, id=edge_id))["_source"]
+        except Exception:
+            return None
+
+    async def bulk_add_edges(self, edges, chunk_size=500):
+        """Async bulk_add_edges: yields (ok, edge_id, error) for every edge."""
+        async for ok, item in helpers.async_streaming_bulk(
+            self.es, self._edge_actions(edges), chunk_size=chunk_size, raise_on_error=False, raise_on_exception=False
+        ):
+            info = self._bulk_item(item)
+            yield ok, info.get("_id"), None if ok else info.get("error")
+
+    async def search_nodes(self, query=None, size=10, source=None, history=False):
+        q = query if query is not None else {"match_all": {}}
+        kwargs = {"source": source} if source is not None else {}
+        resp = await self.es.search(index=self._read_index(history), query=q, size=size, **kwargs)
+        return [hit["_source"] for hit in resp.get("hits", {}).get("hits", [])]
+
+    async def search_page(self, query=None, sort_field="updated_at", order="desc", size=10, search_after=None, source=None,
+                          history=False):
+        body = self._page_body(query, sort_field, order, size, search_after, source)
+        return self._page_result(await self.es.search(index=self._read_index(history), body=body), size)
+
+    async def aggregate_nodes(self, query, aggs, runtime_mappings=None, history=False):
+        body = self._aggregate_body(query, aggs, runtime_mappings)
+        resp = await self.es.search(index=self._read_index(history), body=body)
+        return resp["hits"]["total"]["value"], resp.get("aggregations", {})
+
+    async def search_by_vector(self, vector, k=10, num_candidates=None, filters=None, mode=None, with_scores=False, source=None,
+                               history=False):
+        """Async search_by_vector: kNN, falling back to exact scoring in auto mode."""
+        index = self._read_index(history)
+        mode = self._vector_mode(mode)
+        if mode == "knn":
+            body = self._knn_body(vector, k, num_candidates, filters, source)
+            try:
+                resp = await self.es.search(index=index, body=body)
+            except BadRequestError:
+                if not self._knn_fallback():
+                    raise
+            else:
+                self._knn_succeeded()
+                return self._vector_hits(resp, "knn", with_scores)
+        resp = await self.es.search(index=index, body=self._exact_body(vector, k, filters, source))
+        return self._vector_hits(resp, "exact", with_scores)
+
+    async def search_hybrid(self, text, vector=None, k=10, offset=0, filters=None, num_candidates=None, source=None,
+                            history=False):
+        """Async search_hybrid: BM25 and vector search in one msearch, fused with RRF."""
+        index = self._read_index(history)
+        window = self._hybrid_window(k, offset)
+        searches, mode = self._hybrid_searches(text, vector, window, filters, num_candidates, source)
+        responses = (await self.es.msearch(index=index, searches=searches)).get("responses", [])
+        if self._knn_failed(responses, mode):
+            responses[1] = await self.es.search(index=index, body=self._exact_body(vector, window, filters, source))
+        return self._fuse_rrf(responses, k, offset)
+
+    async def iter_nodes(self, query=None, sort_field=None, order="desc", page_size=500, keep_alive="1m", source=None,
+                         history=False, unmapped_type="date"):
+        """Async iter_nodes (PIT + search_after); use with `async for`."""
+        sort = self._pit_sort(sort_field, order, unmapped_type)
+        pit_id = (await self.es.open_point_in_time(index=self._read_index(history), keep_alive=keep_alive))["id"]
+        try:
+            search_after = None
+            while True:
+                body = self._pit_body(pit_id, keep_alive, query, sort, page_size, search_after, source)
+                resp = await self.es.search(body=body)
+                pit_id = resp.get("pit_id", pit_id)
+                hits = resp.get("hits", {}).get("hits", [])
+                for hit in hits:
+                    yield hit["_source"]
+                if len(hits) < page_size:
+                    break
+                search_after = hits[-1]["sort"]
+        finally:
+            try:
+                await self.es.close_point_in_time(id=pit_id)
+            except Exception:
+                pass
+
+@telemetry.trace_methods("incidents")
+class AsyncIncidentManager(IncidentManagerBase):
+    """
+    The incident manager over an AsyncElasticsearchGraph, with embeddings computed through
+    AsyncOpenAI (EmbeddingProvider.aembed), for the API endpoints and the incident pages.
+    Documents, queries and correlation come from IncidentManagerBase, shared with
+    IncidentManager; batch jobs (imports, re-embedding, archiving, traversals) are only
+    on the synchronous manager (main.py).
+    """
+
+    async def resync_vector_index(self):
+        docs = [(doc.get("node_id"), doc) async for doc in self.graph.iter_nodes(OPEN_INCIDENTS_QUERY)]
+        self.vector_index.replace_all(docs)
+
+    async def resync_correlator(self):
+        docs = [doc async for doc in self.graph.iter_nodes(self._correlation_query(), source=CORRELATION_SOURCE)]
+        self.correlator.replace_all(self._correlation_entry(doc) for doc in docs)
+
+    async def _refresh_correlator(self):
+        if self.correlator is None or not self.correlator.needs_resync():
+            return
+        try:
+            await self.resync_correlator()
+        except Exception:
+            pass
+
+    async def _embed(self, text):
+        if not self.embedder.available():
+            return None
+        try:
+            return await self.embedder.aembed(text)
+        except Exception:
+            return None
+
+    async def create_incident(self, incident_id, title, description, priority, assigned_to=None, if_absent=False):
+        props = self._new_incident(title, description, priority, assigned_to)
+        vec = await self._embed(description) if self.embed_on_write else None
+        props.update(self._embedding_fields(vec))
+        if if_absent:
+            if not await self.graph.create_node(incident_id, props):
+                return False
+        else:
+            await self.graph.add_node(incident_id, props)
+        self._incident_created(incident_id, props)
+        return True
+
+    async def record_alert(self, incident_id, title, description, priority):
+        alert = {"incident_id": incident_id, "title": title, "description": description, "priority": priority}
+        now = datetime.utcnow().isoformat()
+        await self._refresh_correlator()
+        own, attached = self._correlate([alert])
+        if attached:
+            upserts, edges = self._attachment_writes(attached, now)
+            for target, doc, new, increments in upserts:
+                await self.graph.upsert_node(target, doc, new, increments=increments)
+                self._index_locally(target, doc)
+            for edge_id, source, target, props in edges:
+                await self.graph.add_edge(edge_id, source, target, props)
+            self._changed([target for target, _, _, _ in upserts])
+            return "correlated"
+        alert = own[0]
+        vec = await self._embed(description) if self.embed_on_write else None
+        doc, new = self._alert_upsert(alert, vec, now)
+        resp = await self.graph.upsert_node(incident_id, doc, new, increments={"fire_count": 1})
+        self._changed([incident_id])
+        if self.vector_index is not None:
+            self._index_locally(incident_id, doc if incident_id in self.vector_index else new)
+        return resp.get("result")
+
+    async def apply_alerts(self, alerts):
+        now = datetime.utcnow().isoformat()
+        await self._refresh_correlator()
+        alerts, attached = self._correlate(alerts)
+        vectors = [None] * len(alerts)
+        if alerts and self.embed_on_write and self.embedder.available():
+            try:
+                vectors = await self.embedder.aembed_many([a["description"] for a in alerts])
+            except Exception:
+                pass
+        upserts, edges = self._alert_writes(alerts, vectors, attached, now)
+        failed = []
+        async for ok, node_id, _ in self.graph.bulk_upsert_nodes(upserts):
+            if not ok:
+                failed.append(node_id)
+        if edges:
+            async for ok, edge_id, _ in self.graph.bulk_add_edges(edges):
+                if not ok:
+                    failed.append(edge_id)
+        self._alerts_written(upserts, failed)
+        return failed
+
+    async def update_incident(self, incident_id, title=None, description=None, status=None, priority=None,
+                              assigned_to=None):
+        fields = self._edit_fields(title, description, status, priority, assigned_to)
+        if "description" in fields:
+            vec = await self._embed(fields["description"]) if self.embed_on_write else None
+            fields.update(self._embedding_fields(vec))
+        if not fields:
+            return False
+        fields["updated_at"] = datetime.utcnow().isoformat()
+        await self.graph.update_node(incident_id, fields, script=self._status_script(fields))
+        self._incident_updated(incident_id, fields)
+        return True
+
+    async def link(self, source_id, target_id, relation="related_to", properties=None):
+        edge_id, props = self._edge_request(source_id, target_id, relation, properties)
+        await self.graph.add_edge(edge_id, source_id, target_id, props)
+        return edge_id
+
+    async def list_incidents(self, size=10, sort_by="updated_at", order="desc", history=False):
+        return (await self.list_incidents_page(size=size, sort_by=sort_by, order=order, history=history))[0]
+
+    async def list_incidents_page(self, size=10, sort_by="updated_at", order="desc", page_token=None, history=False):
+        query, search_after = self._list_request(sort_by, page_token)
+        incidents, cursor = await self.graph.search_page(
+            query=query, sort_field=sort_by, order=order, size=size, search_after=search_after, source=SOURCE_LIST,
+            history=history,
+        )
+        return incidents, _encode_page_token(cursor) if cursor else None
+
+    async def incident_stats(self, days=30):
+        return await self.stats_cache.aget_or_compute((self.graph.node_index, days), lambda: self._compute_stats(days))
+
+    async def _compute_stats(self, days):
+        total, aggs = await self.graph.aggregate_nodes(*self._stats_request(days), history=True)
+        return self._stats_result(total, aggs, days)
+
+    async def get_incident(self, incident_id, source=SOURCE_NO_EMBEDDING, history=True):
+        incident = await self.graph.get_node(incident_id, source=source, history=history)
+        if incident and incident.get("type") == "incident":
+            return incident
+        return None
+
+    async def incident_rows(self, incident_ids):
+        nodes = await self.graph.get_nodes(incident_ids, source=SOURCE_FEED)
+        return [doc for doc in nodes.values() if doc.get("type") == "incident"]
+
+    async def incidents_updated_since(self, since, size=200):
+        rows, _ = await self.graph.search_page(
+            query=self._updated_since_query(since), sort_field="updated_at", order="desc", size=size, source=SOURCE_FEED
+        )
+        return rows
+
+    async def search_hybrid(self, text, vector=None, k=10, offset=0, filters=None, num_candidates=None, history=False,
+                            embed=True):
+        if vector is None and embed:
+            vector = await self._embed(text)
+        return await self.graph.search_hybrid(
+            text, vector, k=k, offset=offset, filters=filters, num_candidates=num_candidates, source=SOURCE_NO_EMBEDDING,
+            history=history,
+        )
+
+    async def search_semantic(self, vector, k=10, filters=None, num_candidates=None, mode=None, history=False):
+        if self._skips_local_index(filters, mode, history):
+            return await self.graph.search_by_vector(
+                vector, k, num_candidates=num_candidates, filters=filters, mode=mode, source=SOURCE_NO_EMBEDDING,
+                history=history,
+            )
+        if self.vector_index.needs_resync():
+            try:
+                await self.resync_vector_index()
+            except Exception:
+                return await self.graph.search_by_vector(
+                    vector, k, num_candidates=num_candidates, filters=filters, source=SOURCE_NO_EMBEDDING, history=history
+                )
+        local, enough = self._local_search(vector, k, filters)
+        if enough:
+            return [doc for _, doc in local]
+        tail = await self.graph.search_by_vector(
+            vector, k, num_candidates=num_candidates, filters=filters, with_scores=True, source=SOURCE_NO_EMBEDDING,
+            history=history,
+        )
+        return self._merge_results(local, tail, k)
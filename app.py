@@ -1,17 +1,17 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
-import json
-import uuid
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, jsonify, stream_with_context
 import telemetry
 from dotenv import load_dotenv
-from elasticsearch import Elasticsearch
-import openai
+import chat
+import clients
+import correlate
+import embeddings
+import ingest
+import vector_index
 from main import ElasticsearchGraph, IncidentManager
 
 # Load environment variables
 load_dotenv()
-# Configure OpenAI API key for embeddings (for semantic search / MCP)
-openai.api_key = os.getenv("OPENAI_API_KEY")
 
 # Initialize Flask application
 app = Flask(__name__)
@@ -29,12 +29,8 @@ api_key = os.getenv("ELASTICSEARCH_API_KEY")
 if not cloud_id or not api_key:
     raise RuntimeError("Please set ELASTICSEARCH_CLOUD_ID and ELASTICSEARCH_API_KEY in .env")
 
-# Initialize Elasticsearch client (support URL or Cloud ID)
-# Initialize Elasticsearch client (support URL or Cloud ID)
-if cloud_id.startswith("http://") or cloud_id.startswith("https://"):
-    es = Elasticsearch(hosts=[cloud_id], api_key=api_key)
-else:
-    es = Elasticsearch(cloud_id=cloud_id, api_key=api_key)
+# Initialize Elasticsearch client (URL or Cloud ID; pool, timeouts and retries in clients.py)
+es = clients.elasticsearch_client(cloud_id, api_key)
 
 # Instrument Elasticsearch client with OpenTelemetry tracing
 telemetry.instrument_es()
@@ -43,7 +39,30 @@ telemetry.instrument_es()
 # Use a dedicated index for incidents (default: 'incidents')
 incident_index = os.getenv("ELASTICSEARCH_INDEX", "incidents")
 graph = ElasticsearchGraph(es, node_index=incident_index)
-manager = IncidentManager(graph)
+# Export node/embedding cache hit ratios with the other telemetry
+telemetry.register_cache("nodes", graph.node_cache)
+embedder = embeddings.get_provider()
+telemetry.register_cache("embeddings", embedder.memory)
+manager = IncidentManager(graph, embedder=embedder, vector_index=vector_index.index_from_env(),
+                          correlator=correlate.correlator_from_env())
+telemetry.register_cache("stats", manager.stats_cache)
+# Live list/detail updates over SSE. A stream holds its worker for as long as the page is open,
+# so with gunicorn sync workers they are opt-in (LIVE_UPDATES=true with --threads or gevent);
+# asgi.py serves them on the event loop and turns them on.
+manager.feed.attach(manager)
+app.config["LIVE_UPDATES"] = os.getenv("LIVE_UPDATES", "false").lower() in ("1", "true", "yes")
+telemetry.register_stats("changefeed", manager.feed.stats)
+# Coalescing background queue for alert webhooks (disable with ALERT_QUEUE_ENABLED=false)
+alert_queue = ingest.queue_from_env(manager)
+# Queue depth, embedding API calls and local index size as metrics too
+telemetry.register_stats("embeddings", embedder.stats)
+if alert_queue is not None:
+    telemetry.register_stats("alert_queue", alert_queue.stats)
+if manager.vector_index is not None:
+    telemetry.register_stats("vector_index", manager.vector_index.stats)
+if manager.correlator is not None:
+    telemetry.register_stats("alert_correlation", manager.correlator.stats)
+telemetry.register_stats("openai_circuit", lambda: clients.openai_circuit().stats())
 
 # ------------------------------------------------------------------
 # Model Context Protocol (MCP) endpoint for semantic search
@@ -59,40 +78,150 @@ def mcp_search():
         return jsonify({"error": "'query' field required"}), 400
     # choose embedding model (override via payload or env)
     model = payload.get("model") or os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+    # "hybrid" fuses keyword (BM25) and vector results; other modes are pure vector search
+    mode = payload.get("mode")
+    if mode is None and os.getenv("MCP_SEARCH_MODE", "vector") == "hybrid":
+        mode = "hybrid"
     try:
-        # Create embedding using OpenAI client: new SDK (v1.x) or legacy (v0.x)
-        if hasattr(openai, 'embeddings') and hasattr(openai.embeddings, 'create'):
-            emb_resp = openai.embeddings.create(model=model, input=query_text)
-        else:
-            emb_resp = openai.Embedding.create(model=model, input=query_text)
-        # Extract embedding vector from response (support new and legacy SDKs)
-        if hasattr(emb_resp, 'data'):
-            # new SDK: emb_resp.data is a list of objects with .embedding
-            first_item = emb_resp.data[0]
-            vector = first_item.embedding if hasattr(first_item, 'embedding') else first_item['embedding']
-        else:
-            # legacy SDK: dict-like response
-            vector = emb_resp["data"][0]["embedding"]
+        # Shared embedding provider: repeated queries are served from cache
+        vector = embedder.embed(query_text, model=model)
     except Exception as e:
         app.logger.error(f"Embedding error: {e}")
-        return jsonify({"error": "Embedding failed"}), 500
+        if mode != "hybrid":
+            return jsonify({"error": "Embedding failed"}), 500
+        # hybrid search still has its keyword leg
+        vector = None
     # number of results
     try:
         k = int(payload.get("k", 10))
     except (TypeError, ValueError):
         k = 10
+    # optional kNN tuning and pre-filters (status, priority, since, until)
+    num_candidates = payload.get("num_candidates")
+    try:
+        num_candidates = int(num_candidates) if num_candidates is not None else None
+    except (TypeError, ValueError):
+        num_candidates = None
+    filters = payload.get("filters") or {}
+    if not isinstance(filters, dict):
+        return jsonify({"error": "'filters' must be an object"}), 400
+    try:
+        offset = max(int(payload.get("offset", 0)), 0)
+    except (TypeError, ValueError):
+        offset = 0
+    # archived incidents (INCIDENT_HISTORY) are only searched on request
+    history = payload.get("history") is True
     # perform semantic search
     try:
-        hits = manager.search_semantic(vector, k=k)
+        if mode == "hybrid":
+            # embedding the query already failed when vector is None: search lexically only
+            hits = manager.search_hybrid(
+                query_text, vector, k=k, offset=offset, filters=filters, num_candidates=num_candidates, history=history,
+                embed=False,
+            )
+        else:
+            hits = manager.search_semantic(
+                vector, k=k, filters=filters, num_candidates=num_candidates, mode=mode, history=history
+            )
     except Exception as e:
         app.logger.error(f"Semantic search error: {e}")
         return jsonify({"error": "Search failed"}), 500
     return jsonify({"results": hits})
 
+@app.route("/api/embeddings/cache", methods=["GET"])
+def embedding_cache_stats():
+    """Report embedding cache hit/miss counters for this worker."""
+    return jsonify(embedder.stats())
+
+@app.route("/api/openai/circuit", methods=["GET"])
+def openai_circuit_stats():
+    """Report this worker's OpenAI circuit breaker state."""
+    return jsonify(clients.openai_circuit().stats())
+
+@app.route("/api/vector-index", methods=["GET"])
+def vector_index_stats():
+    """Report size and freshness of the local vector index for this worker."""
+    if manager.vector_index is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(manager.vector_index.stats(), enabled=True))
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Prometheus scrape endpoint, enabled with METRICS_EXPORTER=prometheus."""
+    if os.getenv("METRICS_EXPORTER", "").lower() != "prometheus":
+        return "Not found", 404
+    from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
 @app.route("/")
 def index():
-    incidents = manager.list_incidents(size=100)
-    return render_template("list_incidents.html", incidents=incidents)
+    sort = request.args.get("sort", "updated_at")
+    order = request.args.get("order", "desc")
+    if sort not in ("updated_at", "created_at") or order not in ("asc", "desc"):
+        sort, order = "updated_at", "desc"
+    try:
+        size = min(max(int(request.args.get("size", 100)), 1), 500)
+    except ValueError:
+        size = 100
+    # ?history=1 also lists incidents archived to the history indices
+    history = request.args.get("history") == "1" and manager.graph.history_index is not None
+    try:
+        incidents, next_token = manager.list_incidents_page(
+            size=size, sort_by=sort, order=order, page_token=request.args.get("page"), history=history
+        )
+    except ValueError:
+        flash("Invalid page token.", "warning")
+        return redirect(url_for("index"))
+    return render_template(
+        "list_incidents.html", incidents=incidents, next_token=next_token,
+        sort=sort, order=order, size=size, first_page=not request.args.get("page"),
+        history=history, history_enabled=manager.graph.history_index is not None,
+    )
+
+def _stats_days():
+    try:
+        return min(max(int(request.args.get("days", 30)), 1), 365)
+    except ValueError:
+        return 30
+
+@app.route("/stats")
+def stats_page():
+    """Dashboard with incident counts and time to resolve."""
+    days = _stats_days()
+    return render_template("stats.html", stats=manager.incident_stats(days=days), days=days)
+
+@app.route("/api/stats", methods=["GET"])
+def stats_api():
+    """Incident rollups as JSON; cached, so dashboards can poll it (see IncidentManager.incident_stats)."""
+    try:
+        stats = manager.incident_stats(days=_stats_days())
+    except Exception as e:
+        app.logger.error(f"Stats error: {e}")
+        return jsonify({"error": "Stats failed"}), 500
+    return jsonify(stats)
+
+@app.context_processor
+def live_updates():
+    return {"live_updates": app.config["LIVE_UPDATES"]}
+
+@app.route("/api/incidents/stream", methods=["GET"])
+def incident_stream():
+    """
+    Server-Sent Events with the rows of incidents as they change ("incidents" events, each a
+    JSON list), optionally limited to ?id=... . A reconnecting client (Last-Event-ID) first
+    gets the incidents it missed.
+    """
+    if not app.config["LIVE_UPDATES"]:
+        return jsonify({"error": "Live updates are disabled (LIVE_UPDATES)"}), 404
+    ids = request.args.getlist("id") or None
+    try:
+        initial = manager.feed.catch_up(request.headers.get("Last-Event-ID"), ids=ids)
+    except Exception as e:
+        app.logger.warning(f"Change feed catch-up failed: {e}")
+        initial = []
+    sub = manager.feed.subscribe(ids=ids)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(manager.feed.events(sub, initial=initial), mimetype="text/event-stream", headers=headers)
 
 @app.route("/incidents/new", methods=["GET", "POST"])
 def new_incident():
@@ -107,11 +236,11 @@ def new_incident():
             flash("ID, Title, and Description are required.", "danger")
             return render_template("incident_form.html", incident=request.form, form_action=url_for("new_incident"))
 
-        if manager.get_incident(incident_id):
+        # conditional create: one write, fails if the ID is taken
+        if not manager.create_incident(incident_id, title, description, priority, assigned_to, if_absent=True):
             flash(f"Incident {incident_id} already exists.", "danger")
             return render_template("incident_form.html", incident=request.form, form_action=url_for("new_incident"))
 
-        manager.create_incident(incident_id, title, description, priority, assigned_to)
         flash(f"Incident {incident_id} created.", "success")
         return redirect(url_for("view_incident", incident_id=incident_id))
 
@@ -158,34 +287,35 @@ def alerts_webhook():
     payload = request.get_json(silent=True)
     if not payload:
         return "Invalid JSON payload", 400
-    # Extract rule info or generate UUID
-    rule = payload.get("rule", {})
-    rule_id = rule.get("id") or str(uuid.uuid4())
-    incident_id = f"alert-{rule_id}"
-    title = rule.get("name", incident_id)
-    description = json.dumps(payload)
-    priority = rule.get("severity", "High")
+    # Queue the alert and acknowledge right away; the queue coalesces and bulk-writes
+    if alert_queue is not None:
+        if alert_queue.submit(payload):
+            return "", 202
+        app.logger.warning("Alert queue full; dropping alert")
+        return "Alert queue full", 503
+    alert = ingest.alert_from_payload(payload)
     try:
-        existing = manager.get_incident(incident_id)
-        if existing:
-            manager.update_incident(
-                incident_id,
-                description=description,
-                status="Triggered",
-                priority=priority,
-            )
-        else:
-            manager.create_incident(
-                incident_id,
-                title,
-                description,
-                priority,
-            )
+        # single create-or-update write; no read, safe under concurrent alerts
+        manager.record_alert(alert["incident_id"], alert["title"], alert["description"], alert["priority"])
         return "", 204
     except Exception as e:
         app.logger.error(f"Error handling alert webhook: {e}", exc_info=True)
         return "Internal error", 500
 
+@app.route("/api/alerts/queue", methods=["GET"])
+def alert_queue_stats():
+    """Report alert queue depth and merge/drop counters for this worker."""
+    if alert_queue is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(alert_queue.stats(), enabled=True))
+
+@app.route("/api/alerts/correlation", methods=["GET"])
+def alert_correlation_stats():
+    """Report near-duplicate alert correlation counters for this worker."""
+    if manager.correlator is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(manager.correlator.stats(), enabled=True))
+
 # ------------------------------------------------------------------
 # AI Chatbot endpoints
 # ------------------------------------------------------------------
@@ -196,24 +326,44 @@ def chat_page():
 
 @app.route("/api/chat", methods=["POST"])
 def chat_api():
-    """Handle AI chat requests."""
+    """
+    Handle AI chat requests, grounded in the most relevant incidents.
+    With {"stream": true} the reply is sent as Server-Sent Events: a "context" event
+    listing the incidents used, one message per token chunk ({"delta": ...}), then "done".
+    """
     payload = request.get_json(silent=True)
     if not payload or "message" not in payload:
         return jsonify({"error": "Invalid request"}), 400
     user_message = payload["message"]
+    system_prompt = os.getenv("CHAT_SYSTEM_PROMPT", "You are a helpful assistant.")
+    model = os.getenv("CHAT_MODEL", "gpt-3.5-turbo")
+    # retrieval: top-k incidents trimmed to a token budget; chat still works without it
+    try:
+        context, sources = chat.retrieve_context(manager, user_message)
+    except Exception as e:
+        app.logger.warning(f"Chat context retrieval failed: {e}")
+        context, sources = "", []
+    messages = chat.build_messages(system_prompt, user_message, context)
+    if payload.get("stream"):
+        def events():
+            yield chat.sse({"sources": sources}, event="context")
+            try:
+                for delta in chat.stream(messages, model):
+                    yield chat.sse({"delta": delta})
+            except Exception as e:
+                app.logger.error(f"Chat error: {e}")
+                yield chat.sse({"error": "Chat failed"}, event="error")
+                return
+            yield chat.sse({}, event="done")
+
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        return Response(stream_with_context(events()), mimetype="text/event-stream", headers=headers)
     try:
-        system_prompt = os.getenv("CHAT_SYSTEM_PROMPT", "You are a helpful assistant.")
-        model = os.getenv("CHAT_MODEL", "gpt-3.5-turbo")
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_message},
-        ]
-        resp = openai.ChatCompletion.create(model=model, messages=messages)
-        reply = resp.choices[0].message.content
+        reply = chat.complete(messages, model)
     except Exception as e:
         app.logger.error(f"Chat error: {e}")
         return jsonify({"error": "Chat failed"}), 500
-    return jsonify({"reply": reply})
+    return jsonify({"reply": reply, "sources": sources})
 
 if __name__ == "__main__":
     # Allow overriding host and port via environment variables
@@ -0,0 +1,356 @@
+"""
+ASGI entry point: the API endpoints (/mcp, /alerts, /api/chat) and the incident pages of
+app.py served asynchronously on AsyncElasticsearch and AsyncOpenAI, so one process handles
+many concurrent requests. Every route shares the one async manager (and its caches, local
+vector index, correlator and change feed).
+
+    uvicorn asgi:application --host 0.0.0.0 --port 8000
+"""
+import asyncio
+import os
+from quart import Quart, Response, flash, jsonify, redirect, render_template, request, url_for
+import telemetry
+from dotenv import load_dotenv
+import chat
+import clients
+import correlate
+import embeddings
+import ingest
+import vector_index
+from aio import AsyncElasticsearchGraph, AsyncIncidentManager
+
+load_dotenv()
+
+app = Quart(__name__)
+app.secret_key = os.getenv("SECRET_KEY", "devkey")
+
+cloud_id = os.getenv("ELASTICSEARCH_CLOUD_ID")
+api_key = os.getenv("ELASTICSEARCH_API_KEY")
+if not cloud_id or not api_key:
+    raise RuntimeError("Please set ELASTICSEARCH_CLOUD_ID and ELASTICSEARCH_API_KEY in .env")
+
+es = clients.async_elasticsearch_client(cloud_id, api_key)
+
+telemetry.instrument_es()
+
+incident_index = os.getenv("ELASTICSEARCH_INDEX", "incidents")
+graph = AsyncElasticsearchGraph(es, node_index=incident_index)
+telemetry.register_cache("nodes", graph.node_cache)
+embedder = embeddings.get_provider()
+telemetry.register_cache("embeddings", embedder.memory)
+manager = AsyncIncidentManager(graph, embedder=embedder, vector_index=vector_index.index_from_env(),
+                                   correlator=correlate.correlator_from_env())
+telemetry.register_stats("embeddings", embedder.stats)
+if manager.vector_index is not None:
+    telemetry.register_stats("vector_index", manager.vector_index.stats)
+if manager.correlator is not None:
+    telemetry.register_stats("alert_correlation", manager.correlator.stats)
+telemetry.register_stats("openai_circuit", lambda: clients.openai_circuit().stats())
+telemetry.register_stats("changefeed", manager.feed.stats)
+LIVE_UPDATES = os.getenv("LIVE_UPDATES", "true").lower() in ("1", "true", "yes")
+
+class _LoopBridge:
+    """Lets the thread-based AlertQueue write through the async manager on the server's event loop."""
+    def __init__(self, manager, loop):
+        self.manager = manager
+        self.loop = loop
+
+    def apply_alerts(self, alerts):
+        return asyncio.run_coroutine_threadsafe(self.manager.apply_alerts(alerts), self.loop).result()
+
+    # reads for the change feed's dispatcher thread
+    def incident_rows(self, incident_ids):
+        return asyncio.run_coroutine_threadsafe(self.manager.incident_rows(incident_ids), self.loop).result()
+
+    def incidents_updated_since(self, since):
+        return asyncio.run_coroutine_threadsafe(self.manager.incidents_updated_since(since), self.loop).result()
+
+alert_queue = None
+
+@app.before_serving
+async def startup():
+    global alert_queue
+    await graph.bootstrap()
+    bridge = _LoopBridge(manager, asyncio.get_running_loop())
+    alert_queue = ingest.queue_from_env(bridge)
+    manager.feed.attach(bridge)
+    if alert_queue is not None:
+        telemetry.register_stats("alert_queue", alert_queue.stats)
+
+@app.after_serving
+async def shutdown():
+    if alert_queue is not None:
+        # stop() waits for writes scheduled on this loop, so run it off the loop
+        await asyncio.get_running_loop().run_in_executor(None, alert_queue.stop)
+    await es.close()
+
+@app.route("/mcp", methods=["POST"])
+async def mcp_search():
+    """Perform semantic search over incidents using embeddings (MCP)."""
+    payload = await request.get_json(silent=True)
+    if not payload:
+        return jsonify({"error": "Invalid JSON payload"}), 400
+    query_text = payload.get("query") or payload.get("input")
+    if not query_text:
+        return jsonify({"error": "'query' field required"}), 400
+    model = payload.get("model") or os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+    mode = payload.get("mode")
+    if mode is None and os.getenv("MCP_SEARCH_MODE", "vector") == "hybrid":
+        mode = "hybrid"
+    try:
+        vector = await embedder.aembed(query_text, model=model)
+    except Exception as e:
+        app.logger.error(f"Embedding error: {e}")
+        if mode != "hybrid":
+            return jsonify({"error": "Embedding failed"}), 500
+        vector = None
+    try:
+        k = int(payload.get("k", 10))
+    except (TypeError, ValueError):
+        k = 10
+    num_candidates = payload.get("num_candidates")
+    try:
+        num_candidates = int(num_candidates) if num_candidates is not None else None
+    except (TypeError, ValueError):
+        num_candidates = None
+    filters = payload.get("filters") or {}
+    if not isinstance(filters, dict):
+        return jsonify({"error": "'filters' must be an object"}), 400
+    try:
+        offset = max(int(payload.get("offset", 0)), 0)
+    except (TypeError, ValueError):
+        offset = 0
+    # archived incidents (INCIDENT_HISTORY) are only searched on request
+    history = payload.get("history") is True
+    try:
+        if mode == "hybrid":
+            # embedding the query already failed when vector is None: search lexically only
+            hits = await manager.search_hybrid(
+                query_text, vector, k=k, offset=offset, filters=filters, num_candidates=num_candidates, history=history,
+                embed=False,
+            )
+        else:
+            hits = await manager.search_semantic(
+                vector, k=k, filters=filters, num_candidates=num_candidates, mode=mode, history=history
+            )
+    except Exception as e:
+        app.logger.error(f"Semantic search error: {e}")
+        return jsonify({"error": "Search failed"}), 500
+    return jsonify({"results": hits})
+
+@app.route("/api/embeddings/cache", methods=["GET"])
+async def embedding_cache_stats():
+    return jsonify(embedder.stats())
+
+@app.route("/api/openai/circuit", methods=["GET"])
+async def openai_circuit_stats():
+    return jsonify(clients.openai_circuit().stats())
+
+@app.route("/api/vector-index", methods=["GET"])
+async def vector_index_stats():
+    if manager.vector_index is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(manager.vector_index.stats(), enabled=True))
+
+@app.route("/metrics", methods=["GET"])
+async def prometheus_metrics():
+    if os.getenv("METRICS_EXPORTER", "").lower() != "prometheus":
+        return "Not found", 404
+    from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
+@app.route("/")
+async def index():
+    sort = request.args.get("sort", "updated_at")
+    order = request.args.get("order", "desc")
+    if sort not in ("updated_at", "created_at") or order not in ("asc", "desc"):
+        sort, order = "updated_at", "desc"
+    try:
+        size = min(max(int(request.args.get("size", 100)), 1), 500)
+    except ValueError:
+        size = 100
+    history = request.args.get("history") == "1" and manager.graph.history_index is not None
+    try:
+        incidents, next_token = await manager.list_incidents_page(
+            size=size, sort_by=sort, order=order, page_token=request.args.get("page"), history=history
+        )
+    except ValueError:
+        await flash("Invalid page token.", "warning")
+        return redirect(url_for("index"))
+    return await render_template(
+        "list_incidents.html", incidents=incidents, next_token=next_token,
+        sort=sort, order=order, size=size, first_page=not request.args.get("page"),
+        history=history, history_enabled=manager.graph.history_index is not None,
+    )
+
+def _stats_days():
+    try:
+        return min(max(int(request.args.get("days", 30)), 1), 365)
+    except ValueError:
+        return 30
+
+@app.route("/stats")
+async def stats_page():
+    days = _stats_days()
+    return await render_template("stats.html", stats=await manager.incident_stats(days=days), days=days)
+
+@app.route("/api/stats", methods=["GET"])
+async def stats_api():
+    try:
+        stats = await manager.incident_stats(days=_stats_days())
+    except Exception as e:
+        app.logger.error(f"Stats error: {e}")
+        return jsonify({"error": "Stats failed"}), 500
+    return jsonify(stats)
+
+@app.context_processor
+def live_updates():
+    return {"live_updates": LIVE_UPDATES}
+
+@app.route("/incidents/new", methods=["GET", "POST"])
+async def new_incident():
+    if request.method == "POST":
+        form = await request.form
+        incident_id = form.get("id", "").strip()
+        title = form.get("title", "").strip()
+        description = form.get("description", "").strip()
+        if not incident_id or not title or not description:
+            await flash("ID, Title, and Description are required.", "danger")
+            return await render_template("incident_form.html", incident=form, form_action=url_for("new_incident"))
+        created = await manager.create_incident(
+            incident_id, title, description, form.get("priority"), form.get("assigned_to") or None, if_absent=True
+        )
+        if not created:
+            await flash(f"Incident {incident_id} already exists.", "danger")
+            return await render_template("incident_form.html", incident=form, form_action=url_for("new_incident"))
+        await flash(f"Incident {incident_id} created.", "success")
+        return redirect(url_for("view_incident", incident_id=incident_id))
+    return await render_template("incident_form.html", incident={}, form_action=url_for("new_incident"))
+
+@app.route("/incidents/<incident_id>")
+async def view_incident(incident_id):
+    inc = await manager.get_incident(incident_id)
+    if not inc:
+        await flash(f"Incident {incident_id} not found.", "warning")
+        return redirect(url_for("index"))
+    return await render_template("incident_detail.html", incident=inc)
+
+@app.route("/incidents/<incident_id>/edit", methods=["GET", "POST"])
+async def edit_incident(incident_id):
+    inc = await manager.get_incident(incident_id)
+    if not inc:
+        await flash(f"Incident {incident_id} not found.", "warning")
+        return redirect(url_for("index"))
+    if request.method == "POST":
+        form = await request.form
+        await manager.update_incident(
+            incident_id,
+            title=form.get("title", "").strip(),
+            description=form.get("description", "").strip(),
+            status=form.get("status"),
+            priority=form.get("priority"),
+            assigned_to=form.get("assigned_to") or None,
+        )
+        await flash(f"Incident {incident_id} updated.", "success")
+        return redirect(url_for("view_incident", incident_id=incident_id))
+    return await render_template(
+        "incident_form.html", incident=inc, form_action=url_for("edit_incident", incident_id=incident_id)
+    )
+
+@app.route("/chat", methods=["GET"])
+async def chat_page():
+    return await render_template("chat.html")
+
+@app.route("/alerts", methods=["POST"])
+async def alerts_webhook():
+    """Receive Elastic alert webhooks and create/update incidents."""
+    payload = await request.get_json(silent=True)
+    if not payload:
+        return "Invalid JSON payload", 400
+    if alert_queue is not None:
+        if alert_queue.submit(payload):
+            return "", 202
+        app.logger.warning("Alert queue full; dropping alert")
+        return "Alert queue full", 503
+    alert = ingest.alert_from_payload(payload)
+    try:
+        await manager.record_alert(alert["incident_id"], alert["title"], alert["description"], alert["priority"])
+        return "", 204
+    except Exception as e:
+        app.logger.error(f"Error handling alert webhook: {e}", exc_info=True)
+        return "Internal error", 500
+
+@app.route("/api/alerts/queue", methods=["GET"])
+async def alert_queue_stats():
+    if alert_queue is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(alert_queue.stats(), enabled=True))
+
+@app.route("/api/alerts/correlation", methods=["GET"])
+async def alert_correlation_stats():
+    if manager.correlator is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(manager.correlator.stats(), enabled=True))
+
+@app.route("/api/chat", methods=["POST"])
+async def chat_api():
+    """Grounded AI chat; with {"stream": true} the reply is sent as Server-Sent Events."""
+    payload = await request.get_json(silent=True)
+    if not payload or "message" not in payload:
+        return jsonify({"error": "Invalid request"}), 400
+    user_message = payload["message"]
+    system_prompt = os.getenv("CHAT_SYSTEM_PROMPT", "You are a helpful assistant.")
+    model = os.getenv("CHAT_MODEL", "gpt-3.5-turbo")
+    try:
+        context, sources = await chat.aretrieve_context(manager, user_message)
+    except Exception as e:
+        app.logger.warning(f"Chat context retrieval failed: {e}")
+        context, sources = "", []
+    messages = chat.build_messages(system_prompt, user_message, context)
+    if payload.get("stream"):
+        async def events():
+            yield chat.sse({"sources": sources}, event="context")
+            try:
+                async for delta in chat.astream(messages, model):
+                    yield chat.sse({"delta": delta})
+            except Exception as e:
+                app.logger.error(f"Chat error: {e}")
+                yield chat.sse({"error": "Chat failed"}, event="error")
+                return
+            yield chat.sse({}, event="done")
+
+        headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        return Response(events(), mimetype="text/event-stream", headers=headers)
+    try:
+        reply = await chat.acomplete(messages, model)
+    except Exception as e:
+        app.logger.error(f"Chat error: {e}")
+        return jsonify({"error": "Chat failed"}), 500
+    return jsonify({"reply": reply, "sources": sources})
+
+@app.route("/api/incidents/stream", methods=["GET"])
+async def incident_stream():
+    """Live incident rows as Server-Sent Events (see app.py); one coroutine per open page."""
+    if not LIVE_UPDATES:
+        return jsonify({"error": "Live updates are disabled (LIVE_UPDATES)"}), 404
+    ids = request.args.getlist("id") or None
+    since = request.headers.get("Last-Event-ID")
+    initial = []
+    if since:
+        try:
+            rows = await manager.incidents_updated_since(since)
+            initial = [row for row in rows if ids is None or row.get("node_id") in ids]
+        except Exception as e:
+            app.logger.warning(f"Change feed catch-up failed: {e}")
+    sub = manager.feed.subscribe(ids=ids, loop=asyncio.get_running_loop())
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    response = Response(manager.feed.aevents(sub, initial=initial), mimetype="text/event-stream", headers=headers)
+    # the stream stays open while the page is; don't cut it at Quart's RESPONSE_TIMEOUT
+    response.timeout = None
+    return response
+
+application = telemetry.instrument_asgi(app)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(application, host=os.getenv("HOST", "0.0.0.0"), port=int(os.getenv("PORT", "8000")))
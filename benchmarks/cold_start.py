@@ -0,0 +1,118 @@
+"""
+Cold-start benchmark: how long a fresh process takes before it can do useful work.
+
+Every measurement runs in a new interpreter (median of --runs):
+
+  import:      time to import each application module
+  cli_help:    wall time of `python main.py --help`
+  worker_boot: time to import app.py (client, graph and manager setup) against the
+               in-memory fake cluster with --latency seconds per request, once with
+               no cached index check and once with a cached one, plus the number of
+               Elasticsearch requests made while booting
+
+    python benchmarks/cold_start.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH = os.path.dirname(os.path.abspath(__file__))
+MODULES = ("main", "clients", "embeddings", "chat", "telemetry", "vector_index", "cache")
+
+IMPORT_SNIPPET = """
+import sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+BOOT_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+sys.path[:0] = [{root!r}, {bench!r}]
+import elasticsearch, fake_es
+cluster = fake_es.FakeCluster(latency={latency})
+elasticsearch.Elasticsearch = lambda *a, **kw: fake_es.client(cluster)
+import app
+print(json.dumps({{"seconds": time.perf_counter() - start, "requests": cluster.requests,
+                  "modules": len(sys.modules), "openai_loaded": "openai" in sys.modules}}))
+"""
+
+def _run(code, env):
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True)
+    return out.stdout.strip().splitlines()[-1]
+
+def _summary(samples):
+    return {"median": round(statistics.median(samples), 4), "min": round(min(samples), 4), "max": round(max(samples), 4)}
+
+def bench_imports(runs, env):
+    report = {}
+    for module in MODULES:
+        code = IMPORT_SNIPPET.format(root=ROOT, module=module)
+        report[module] = _summary([float(_run(code, env)) for _ in range(runs)])
+    return report
+
+def bench_cli_help(runs, env):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(ROOT, "main.py"), "--help"], capture_output=True, env=env, check=True)
+        samples.append(time.perf_counter() - start)
+    return _summary(samples)
+
+def bench_worker_boot(runs, env, latency):
+    code = BOOT_SNIPPET.format(root=ROOT, bench=BENCH, latency=latency)
+    report = {}
+    for label in ("uncached", "cached"):
+        samples = []
+        result = {}
+        for _ in range(runs):
+            if label == "uncached" and os.path.exists(env["INDEX_BOOTSTRAP_CACHE"]):
+                os.remove(env["INDEX_BOOTSTRAP_CACHE"])
+            result = json.loads(_run(code, env))
+            samples.append(result["seconds"])
+        report[label] = dict(_summary(samples), es_requests=result["requests"],
+                             modules=result["modules"], openai_loaded=result["openai_loaded"])
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure process cold-start time")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per measurement (default: 5)")
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated seconds per Elasticsearch request")
+    parser.add_argument("-o", "--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    marker = os.path.join(tempfile.mkdtemp(prefix="cold-start-"), "indices.json")
+    env = dict(
+        os.environ,
+        ELASTICSEARCH_CLOUD_ID="http://fake-es:9200",
+        ELASTICSEARCH_API_KEY="benchmark",
+        INDEX_BOOTSTRAP_CACHE=marker,
+        INDEX_BOOTSTRAP="auto",
+        ALERT_QUEUE_ENABLED="false",
+    )
+    for name in ("OTEL_EXPORTER_OTLP_ENDPOINT", "OTEL_CONSOLE_EXPORTER", "LOCAL_VECTOR_INDEX"):
+        env.pop(name, None)
+
+    report = {
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "import": bench_imports(args.runs, env),
+        "cli_help": bench_cli_help(args.runs, env),
+        "worker_boot": bench_worker_boot(args.runs, env, args.latency),
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Deterministic, offline stand-in for the OpenAI embeddings API.
+
+FakeEmbeddingProvider is an embeddings.EmbeddingProvider whose API calls are
+replaced by feature hashing: every word of the text adds a fixed pseudo-random
+direction, and the sum is L2-normalized. The same text always gets the same
+vector, and texts sharing words get similar ones, so semantic search returns
+meaningful neighbors. The memory and disk caches work exactly as in production.
+
+    embedder = FakeEmbeddingProvider(dims=256, latency=0.05)
+"""
+import asyncio
+import functools
+import hashlib
+import math
+import os
+import re
+import sys
+import time
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from embeddings import EmbeddingProvider  # noqa: E402
+
+_WORD_RE = re.compile(r"\w+")
+
+
+@functools.lru_cache(maxsize=65536)
+def _direction(word, dims):
+    seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little") or 1
+    values = []
+    for _ in range(dims):
+        # xorshift stream seeded per word: cheap and stable across runs and platforms
+        seed ^= (seed << 13) & 0xFFFFFFFFFFFFFFFF
+        seed ^= seed >> 7
+        seed ^= (seed << 17) & 0xFFFFFFFFFFFFFFFF
+        values.append(((seed & 0xFFFF) / 32767.5) - 1.0)
+    return values
+
+
+def fake_vector(text, dims):
+    """Unit vector for text: sum of one hashed direction per word."""
+    vec = [0.0] * dims
+    for word in _WORD_RE.findall(str(text).lower()) or [""]:
+        for i, value in enumerate(_direction(word, dims)):
+            vec[i] += value
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return array("f", (v / norm for v in vec)).tolist()
+
+
+class FakeEmbeddingProvider(EmbeddingProvider):
+    """EmbeddingProvider that computes vectors locally; latency simulates the API round trip."""
+    def __init__(self, dims=256, latency=0.0, model="fake-embedding", maxsize=1024, disk_path=None):
+        super().__init__(model=model, maxsize=maxsize, disk_path=disk_path)
+        self.dims = dims
+        self.latency = latency
+        self.inputs_embedded = 0
+
+    def available(self):
+        return True
+
+    def _request(self, model, inputs):
+        self.api_calls += 1
+        self.inputs_embedded += len(inputs)
+        if self.latency:
+            time.sleep(self.latency)
+        return [fake_vector(text, self.dims) for text in inputs]
+
+    async def _arequest(self, model, inputs):
+        self.api_calls += 1
+        self.inputs_embedded += len(inputs)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [fake_vector(text, self.dims) for text in inputs]
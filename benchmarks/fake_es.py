@@ -0,0 +1,1074 @@
+"""
+In-memory stand-in for an Elasticsearch cluster.
+
+FakeNode plugs into the real client as a transport node class, so the
+Elasticsearch client, its helpers (bulk, scan) and our ElasticsearchGraph all
+run unmodified against a local document store:
+
+    es = fake_es.client()
+
+Only the subset of the REST API and query DSL used by this project is
+implemented: documents, bulk, mget, msearch, search with bool/term/terms/
+ids/range/exists/match/multi_match/script_score, top-level knn, sort,
+search_after, point-in-time, _source filtering, mappings, aliases,
+index templates, rollover and a few aggregations.
+"""
+import copy
+import fnmatch
+import gzip
+import itertools
+import json
+import math
+import re
+import threading
+import time
+import uuid
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import asyncio
+
+from elastic_transport import ApiResponseMeta, BaseAsyncNode, BaseNode, HttpHeaders
+from elastic_transport._node import NodeApiResponse
+from elasticsearch import AsyncElasticsearch, Elasticsearch
+
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?(Z|[+-]\d{2}:?\d{2})?$")
+_TOKEN_RE = re.compile(r"\w+")
+
+# Python implementations of the painless scripts the application sends,
+# keyed on the exact script source (see register_script).
+SCRIPTS = {}
+
+def register_script(source, fn):
+    """
+    Register fn(ctx_source, params) as the implementation of a painless script.
+    Update and reindex scripts change ctx_source in place; runtime field scripts return the value.
+    """
+    SCRIPTS[source] = fn
+
+
+class ApiError(Exception):
+    def __init__(self, status, error_type, reason):
+        super().__init__(reason)
+        self.status = status
+        self.body = {"error": {"type": error_type, "reason": reason}, "status": status}
+
+
+class FakeCluster:
+    """Holds indices, aliases, templates and point-in-time handles."""
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.indices = {}
+        self.aliases = {}
+        self.templates = {}
+        self.pits = {}
+        self.scrolls = {}
+        self.requests = 0
+        self._seq = itertools.count()
+        self.lock = threading.RLock()
+
+    # -- index management ---------------------------------------------------
+
+    def create_index(self, name, body=None):
+        if name in self.indices:
+            raise ApiError(400, "resource_already_exists_exception", f"index [{name}] already exists")
+        body = copy.deepcopy(body or {})
+        mappings = {}
+        settings = {}
+        aliases = {}
+        for template in sorted(self.templates.values(), key=lambda t: t.get("priority", 0)):
+            if any(fnmatch.fnmatch(name, p) for p in template.get("index_patterns", [])):
+                tpl = template.get("template", {})
+                _merge_mappings(mappings, tpl.get("mappings", {}))
+                settings.update(tpl.get("settings", {}))
+                aliases.update(tpl.get("aliases", {}))
+        _merge_mappings(mappings, body.get("mappings", {}))
+        settings.update(body.get("settings", {}))
+        aliases.update(body.get("aliases", {}))
+        self.indices[name] = {
+            "mappings": mappings,
+            "settings": settings,
+            "docs": {},
+            "created": time.time(),
+        }
+        for alias, spec in aliases.items():
+            self.aliases.setdefault(alias, {})[name] = spec or {}
+        return {"acknowledged": True, "index": name}
+
+    def resolve(self, target, for_write=False):
+        """Resolve an index expression (names, aliases, wildcards, commas) to concrete indices."""
+        names = []
+        for part in (target or "_all").split(","):
+            part = part.strip()
+            if part in ("_all", "*"):
+                names.extend(self.indices)
+            elif part in self.aliases:
+                members = self.aliases[part]
+                if for_write:
+                    writers = [i for i, spec in members.items() if spec.get("is_write_index")]
+                    if not writers and len(members) == 1:
+                        writers = list(members)
+                    if not writers:
+                        raise ApiError(400, "illegal_argument_exception", f"no write index is defined for alias [{part}]")
+                    names.extend(writers)
+                else:
+                    names.extend(members)
+            elif "*" in part or "?" in part:
+                names.extend(i for i in self.indices if fnmatch.fnmatch(i, part))
+            elif part in self.indices:
+                names.append(part)
+            elif for_write:
+                # auto-create on first write, like a real cluster
+                self.create_index(part)
+                names.append(part)
+            else:
+                raise ApiError(404, "index_not_found_exception", f"no such index [{part}]")
+        seen = []
+        for name in names:
+            if name not in seen:
+                seen.append(name)
+        return seen
+
+    def write_index(self, target):
+        return self.resolve(target, for_write=True)[0]
+
+    # -- documents ----------------------------------------------------------
+
+    def index_doc(self, target, doc_id, source, op_type="index", if_seq_no=None, if_primary_term=None):
+        index = self.write_index(target)
+        docs = self.indices[index]["docs"]
+        doc_id = doc_id or uuid.uuid4().hex[:20]
+        existing = docs.get(doc_id)
+        if op_type == "create" and existing is not None:
+            raise ApiError(409, "version_conflict_engine_exception", f"[{doc_id}]: version conflict, document already exists")
+        self._check_seq(existing, doc_id, if_seq_no, if_primary_term)
+        version = existing["_version"] + 1 if existing else 1
+        docs[doc_id] = {"_source": copy.deepcopy(source), "_seq_no": next(self._seq), "_primary_term": 1, "_version": version}
+        self._dynamic_map(index, source)
+        return self._write_result(index, doc_id, docs[doc_id], "updated" if existing else "created", 200 if existing else 201)
+
+    def update_doc(self, target, doc_id, body, if_seq_no=None, if_primary_term=None):
+        index = self._locate(target, doc_id)
+        docs = self.indices[index]["docs"]
+        existing = docs.get(doc_id)
+        self._check_seq(existing, doc_id, if_seq_no, if_primary_term)
+        script = body.get("script")
+        if existing is None:
+            if body.get("scripted_upsert") and script:
+                source = copy.deepcopy(body.get("upsert") or {})
+                _run_script(script, source)
+            elif "upsert" in body:
+                source = copy.deepcopy(body["upsert"])
+            elif body.get("doc_as_upsert"):
+                source = copy.deepcopy(body.get("doc") or {})
+            else:
+                raise ApiError(404, "document_missing_exception", f"[{doc_id}]: document missing")
+            return self.index_doc(index, doc_id, source, op_type="create")
+        source = copy.deepcopy(existing["_source"])
+        if script:
+            _run_script(script, source)
+        else:
+            _deep_update(source, body.get("doc") or {})
+        if source == existing["_source"] and body.get("detect_noop", True):
+            return self._write_result(index, doc_id, existing, "noop", 200)
+        existing.update({"_source": source, "_seq_no": next(self._seq), "_version": existing["_version"] + 1})
+        self._dynamic_map(index, source)
+        return self._write_result(index, doc_id, existing, "updated", 200)
+
+    def delete_doc(self, target, doc_id, if_seq_no=None, if_primary_term=None):
+        index = self._locate(target, doc_id)
+        docs = self.indices[index]["docs"]
+        if docs.get(doc_id) is None:
+            raise ApiError(404, "not_found", f"[{doc_id}]: not found")
+        self._check_seq(docs[doc_id], doc_id, if_seq_no, if_primary_term)
+        doc = docs.pop(doc_id)
+        return self._write_result(index, doc_id, doc, "deleted", 200)
+
+    def get_doc(self, target, doc_id, source_filter=None):
+        for index in self.resolve(target):
+            doc = self.indices[index]["docs"].get(doc_id)
+            if doc is not None:
+                return {
+                    "_index": index, "_id": doc_id, "found": True,
+                    "_seq_no": doc["_seq_no"], "_primary_term": doc["_primary_term"], "_version": doc["_version"],
+                    "_source": _filter_source(doc["_source"], source_filter),
+                }
+        return None
+
+    def _locate(self, target, doc_id):
+        try:
+            indices = self.resolve(target)
+        except ApiError:
+            indices = []
+        for index in indices:
+            if doc_id in self.indices[index]["docs"]:
+                return index
+        return self.write_index(target)
+
+    def _check_seq(self, existing, doc_id, if_seq_no, if_primary_term):
+        if if_seq_no is None:
+            return
+        if existing is None or existing["_seq_no"] != int(if_seq_no) or existing["_primary_term"] != int(if_primary_term or 1):
+            raise ApiError(409, "version_conflict_engine_exception", f"[{doc_id}]: version conflict")
+
+    @staticmethod
+    def _write_result(index, doc_id, doc, result, status):
+        return {
+            "_index": index, "_id": doc_id, "_version": doc["_version"], "result": result,
+            "_seq_no": doc["_seq_no"], "_primary_term": doc["_primary_term"], "status": status,
+            "_shards": {"total": 1, "successful": 1, "failed": 0},
+        }
+
+    def _dynamic_map(self, index, source):
+        props = self.indices[index]["mappings"].setdefault("properties", {})
+        for key, value in source.items():
+            if key in props or value is None:
+                continue
+            if isinstance(value, bool):
+                props[key] = {"type": "boolean"}
+            elif isinstance(value, int):
+                props[key] = {"type": "long"}
+            elif isinstance(value, float):
+                props[key] = {"type": "float"}
+            elif isinstance(value, list):
+                if value and all(isinstance(v, (int, float)) for v in value):
+                    props[key] = {"type": "float"}
+                elif value and isinstance(value[0], str):
+                    props[key] = {"type": "text", "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}}
+            elif isinstance(value, dict):
+                props[key] = {"properties": {}}
+            elif isinstance(value, str):
+                if _DATE_RE.match(value):
+                    props[key] = {"type": "date"}
+                else:
+                    props[key] = {"type": "text", "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}}
+
+    # -- search -------------------------------------------------------------
+
+    def search(self, target, body):
+        body = body or {}
+        if "pit" in body:
+            pit = self.pits.get(body["pit"]["id"])
+            if pit is None:
+                raise ApiError(404, "search_context_missing_exception", "No search context found for id")
+            indices = pit["indices"]
+        else:
+            indices = self.resolve(target)
+        query = body.get("query") or {"match_all": {}}
+        stats = _CorpusStats(self, indices)
+        scored = []
+        for index in indices:
+            for doc_id, doc in self.indices[index]["docs"].items():
+                hit = {"_index": index, "_id": doc_id, "_seq_no": doc["_seq_no"], "_primary_term": doc["_primary_term"]}
+                ok, score = _eval(query, doc_id, doc["_source"], self.indices[index], stats)
+                if ok:
+                    scored.append((score, hit, doc["_source"]))
+        if "knn" in body:
+            scored = self._apply_knn(body["knn"], indices, scored, "query" in body)
+        total = len(scored)
+        aggs = body.get("aggs") or body.get("aggregations")
+        sort = _normalize_sort(body.get("sort"))
+        if sort:
+            scored.sort(key=lambda t: _sort_key(t, sort))
+        else:
+            scored.sort(key=lambda t: -t[0])
+        if "search_after" in body and sort:
+            after = [_Reverse(_comparable(v)) if order == "desc" else _comparable(v)
+                     for v, (_, order) in zip(body["search_after"], sort)]
+            scored = [t for t in scored if _sort_key(t, sort)[: len(after)] > after]
+        start = int(body.get("from", 0))
+        size = int(body.get("size", 10))
+        page = scored[start:start + size]
+        hits = []
+        for score, hit, source in page:
+            hit = dict(hit)
+            hit["_score"] = score
+            hit["_source"] = _filter_source(source, body.get("_source"))
+            if sort:
+                hit["sort"] = [_raw_sort_value(hit, source, score, field) for field, _ in sort]
+            if body.get("seq_no_primary_term") is not True:
+                hit.pop("_seq_no", None)
+                hit.pop("_primary_term", None)
+            hits.append(hit)
+        resp = {
+            "took": 1, "timed_out": False,
+            "hits": {"total": {"value": total, "relation": "eq"}, "max_score": max((h["_score"] for h in hits), default=None), "hits": hits},
+        }
+        if aggs:
+            sources = [_with_runtime_fields(t[2], body.get("runtime_mappings")) for t in scored]
+            resp["aggregations"] = _aggregate(aggs, sources)
+        if "pit" in body:
+            resp["pit_id"] = body["pit"]["id"]
+        return resp
+
+    def _apply_knn(self, knn, indices, scored, has_query):
+        specs = knn if isinstance(knn, list) else [knn]
+        by_key = {(h["_index"], h["_id"]): (s, h, src) for s, h, src in scored}
+        combined = {}
+        for spec in specs:
+            field = spec["field"]
+            qv = spec["query_vector"]
+            filters = spec.get("filter")
+            candidates = []
+            for index in indices:
+                spec_field = self.indices[index]["mappings"].get("properties", {}).get(field) or {}
+                if spec_field.get("type") == "dense_vector" and spec_field.get("index") is False:
+                    raise ApiError(400, "illegal_argument_exception",
+                                   f"[knn] queries are only supported on indexed [dense_vector] fields, not [{field}]")
+                for doc_id, doc in self.indices[index]["docs"].items():
+                    vec = _get_field(doc["_source"], field)
+                    if not vec:
+                        continue
+                    if filters:
+                        clauses = filters if isinstance(filters, list) else [filters]
+                        if not all(_eval(c, doc_id, doc["_source"], self.indices[index], None)[0] for c in clauses):
+                            continue
+                    sim = (1.0 + _cosine(qv, vec)) / 2.0
+                    hit = {"_index": index, "_id": doc_id, "_seq_no": doc["_seq_no"], "_primary_term": doc["_primary_term"]}
+                    candidates.append((sim * float(spec.get("boost", 1.0)), hit, doc["_source"]))
+            candidates.sort(key=lambda t: -t[0])
+            for sim, hit, src in candidates[:int(spec.get("k", 10))]:
+                key = (hit["_index"], hit["_id"])
+                prev = combined.get(key)
+                combined[key] = (sim + (prev[0] if prev else 0.0), hit, src)
+        if has_query:
+            # hybrid: union of query hits and knn hits, scores summed
+            for key, (s, h, src) in by_key.items():
+                prev = combined.get(key)
+                combined[key] = (s + (prev[0] if prev else 0.0), h, src)
+        return list(combined.values())
+
+    def open_pit(self, target):
+        pit_id = uuid.uuid4().hex
+        self.pits[pit_id] = {"indices": self.resolve(target)}
+        return {"id": pit_id}
+
+    def close_pit(self, pit_id):
+        return {"succeeded": self.pits.pop(pit_id, None) is not None, "num_freed": 1}
+
+    # -- aliases / templates / rollover ---------------------------------------
+
+    def update_aliases(self, actions):
+        for action in actions:
+            (op, spec), = action.items()
+            indices = spec.get("indices") or [spec.get("index")]
+            alias = spec.get("alias")
+            for index in indices:
+                for name in self.resolve(index):
+                    if op == "add":
+                        extra = {k: v for k, v in spec.items() if k in ("is_write_index", "filter")}
+                        self.aliases.setdefault(alias, {})[name] = extra
+                    elif op == "remove":
+                        self.aliases.get(alias, {}).pop(name, None)
+                        if alias in self.aliases and not self.aliases[alias]:
+                            del self.aliases[alias]
+                    elif op == "remove_index":
+                        self.delete_index(name)
+        return {"acknowledged": True}
+
+    def delete_index(self, name):
+        for index in self.resolve(name):
+            self.indices.pop(index, None)
+            for alias in list(self.aliases):
+                self.aliases[alias].pop(index, None)
+                if not self.aliases[alias]:
+                    del self.aliases[alias]
+        return {"acknowledged": True}
+
+    def rollover(self, alias, body):
+        members = self.aliases.get(alias)
+        if not members:
+            raise ApiError(400, "illegal_argument_exception", f"alias [{alias}] does not exist")
+        current = self.write_index(alias)
+        conditions = (body or {}).get("conditions") or {}
+        info = self.indices[current]
+        age = time.time() - info["created"]
+        met = {}
+        if "max_docs" in conditions:
+            met[f"[max_docs: {conditions['max_docs']}]"] = len(info["docs"]) >= int(conditions["max_docs"])
+        if "max_age" in conditions:
+            met[f"[max_age: {conditions['max_age']}]"] = age >= _parse_duration(conditions["max_age"])
+        if "max_size" in conditions or "max_primary_shard_size" in conditions:
+            limit = conditions.get("max_size") or conditions.get("max_primary_shard_size")
+            size = len(json.dumps([d["_source"] for d in info["docs"].values()]))
+            met[f"[max_size: {limit}]"] = size >= _parse_size(limit)
+        rolled = not conditions or any(met.values())
+        match = re.match(r"^(.*?)(\d+)$", current)
+        new_index = f"{match.group(1)}{int(match.group(2)) + 1:0{len(match.group(2))}d}" if match else f"{current}-000002"
+        if rolled:
+            self.create_index(new_index)
+            members[current] = {"is_write_index": False}
+            members[new_index] = {"is_write_index": True}
+        return {"acknowledged": rolled, "old_index": current, "new_index": new_index,
+                "rolled_over": rolled, "dry_run": False, "conditions": met}
+
+
+class _CorpusStats:
+    """Document frequencies for a crude BM25 used by match queries."""
+    def __init__(self, cluster, indices):
+        self.cluster = cluster
+        self.indices = indices
+        self._df = {}
+        self._n = sum(len(cluster.indices[i]["docs"]) for i in indices)
+
+    def idf(self, field, token):
+        key = (field, token)
+        if key not in self._df:
+            df = 0
+            for index in self.indices:
+                for doc in self.cluster.indices[index]["docs"].values():
+                    if token in _tokens(_get_field(doc["_source"], field)):
+                        df += 1
+            self._df[key] = df
+        df = self._df[key]
+        return math.log(1 + (self._n - df + 0.5) / (df + 0.5))
+
+
+# -- query evaluation ---------------------------------------------------------
+
+def _tokens(value):
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [t for v in value for t in _tokens(v)]
+    return _TOKEN_RE.findall(str(value).lower())
+
+def _get_field(source, field):
+    if field.endswith(".keyword"):
+        field = field[: -len(".keyword")]
+    value = source
+    for part in field.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return source.get(field) if isinstance(source, dict) else None
+        value = value[part]
+    return value
+
+def _field_type(index_info, field):
+    if index_info is None:
+        return None
+    if field.endswith(".keyword"):
+        return "keyword"
+    props = index_info["mappings"].get("properties", {})
+    spec = props.get(field) or {}
+    return spec.get("type")
+
+def _values(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+def _term_match(source, field, term, index_info):
+    actual = _get_field(source, field)
+    if isinstance(term, dict):
+        term = term.get("value")
+    if _field_type(index_info, field) == "text":
+        return str(term).lower() in _tokens(actual)
+    return any(v == term or str(v) == str(term) for v in _values(actual))
+
+def _comparable(value):
+    if value is None:
+        return (0, "")
+    if isinstance(value, bool):
+        return (1, int(value))
+    if isinstance(value, (int, float)):
+        return (1, value)
+    return (2, str(value))
+
+def _range_match(source, field, spec):
+    actual = _values(_get_field(source, field))
+    if not actual:
+        return False
+    for v in actual:
+        ok = True
+        for op, bound in spec.items():
+            if op not in ("gt", "gte", "lt", "lte"):
+                continue
+            if isinstance(bound, str) and bound.startswith("now"):
+                bound = _resolve_now(bound)
+            a, b = _comparable(v), _comparable(bound)
+            if (op == "gt" and not a > b) or (op == "gte" and not a >= b) or (op == "lt" and not a < b) or (op == "lte" and not a <= b):
+                ok = False
+        if ok:
+            return True
+    return False
+
+def _resolve_now(expr):
+    from datetime import datetime, timedelta
+    now = datetime.utcnow()
+    match = re.match(r"^now(?:-(\d+)([smhdw]))?", expr)
+    if match and match.group(1):
+        unit = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days", "w": "weeks"}[match.group(2)]
+        now -= timedelta(**{unit: int(match.group(1))})
+    return now.isoformat()
+
+def _match_score(source, fields, text, stats, operator="or"):
+    tokens = _tokens(text)
+    if not tokens:
+        return False, 0.0
+    best = 0.0
+    matched_any = False
+    for field in fields:
+        boost = 1.0
+        if "^" in field:
+            field, boost = field.split("^", 1)
+            boost = float(boost)
+        doc_tokens = _tokens(_get_field(source, field))
+        if not doc_tokens:
+            continue
+        hits = [t for t in tokens if t in doc_tokens]
+        if operator == "and" and len(set(hits)) < len(set(tokens)):
+            continue
+        if not hits:
+            continue
+        matched_any = True
+        score = 0.0
+        for token in set(hits):
+            tf = doc_tokens.count(token)
+            idf = stats.idf(field, token) if stats else 1.0
+            score += idf * (tf * 2.2) / (tf + 1.2 * (0.25 + 0.75 * len(doc_tokens) / 20.0))
+        best = max(best, score * boost)
+    return matched_any, best
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    na = math.sqrt(sum(x * x for x in a))
+    nb = math.sqrt(sum(y * y for y in b))
+    if not na or not nb:
+        return 0.0
+    return dot / (na * nb)
+
+def _eval(query, doc_id, source, index_info, stats):
+    """Return (matches, score) for a query clause against one document."""
+    (kind, spec), = query.items()
+    if kind == "match_all":
+        return True, 1.0
+    if kind == "match_none":
+        return False, 0.0
+    if kind == "term":
+        (field, term), = spec.items()
+        return _term_match(source, field, term, index_info), 1.0
+    if kind == "terms":
+        spec = {k: v for k, v in spec.items() if k != "boost"}
+        (field, terms), = spec.items()
+        return any(_term_match(source, field, t, index_info) for t in terms), 1.0
+    if kind == "ids":
+        return doc_id in spec.get("values", []), 1.0
+    if kind == "exists":
+        value = _get_field(source, spec["field"])
+        return value is not None and value != [], 1.0
+    if kind == "range":
+        (field, bounds), = spec.items()
+        return _range_match(source, field, bounds), 1.0
+    if kind == "prefix":
+        (field, prefix), = spec.items()
+        prefix = prefix.get("value") if isinstance(prefix, dict) else prefix
+        return any(str(v).startswith(prefix) for v in _values(_get_field(source, field))), 1.0
+    if kind == "match":
+        (field, text), = spec.items()
+        operator = "or"
+        if isinstance(text, dict):
+            operator = text.get("operator", "or")
+            text = text.get("query")
+        return _match_score(source, [field], text, stats, operator)
+    if kind == "multi_match":
+        return _match_score(source, spec.get("fields", ["*"]), spec.get("query"), stats, spec.get("operator", "or"))
+    if kind == "bool":
+        score = 0.0
+        for clause in _values(spec.get("must")):
+            ok, s = _eval(clause, doc_id, source, index_info, stats)
+            if not ok:
+                return False, 0.0
+            score += s
+        for clause in _values(spec.get("filter")):
+            if not _eval(clause, doc_id, source, index_info, stats)[0]:
+                return False, 0.0
+        for clause in _values(spec.get("must_not")):
+            if _eval(clause, doc_id, source, index_info, stats)[0]:
+                return False, 0.0
+        should = _values(spec.get("should"))
+        matched = 0
+        for clause in should:
+            ok, s = _eval(clause, doc_id, source, index_info, stats)
+            if ok:
+                matched += 1
+                score += s
+        required = spec.get("minimum_should_match")
+        if required is None:
+            required = 1 if should and not spec.get("must") and not spec.get("filter") else 0
+        if matched < int(required):
+            return False, 0.0
+        return True, score or 1.0
+    if kind == "constant_score":
+        ok, _ = _eval(spec["filter"], doc_id, source, index_info, stats)
+        return ok, float(spec.get("boost", 1.0))
+    if kind == "script_score":
+        ok, _ = _eval(spec["query"], doc_id, source, index_info, stats)
+        if not ok:
+            return False, 0.0
+        script = spec["script"]
+        match = re.search(r"cosineSimilarity\(params\.(\w+),\s*'(\w+)'\)", script["source"])
+        if not match:
+            raise ApiError(400, "script_exception", "unsupported script")
+        vec = _get_field(source, match.group(2))
+        if not vec:
+            return False, 0.0
+        return True, _cosine(script["params"][match.group(1)], vec) + 1.0
+    raise ApiError(400, "parsing_exception", f"unknown query [{kind}]")
+
+
+# -- sorting / source filtering / aggregations ----------------------------------
+
+def _normalize_sort(sort):
+    if not sort:
+        return []
+    result = []
+    for item in _values(sort):
+        if isinstance(item, str):
+            result.append((item, "desc" if item == "_score" else "asc"))
+        else:
+            (field, spec), = item.items()
+            order = spec.get("order", "asc") if isinstance(spec, dict) else spec
+            result.append((field, order))
+    return result
+
+def _raw_sort_value(hit, source, score, field):
+    if field == "_score":
+        return score
+    if field in ("_shard_doc", "_doc"):
+        return hit["_seq_no"]
+    if field == "_id":
+        return hit["_id"]
+    value = _get_field(source, field)
+    if isinstance(value, list):
+        value = value[0] if value else None
+    return value
+
+class _Reverse:
+    def __init__(self, value):
+        self.value = value
+    def __lt__(self, other):
+        return self.value > other.value
+    def __gt__(self, other):
+        return self.value < other.value
+    def __eq__(self, other):
+        return self.value == other.value
+
+def _sort_key(item, sort):
+    score, hit, source = item
+    key = []
+    for field, order in sort:
+        value = _comparable(_raw_sort_value(hit, source, score, field))
+        key.append(_Reverse(value) if order == "desc" else value)
+    return key
+
+def _filter_source(source, spec):
+    if spec is None or spec is True:
+        return copy.deepcopy(source)
+    if spec is False:
+        return None
+    if isinstance(spec, str):
+        spec = {"includes": [spec]}
+    elif isinstance(spec, list):
+        spec = {"includes": spec}
+    includes = _values(spec.get("includes") or spec.get("include"))
+    excludes = _values(spec.get("excludes") or spec.get("exclude"))
+    result = {}
+    for key, value in source.items():
+        if includes and not any(fnmatch.fnmatch(key, p) for p in includes):
+            continue
+        if any(fnmatch.fnmatch(key, p) for p in excludes):
+            continue
+        result[key] = copy.deepcopy(value)
+    return result
+
+def _aggregate(aggs, sources):
+    result = {}
+    for name, spec in aggs.items():
+        sub = spec.get("aggs") or spec.get("aggregations")
+        if "terms" in spec:
+            field = spec["terms"]["field"]
+            counts = {}
+            missing = spec["terms"].get("missing")
+            for src in sources:
+                values = _values(_get_field(src, field))
+                if not values and missing is not None:
+                    values = [missing]
+                for v in values:
+                    counts.setdefault(v, []).append(src)
+            buckets = sorted(counts.items(), key=lambda kv: (-len(kv[1]), str(kv[0])))[: int(spec["terms"].get("size", 10))]
+            result[name] = {"buckets": [
+                dict({"key": k, "doc_count": len(v)}, **(_aggregate(sub, v) if sub else {})) for k, v in buckets
+            ]}
+        elif "date_histogram" in spec:
+            field = spec["date_histogram"]["field"]
+            interval = spec["date_histogram"].get("calendar_interval") or spec["date_histogram"].get("fixed_interval", "1d")
+            width = {"minute": 16, "1m": 16, "hour": 13, "1h": 13, "day": 10, "1d": 10, "month": 7, "1M": 7}.get(interval, 10)
+            counts = {}
+            for src in sources:
+                value = _get_field(src, field)
+                if value:
+                    counts.setdefault(str(value)[:width], []).append(src)
+            result[name] = {"buckets": [
+                dict({"key_as_string": k, "doc_count": len(v)}, **(_aggregate(sub, v) if sub else {}))
+                for k, v in sorted(counts.items())
+            ]}
+        elif "filter" in spec:
+            matched = [s for s in sources if _eval(spec["filter"], None, s, None, None)[0]]
+            result[name] = dict({"doc_count": len(matched)}, **(_aggregate(sub, matched) if sub else {}))
+        elif "percentiles" in spec:
+            values = sorted(v for s in sources for v in _values(_get_field(s, spec["percentiles"]["field"])) if isinstance(v, (int, float)))
+            percents = spec["percentiles"].get("percents", [50.0, 95.0, 99.0])
+            result[name] = {"values": {str(float(p)): _percentile(values, p) for p in percents}}
+        elif "avg" in spec:
+            values = [v for s in sources for v in _values(_get_field(s, spec["avg"]["field"])) if isinstance(v, (int, float))]
+            result[name] = {"value": sum(values) / len(values) if values else None}
+        elif "value_count" in spec:
+            result[name] = {"value": sum(len(_values(_get_field(s, spec["value_count"]["field"]))) for s in sources)}
+        else:
+            raise ApiError(400, "parsing_exception", f"unsupported aggregation [{name}]")
+    return result
+
+def _percentile(values, percent):
+    if not values:
+        return None
+    rank = (len(values) - 1) * float(percent) / 100.0
+    low = int(math.floor(rank))
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+# -- helpers -----------------------------------------------------------------
+
+def _merge_mappings(target, source):
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge_mappings(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+
+def _deep_update(target, doc):
+    for key, value in doc.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _deep_update(target[key], value)
+        else:
+            target[key] = copy.deepcopy(value)
+
+def _with_runtime_fields(source, runtime_mappings):
+    """Source plus the runtime fields (their scripts return the value; only aggregations see them)."""
+    if not runtime_mappings:
+        return source
+    source = dict(source)
+    for name, spec in runtime_mappings.items():
+        script = spec.get("script") or {}
+        if isinstance(script, str):
+            script = {"source": script}
+        fn = SCRIPTS.get(script.get("source"))
+        if fn is None:
+            raise ApiError(400, "script_exception", "script not registered with the fake cluster")
+        value = fn(source, script.get("params") or {})
+        if value is not None:
+            source[name] = value
+    return source
+
+def _run_script(script, source):
+    if isinstance(script, str):
+        script = {"source": script}
+    fn = SCRIPTS.get(script.get("source"))
+    if fn is None:
+        raise ApiError(400, "script_exception", "script not registered with the fake cluster")
+    fn(source, script.get("params") or {})
+
+def _parse_duration(value):
+    match = re.match(r"^(\d+)([smhd])$", str(value))
+    if not match:
+        return float("inf")
+    return int(match.group(1)) * {"s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+
+def _parse_size(value):
+    match = re.match(r"^(\d+)(b|kb|mb|gb)$", str(value).lower())
+    if not match:
+        return float("inf")
+    return int(match.group(1)) * {"b": 1, "kb": 1024, "mb": 1024 ** 2, "gb": 1024 ** 3}[match.group(2)]
+
+
+# -- transport node --------------------------------------------------------------
+
+class FakeNode(BaseNode):
+    """elastic_transport node that answers requests from a FakeCluster."""
+    cluster = None
+
+    def perform_request(self, method, target, body=None, headers=None, request_timeout=None):
+        return self._respond(method, target, body, headers, time.sleep)
+
+    def _respond(self, method, target, body, headers, sleep):
+        cluster = self.cluster
+        url = urlsplit(target)
+        path = [unquote(p) for p in url.path.split("/") if p]
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if body and headers and headers.get("content-encoding") == "gzip":
+            body = gzip.decompress(body)
+        with cluster.lock:
+            cluster.requests += 1
+            try:
+                status, payload = _dispatch(cluster, method, path, params, body)
+            except ApiError as exc:
+                status, payload = exc.status, exc.body
+        if cluster.latency:
+            sleep(cluster.latency)
+        meta = ApiResponseMeta(
+            status=status,
+            http_version="1.1",
+            headers=HttpHeaders({"content-type": "application/json", "x-elastic-product": "Elasticsearch"}),
+            duration=0.0,
+            node=self.config,
+        )
+        data = b"" if method == "HEAD" else json.dumps(payload).encode("utf-8")
+        return NodeApiResponse(meta, data)
+
+
+class FakeAsyncNode(BaseAsyncNode, FakeNode):
+    """Async variant: latency is awaited, so concurrent requests overlap like real I/O."""
+
+    async def perform_request(self, method, target, body=None, headers=None, request_timeout=None):
+        delays = []
+        response = self._respond(method, target, body, headers, delays.append)
+        for delay in delays:
+            await asyncio.sleep(delay)
+        return response
+
+    async def close(self):
+        pass
+
+
+def _json(body):
+    if not body:
+        return {}
+    return json.loads(body)
+
+def _ndjson(body):
+    return [json.loads(line) for line in body.decode("utf-8").splitlines() if line.strip()]
+
+def _dispatch(cluster, method, path, params, body):
+    if not path:
+        return 200, {"name": "fake", "cluster_name": "fake", "version": {"number": "8.15.0", "build_flavor": "default"}, "tagline": "You Know, for Search"}
+    head = path[0]
+    if head == "_bulk" or (len(path) == 2 and path[1] == "_bulk"):
+        return 200, _bulk(cluster, path[0] if len(path) == 2 else None, _ndjson(body))
+    if head == "_mget" or (len(path) == 2 and path[1] == "_mget"):
+        req = _json(body)
+        default_index = path[0] if len(path) == 2 else None
+        docs = req.get("docs") or [{"_id": i} for i in req.get("ids", [])]
+        out = []
+        for spec in docs:
+            index = spec.get("_index") or default_index
+            try:
+                got = cluster.get_doc(index, spec["_id"], spec.get("_source", _source_param(params)))
+            except ApiError:
+                got = None
+            out.append(got or {"_index": index, "_id": spec["_id"], "found": False})
+        return 200, {"docs": out}
+    if head == "_msearch" or (len(path) == 2 and path[1] == "_msearch"):
+        lines = _ndjson(body)
+        default_index = path[0] if len(path) == 2 else None
+        responses = []
+        for header, search_body in zip(lines[0::2], lines[1::2]):
+            try:
+                resp = cluster.search(header.get("index", default_index), search_body)
+                resp["status"] = 200
+            except ApiError as exc:
+                resp = dict(exc.body)
+            responses.append(resp)
+        return 200, {"took": 1, "responses": responses}
+    if head == "_search" and len(path) > 1 and path[1] == "scroll":
+        if method == "DELETE":
+            for scroll_id in _values(_json(body).get("scroll_id")):
+                cluster.scrolls.pop(scroll_id, None)
+            return 200, {"succeeded": True, "num_freed": 1}
+        return 200, _next_scroll_page(cluster, _json(body).get("scroll_id") or params.get("scroll_id"))
+    if head == "_search":
+        return 200, cluster.search(None, _json(body))
+    if head == "_reindex":
+        req = _json(body)
+        dest = req["dest"]["index"]
+        count = 0
+        for index in cluster.resolve(req["source"]["index"]):
+            for doc_id, doc in list(cluster.indices[index]["docs"].items()):
+                source = copy.deepcopy(doc["_source"])
+                if req.get("script"):
+                    _run_script(req["script"], source)
+                cluster.index_doc(dest, doc_id, source)
+                count += 1
+        return 200, {"took": 1, "total": count, "created": count, "updated": 0, "failures": []}
+    if head == "_pit" and method == "DELETE":
+        return 200, cluster.close_pit(_json(body).get("id"))
+    if head == "_aliases":
+        return 200, cluster.update_aliases(_json(body).get("actions", []))
+    if head == "_alias":
+        name = path[1] if len(path) > 1 else None
+        return _get_aliases(cluster, None, name)
+    if head == "_index_template":
+        name = path[1]
+        if method == "PUT":
+            cluster.templates[name] = _json(body)
+            return 200, {"acknowledged": True}
+        if name not in cluster.templates:
+            return 404, {"error": {"type": "resource_not_found_exception"}, "status": 404}
+        return 200, {"index_templates": [{"name": name, "index_template": cluster.templates[name]}]}
+    index = head
+    if len(path) == 1:
+        if method == "HEAD":
+            try:
+                return (200 if cluster.resolve(index) else 404), {}
+            except ApiError:
+                return 404, {}
+        if method == "PUT":
+            return 200, cluster.create_index(index, _json(body))
+        if method == "DELETE":
+            cluster.resolve(index)
+            return 200, cluster.delete_index(index)
+        if method == "GET":
+            return 200, {name: {"mappings": cluster.indices[name]["mappings"], "settings": {"index": cluster.indices[name]["settings"]},
+                                "aliases": {a: s for a, m in cluster.aliases.items() for n, s in m.items() if n == name}}
+                         for name in cluster.resolve(index)}
+    op = path[1]
+    if op == "_doc" or op == "_create":
+        doc_id = path[2] if len(path) > 2 else None
+        if method == "GET":
+            got = cluster.get_doc(index, doc_id, _source_param(params))
+            if got is None:
+                return 404, {"_index": index, "_id": doc_id, "found": False}
+            return 200, got
+        if method == "HEAD":
+            return (200 if cluster.get_doc(index, doc_id) else 404), {}
+        if method == "DELETE":
+            return 200, cluster.delete_doc(index, doc_id, if_seq_no=params.get("if_seq_no"),
+                                           if_primary_term=params.get("if_primary_term"))
+        op_type = "create" if op == "_create" or params.get("op_type") == "create" else "index"
+        result = cluster.index_doc(index, doc_id, _json(body), op_type=op_type,
+                                   if_seq_no=params.get("if_seq_no"), if_primary_term=params.get("if_primary_term"))
+        return result.pop("status"), result
+    if op == "_update":
+        result = cluster.update_doc(index, path[2], _json(body),
+                                    if_seq_no=params.get("if_seq_no"), if_primary_term=params.get("if_primary_term"))
+        result.pop("status")
+        return 200, result
+    if op == "_search":
+        if "scroll" in params:
+            return 200, _open_scroll(cluster, index, _json(body))
+        return 200, cluster.search(index, _json(body))
+    if op == "_count":
+        resp = cluster.search(index, {"query": _json(body).get("query"), "size": 0})
+        return 200, {"count": resp["hits"]["total"]["value"]}
+    if op == "_pit":
+        return 200, cluster.open_pit(index)
+    if op == "_refresh":
+        return 200, {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+    if op == "_mapping":
+        names = cluster.resolve(index)
+        if method == "GET":
+            return 200, {name: {"mappings": cluster.indices[name]["mappings"]} for name in names}
+        for name in names:
+            _merge_mappings(cluster.indices[name]["mappings"], _json(body))
+        return 200, {"acknowledged": True}
+    if op == "_settings":
+        names = cluster.resolve(index)
+        if method == "GET":
+            return 200, {name: {"settings": {"index": cluster.indices[name]["settings"]}} for name in names}
+        for name in names:
+            cluster.indices[name]["settings"].update(_json(body).get("index", _json(body)))
+        return 200, {"acknowledged": True}
+    if op == "_alias":
+        name = path[2] if len(path) > 2 else None
+        if method == "PUT":
+            return 200, cluster.update_aliases([{"add": {"index": index, "alias": name, **_json(body)}}])
+        if method == "DELETE":
+            return 200, cluster.update_aliases([{"remove": {"index": index, "alias": name}}])
+        return _get_aliases(cluster, index, name)
+    if op == "_rollover":
+        return 200, cluster.rollover(index, _json(body))
+    if op == "_stats":
+        names = cluster.resolve(index)
+        return 200, {"indices": {n: {"primaries": {"docs": {"count": len(cluster.indices[n]["docs"])},
+                                                   "store": {"size_in_bytes": len(json.dumps([d["_source"] for d in cluster.indices[n]["docs"].values()]))}}}
+                                 for n in names}}
+    raise ApiError(400, "unsupported_operation", f"fake cluster does not support {method} /{'/'.join(path)}")
+
+def _open_scroll(cluster, index, body):
+    page_size = int(body.get("size", 10))
+    everything = cluster.search(index, dict(body, size=10 ** 9, **{"from": 0}))
+    scroll_id = uuid.uuid4().hex
+    cluster.scrolls[scroll_id] = {"hits": everything["hits"]["hits"], "size": page_size, "total": everything["hits"]["total"]}
+    return _next_scroll_page(cluster, scroll_id)
+
+def _next_scroll_page(cluster, scroll_id):
+    state = cluster.scrolls.get(scroll_id)
+    if state is None:
+        raise ApiError(404, "search_context_missing_exception", "No search context found for id")
+    page, state["hits"] = state["hits"][: state["size"]], state["hits"][state["size"]:]
+    return {"_scroll_id": scroll_id, "took": 1, "timed_out": False,
+            "_shards": {"total": 1, "successful": 1, "skipped": 0, "failed": 0},
+            "hits": {"total": state["total"], "hits": page}}
+
+def _source_param(params):
+    if "_source_includes" in params or "_source_excludes" in params:
+        return {"includes": params.get("_source_includes", "").split(",") if params.get("_source_includes") else [],
+                "excludes": params.get("_source_excludes", "").split(",") if params.get("_source_excludes") else []}
+    if "_source" in params:
+        value = params["_source"]
+        if value in ("true", "false"):
+            return value == "true"
+        return value.split(",")
+    return None
+
+def _get_aliases(cluster, index, name):
+    indices = cluster.resolve(index) if index else list(cluster.indices)
+    result = {}
+    for alias, members in cluster.aliases.items():
+        if name and not fnmatch.fnmatch(alias, name):
+            continue
+        for member, spec in members.items():
+            if member in indices:
+                result.setdefault(member, {"aliases": {}})["aliases"][alias] = spec
+    if name and not result:
+        return 404, {"error": f"alias [{name}] missing", "status": 404}
+    return 200, result
+
+def _bulk(cluster, default_index, lines):
+    items = []
+    errors = False
+    i = 0
+    while i < len(lines):
+        (op, meta), = lines[i].items()
+        index = meta.get("_index") or default_index
+        doc_id = meta.get("_id")
+        source = None
+        if op != "delete":
+            i += 1
+            source = lines[i]
+        i += 1
+        try:
+            if op in ("index", "create"):
+                result = cluster.index_doc(index, doc_id, source, op_type=op,
+                                           if_seq_no=meta.get("if_seq_no"), if_primary_term=meta.get("if_primary_term"))
+            elif op == "update":
+                result = cluster.update_doc(index, doc_id, source)
+                result["status"] = result.get("status", 200)
+            else:
+                result = cluster.delete_doc(index, doc_id, if_seq_no=meta.get("if_seq_no"),
+                                            if_primary_term=meta.get("if_primary_term"))
+        except ApiError as exc:
+            errors = True
+            result = {"_index": index, "_id": doc_id, "status": exc.status, "error": exc.body["error"]}
+        items.append({op: result})
+    return {"took": 1, "errors": errors, "items": items}
+
+
+def client(cluster=None, **kwargs):
+    """Return a real Elasticsearch client whose transport is an in-memory FakeCluster."""
+    node_class = type("BoundFakeNode", (FakeNode,), {"cluster": cluster or FakeCluster()})
+    return Elasticsearch(hosts=["http://fake-es:9200"], node_class=node_class, **kwargs)
+
+
+def async_client(cluster=None, **kwargs):
+    """Return a real AsyncElasticsearch client backed by a FakeCluster."""
+    node_class = type("BoundFakeAsyncNode", (FakeAsyncNode,), {"cluster": cluster or FakeCluster()})
+    return AsyncElasticsearch(hosts=["http://fake-es:9200"], node_class=node_class, **kwargs)
@@ -0,0 +1,327 @@
+"""
+Offline benchmark harness.
+
+Drives IncidentManager and the Flask routes against the in-memory Elasticsearch
+stand-in (fake_es.py) and the deterministic embedding provider
+(fake_embeddings.py), so runs need no Elastic Cloud or OpenAI access and are
+comparable between commits. Each scenario reports throughput, p50/p99/max latency,
+peak Python memory (tracemalloc) and the number of Elasticsearch requests it made.
+
+    python benchmarks/run.py                                   # all scenarios, 1000 incidents
+    python benchmarks/run.py -s create -s semantic-search --size 5000 --ops 500
+    python benchmarks/run.py --es-latency 0.005 --embed-latency 0.05 -o results.json
+
+Scenarios:
+  bulk-import       load --size incidents with bulk_import (always run first, as the dataset)
+  create            create_incident, one incident per op
+  alert-storm       record_alert for --ops firings spread over --rules rules
+  alert-queue       the same storm through ingest.AlertQueue (coalesced, bulk-written)
+                    (with --correlation, near-duplicate rules are attached to one incident)
+  list              page through every incident with list_incidents_page
+  semantic-search   embed a query and run search_semantic (k=10)
+  routes            Flask test client: GET /, GET /incidents/<id>, GET /api/stats, POST /mcp, POST /alerts
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path[:0] = [ROOT, BENCH]
+
+import correlate  # noqa: E402
+import elasticsearch  # noqa: E402
+import embeddings  # noqa: E402
+import fake_es  # noqa: E402
+import ingest  # noqa: E402
+import main  # noqa: E402
+from fake_embeddings import FakeEmbeddingProvider  # noqa: E402
+
+SCENARIOS = ("bulk-import", "create", "alert-storm", "alert-queue", "list", "semantic-search", "routes")
+
+SERVICES = ("checkout", "payments", "search", "auth", "inventory", "shipping", "billing", "profile")
+SYMPTOMS = (
+    "elevated latency", "connection pool exhausted", "5xx error rate above threshold",
+    "disk almost full", "memory leak suspected", "certificate expiring", "queue backlog growing",
+    "replica lag", "cpu saturation", "dns resolution failures",
+)
+PRIORITIES = ("Low", "Medium", "High", "Critical")
+
+
+def _upsert_script(source, params):
+    source.update(params["doc"])
+    for field, delta in params["increments"].items():
+        source[field] = (source.get(field) or 0) + delta
+
+
+def _resolve_update(source, params):
+    was_open = source.get("status") is None or source.get("status") in params["open"]
+    source.update(params["doc"])
+    if source.get("status") not in params["open"] and (was_open or source.get("resolved_at") is None):
+        source["resolved_at"] = params["doc"]["updated_at"]
+
+
+def _truncate_embedding(source, params):
+    vector, dims = source.get("embedding"), params["dims"]
+    if vector is not None and len(vector) > dims:
+        norm = math.sqrt(sum(x * x for x in vector[:dims]))
+        source["embedding"] = [x / norm if norm > 0 else x for x in vector[:dims]]
+        model = source.get("embedding_model")
+        if model is not None and (model == params["model"] or model.startswith(params["model"] + "/")):
+            source["embedding_model"] = f"{params['model']}/{dims}"
+
+
+def _resolution_time(source, params):
+    end = source.get("resolved_at") or source.get("updated_at")
+    if source.get("created_at") and end:
+        delta = datetime.fromisoformat(end) - datetime.fromisoformat(source["created_at"])
+        return int(delta.total_seconds() * 1000)
+    return None
+
+
+class Dataset:
+    """Deterministic incident records and queries."""
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+
+    def incident(self, incident_id):
+        service = self.random.choice(SERVICES)
+        symptom = self.random.choice(SYMPTOMS)
+        return {
+            "id": incident_id,
+            "title": f"{service} {symptom}",
+            "description": f"{service} service reports {symptom} in region {self.random.randint(1, 6)}; "
+                           f"on-call notified after {self.random.randint(1, 30)} minutes of {symptom}.",
+            "priority": self.random.choice(PRIORITIES),
+        }
+
+    def query(self):
+        return f"{self.random.choice(SERVICES)} {self.random.choice(SYMPTOMS)}"
+
+    def alert(self, rules):
+        rule = self.random.randrange(rules)
+        service = SERVICES[rule % len(SERVICES)]
+        return {"rule": {"id": f"rule-{rule}", "name": f"{service} alert {rule}", "severity": "High"},
+                "context": {"value": self.random.random()}}
+
+
+class Recorder:
+    """Collects per-operation latencies, wall time, peak memory and ES requests for one scenario."""
+    def __init__(self, cluster, track_memory):
+        self.cluster = cluster
+        self.track_memory = track_memory
+        self.samples = []
+        self.ops = 0
+
+    def __enter__(self):
+        if self.track_memory:
+            tracemalloc.start()
+        self.requests = self.cluster.requests
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.started
+        self.peak = tracemalloc.get_traced_memory()[1] if self.track_memory else None
+        if self.track_memory:
+            tracemalloc.stop()
+        self.requests = self.cluster.requests - self.requests
+
+    def time(self, fn, *args, weight=1, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.samples.append(time.perf_counter() - start)
+        self.ops += weight
+        return result
+
+    def report(self):
+        samples = sorted(self.samples)
+        return {
+            "ops": self.ops,
+            "seconds": round(self.seconds, 4),
+            "ops_per_sec": round(self.ops / self.seconds, 1) if self.seconds else None,
+            "p50_ms": round(_percentile(samples, 50) * 1000, 3) if samples else None,
+            "p99_ms": round(_percentile(samples, 99) * 1000, 3) if samples else None,
+            "max_ms": round(samples[-1] * 1000, 3) if samples else None,
+            "mean_ms": round(statistics.fmean(samples) * 1000, 3) if samples else None,
+            "peak_memory_mb": round(self.peak / 2 ** 20, 2) if self.peak is not None else None,
+            "es_requests": self.requests,
+        }
+
+
+def _percentile(sorted_samples, percent):
+    index = min(len(sorted_samples) - 1, max(0, int(round(percent / 100.0 * len(sorted_samples) + 0.5)) - 1))
+    return sorted_samples[index]
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.data = Dataset(args.seed)
+        self.cluster = fake_es.FakeCluster(latency=args.es_latency)
+        fake_es.register_script(main.UPSERT_SCRIPT, _upsert_script)
+        fake_es.register_script(main.RESOLUTION_TIME_SCRIPT, _resolution_time)
+        fake_es.register_script(main.RESOLVE_UPDATE_SCRIPT, _resolve_update)
+        fake_es.register_script(main.TRUNCATE_EMBEDDING_SCRIPT, _truncate_embedding)
+        self.embedder = FakeEmbeddingProvider(dims=args.dims, latency=args.embed_latency, maxsize=args.embedding_cache)
+        os.environ["EMBEDDING_DIMS"] = str(args.dims)
+        self.graph = main.ElasticsearchGraph(fake_es.client(self.cluster), node_index=args.index, bootstrap="always")
+        correlator = correlate.AlertCorrelator() if args.correlation else None
+        self.manager = main.IncidentManager(self.graph, embedder=self.embedder, correlator=correlator)
+        self.ids = []
+        self.results = {}
+
+    def recorder(self):
+        return Recorder(self.cluster, not self.args.no_memory)
+
+    def run(self, name, fn):
+        rec = self.recorder()
+        with rec:
+            fn(rec)
+        self.results[name] = rec.report()
+        print(f"{name:<22} {self.results[name]['ops_per_sec']} ops/s  p50 {self.results[name]['p50_ms']} ms  "
+              f"p99 {self.results[name]['p99_ms']} ms", file=sys.stderr)
+
+    # -- scenarios -----------------------------------------------------------
+
+    def bulk_import(self, rec):
+        records = [self.data.incident(f"inc-{i}") for i in range(self.args.size)]
+        batches = self.manager.bulk_import(iter(records), batch_size=self.args.batch_size)
+        while True:
+            report = rec.time(next, batches, None, weight=0)
+            if report is None:
+                rec.samples.pop()
+                break
+            rec.ops += report["indexed"]
+        self.ids = [r["id"] for r in records]
+        self.graph.es.indices.refresh(index=self.args.index)
+
+    def create(self, rec):
+        for i in range(self.args.ops):
+            record = self.data.incident(f"new-{i}")
+            rec.time(self.manager.create_incident, record["id"], record["title"], record["description"],
+                     record["priority"], if_absent=True)
+
+    def alert_storm(self, rec):
+        for _ in range(self.args.ops):
+            alert = ingest.alert_from_payload(self.data.alert(self.args.rules))
+            rec.time(self.manager.record_alert, alert["incident_id"], alert["title"], alert["description"], alert["priority"])
+
+    def alert_queue(self, rec):
+        queue = ingest.AlertQueue(self.manager, window=3600, max_depth=self.args.ops + 1, workers=2)
+        for _ in range(self.args.ops):
+            rec.time(queue.submit, self.data.alert(self.args.rules))
+        queue.flush(wait=True)
+        queue.stop()
+
+    def list(self, rec):
+        token = None
+        while True:
+            page, token = rec.time(self.manager.list_incidents_page, size=100, page_token=token, weight=0)
+            rec.ops += len(page)
+            if not token:
+                break
+
+    def semantic_search(self, rec):
+        for _ in range(self.args.ops):
+            query = self.data.query()
+            rec.time(lambda q: self.manager.search_semantic(self.embedder.embed(q), k=10), query)
+
+    def routes(self, _):
+        client = self._flask_client()
+        ids = self.ids or ["inc-0"]
+        routes = {
+            "GET /": lambda: client.get("/"),
+            "GET /incidents/<id>": lambda: client.get(f"/incidents/{self.data.random.choice(ids)}"),
+            "GET /api/stats": lambda: client.get("/api/stats"),
+            "POST /mcp": lambda: client.post("/mcp", json={"query": self.data.query(), "k": 10}),
+            "POST /alerts": lambda: client.post("/alerts", json=self.data.alert(self.args.rules)),
+        }
+        for label, call in routes.items():
+            rec = self.recorder()
+            with rec:
+                for _ in range(self.args.ops):
+                    resp = rec.time(call)
+                    if resp.status_code >= 400:
+                        raise RuntimeError(f"{label} returned {resp.status_code}")
+            self.results[f"route {label}"] = rec.report()
+            print(f"{'route ' + label:<22} {rec.report()['ops_per_sec']} ops/s  p50 {rec.report()['p50_ms']} ms", file=sys.stderr)
+
+    def _flask_client(self):
+        """Import app.py wired to the fake cluster and the fake embedding provider."""
+        os.environ.update(
+            ELASTICSEARCH_CLOUD_ID="http://fake-es:9200",
+            ELASTICSEARCH_API_KEY="benchmark",
+            ELASTICSEARCH_INDEX=self.args.index,
+            INDEX_BOOTSTRAP="never",
+            ALERT_QUEUE_ENABLED="true" if self.args.alert_queue else "false",
+            ALERT_CORRELATION="true" if self.args.correlation else "false",
+        )
+        cluster = self.cluster
+        elasticsearch.Elasticsearch = lambda *a, **kw: fake_es.client(cluster)
+        embeddings._provider = self.embedder
+        import app
+        return app.app.test_client()
+
+
+def main_():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for IncidentManager and the Flask routes")
+    parser.add_argument("-s", "--scenario", action="append", choices=SCENARIOS, help="Scenario to run (repeatable; default: all)")
+    parser.add_argument("--size", type=int, default=1000, help="Incidents loaded before the other scenarios (default: 1000)")
+    parser.add_argument("--ops", type=int, default=200, help="Operations per scenario (default: 200)")
+    parser.add_argument("--rules", type=int, default=20, help="Distinct alert rules in the alert storms (default: 20)")
+    parser.add_argument("--batch-size", type=int, default=500, help="bulk_import batch size (default: 500)")
+    parser.add_argument("--dims", type=int, default=128, help="Embedding dimensions (default: 128)")
+    parser.add_argument("--embedding-cache", type=int, default=1024, help="In-memory embedding cache entries")
+    parser.add_argument("--es-latency", type=float, default=0.0, help="Simulated seconds per Elasticsearch request")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="Simulated seconds per embeddings API call")
+    parser.add_argument("--alert-queue", action="store_true", help="Enable the alert queue for the /alerts route")
+    parser.add_argument("--correlation", action="store_true", help="Correlate near-duplicate alerts (see correlate.py)")
+    parser.add_argument("--index", default="incidents", help="Incident index name")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for the generated data")
+    parser.add_argument("--no-memory", action="store_true", help="Skip tracemalloc (it slows Python code down)")
+    parser.add_argument("-o", "--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    os.environ.setdefault("INDEX_BOOTSTRAP_CACHE", os.path.join(tempfile.mkdtemp(prefix="bench-"), "indices.json"))
+    for name in ("OTEL_EXPORTER_OTLP_ENDPOINT", "OTEL_CONSOLE_EXPORTER", "LOCAL_VECTOR_INDEX"):
+        os.environ.pop(name, None)
+    selected = args.scenario or list(SCENARIOS)
+    bench = Bench(args)
+    # the dataset is loaded first; it is only reported when selected
+    bench.run("bulk-import", bench.bulk_import)
+    if "bulk-import" not in selected:
+        bench.results.pop("bulk-import")
+    for name in SCENARIOS[1:]:
+        if name not in selected:
+            continue
+        if name == "routes":
+            bench.routes(None)
+        else:
+            bench.run(name, getattr(bench, name.replace("-", "_")))
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "scenario")},
+        "python": platform.python_version(),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "scenarios": bench.results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main_()
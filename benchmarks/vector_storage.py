@@ -0,0 +1,198 @@
+"""
+Recall-vs-size report for the embedding storage options (EMBEDDING_INDEX_TYPE and
+shortened EMBEDDING_DIMENSIONS, see "Vector storage" in the README).
+
+Every stored vector is a query once (up to --queries): its exact top-k neighbors among
+all other vectors at full float32 precision are the ground truth, and recall@k is the
+share of them that a storage option still ranks in its own top-k. Quantization is
+simulated the way Elasticsearch's int8/int4 scalar quantizers work (one min/max range
+per segment, clipped at the tails), with exact search over the quantized vectors, so the
+numbers isolate what the storage costs in quality from HNSW's own approximation.
+
+    python benchmarks/vector_storage.py --live --limit 20000     # ELASTICSEARCH_INDEX
+    python benchmarks/vector_storage.py --file export.ndjson     # records with "embedding"
+    python benchmarks/vector_storage.py                          # synthetic vectors (smoke test)
+
+Truncating dimensions only keeps quality for models trained for it (text-embedding-3-*);
+on text-embedding-ada-002 vectors the report shows how much is lost.
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path[:0] = [ROOT, BENCH]
+
+# bits per component in the kNN structure; None is the raw float32 vector
+STORAGE = (("hnsw", None), ("int8_hnsw", 7), ("int4_hnsw", 4))
+HNSW_M = 16
+GIB = 2 ** 30
+
+
+def load_live(limit):
+    """Embeddings of the incident index (ELASTICSEARCH_INDEX), read with a point in time."""
+    from dotenv import load_dotenv
+    import clients
+    import main
+    load_dotenv()
+    graph = main.ElasticsearchGraph(
+        clients.elasticsearch_client(), node_index=os.getenv("ELASTICSEARCH_INDEX", "incidents"), bootstrap="never"
+    )
+    vectors = []
+    for doc in graph.iter_nodes({"exists": {"field": "embedding"}}, source={"includes": ["embedding"]}):
+        vectors.append(doc["embedding"])
+        if limit and len(vectors) >= limit:
+            break
+    return vectors
+
+
+def load_file(path, limit):
+    vectors = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                vec = json.loads(line).get("embedding")
+                if vec:
+                    vectors.append(vec)
+                    if limit and len(vectors) >= limit:
+                        break
+    return vectors
+
+
+def load_synthetic(size, dims, seed):
+    from fake_embeddings import fake_vector
+    from run import Dataset
+    data = Dataset(seed)
+    return [fake_vector(data.incident(f"inc-{i}")["description"], dims) for i in range(size)]
+
+
+def _unit(x):
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.where(norms > 0, norms, 1.0)
+
+
+def truncate(x, dims):
+    """First dims components, renormalized (what the API returns for a shortened vector)."""
+    return _unit(x[:, :dims])
+
+
+def quantize(x, bits):
+    """Scalar-quantize with one clipped min/max range over all components, then decode."""
+    confidence = max(0.9, 1.0 - 1.0 / (x.shape[1] + 1))
+    lo, hi = np.quantile(x, [(1 - confidence) / 2, 1 - (1 - confidence) / 2])
+    scale = (2 ** bits - 1) / (hi - lo)
+    return np.round((np.clip(x, lo, hi) - lo) * scale) / scale + lo
+
+
+def _scores(docs, queries, query_ids):
+    scores = queries @ docs.T
+    scores[np.arange(len(query_ids)), query_ids] = -np.inf  # a vector is not its own neighbor
+    return scores
+
+
+def top_k(docs, queries, query_ids, k):
+    return np.argpartition(-_scores(docs, queries, query_ids), k, axis=1)[:, :k]
+
+
+def recall(found, true_scores, k):
+    """
+    Share of the found neighbors that are a true top-k neighbor. A neighbor that ties with
+    the true k-th best counts as found, so duplicate vectors do not lower recall.
+    """
+    kth = -np.partition(-true_scores, k - 1, axis=1)[:, k - 1:k]
+    hits = np.take_along_axis(true_scores, found, axis=1) >= kth - 1e-6
+    return float(hits.mean())
+
+
+def bytes_per_vector(dims, bits):
+    """kNN working set (vectors + HNSW links) and disk per vector."""
+    links = HNSW_M * 2 * 4
+    raw = 4 * dims
+    if bits is None:
+        return raw + links, raw + links
+    quantized = -(-dims * bits // 8) + 4  # packed components plus a float correction
+    # quantized indices keep the raw float32 vectors on disk too (for merging and rescoring)
+    return quantized + links, raw + quantized + links
+
+
+def report(vectors, dims_list, k, queries, seed):
+    full = _unit(np.asarray(vectors, dtype=np.float32))
+    n, full_dims = full.shape
+    rng = np.random.default_rng(seed)
+    query_ids = rng.choice(n, size=min(queries, n), replace=False)
+    true_scores = _scores(full, full[query_ids], query_ids)
+    baseline = bytes_per_vector(full_dims, None)[0]
+    rows = []
+    for dims in dims_list:
+        shortened = truncate(full, dims) if dims < full_dims else full
+        for index_type, bits in STORAGE:
+            if bits is None:
+                stored = shortened
+            else:
+                stored = quantize(shortened, bits)
+            found = top_k(stored, stored[query_ids], query_ids, k)
+            memory, disk = bytes_per_vector(dims, bits)
+            rows.append({
+                "index_type": index_type,
+                "dims": dims,
+                "recall_at_k": round(recall(found, true_scores, k), 4),
+                "knn_bytes_per_vector": memory,
+                "disk_bytes_per_vector": disk,
+                "vectors_per_gib": int(GIB / memory),
+                "size_vs_float32": round(memory / baseline, 3),
+            })
+    return {"vectors": n, "model_dims": full_dims, "k": k, "queries": len(query_ids), "results": rows}
+
+
+def _default_dims(full_dims):
+    dims = [full_dims]
+    while dims[-1] // 2 >= 64:
+        dims.append(dims[-1] // 2)
+    return dims
+
+
+def main_():
+    parser = argparse.ArgumentParser(description="Recall vs. size of the embedding storage options")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--live", action="store_true", help="Read embeddings from ELASTICSEARCH_INDEX")
+    source.add_argument("--file", help="NDJSON file whose records have an 'embedding' field")
+    parser.add_argument("--limit", type=int, default=20000, help="Vectors to read (default: 20000)")
+    parser.add_argument("--size", type=int, default=2000, help="Synthetic vectors (default: 2000)")
+    parser.add_argument("--synthetic-dims", type=int, default=256, help="Synthetic vector size (default: 256)")
+    parser.add_argument("--dims", help="Comma-separated sizes to test (default: full size, halved down to 64)")
+    parser.add_argument("-k", type=int, default=10, help="Neighbors per query (default: 10)")
+    parser.add_argument("--queries", type=int, default=500, help="Vectors used as queries (default: 500)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("-o", "--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    if args.live:
+        vectors = load_live(args.limit)
+    elif args.file:
+        vectors = load_file(args.file, args.limit)
+    else:
+        vectors = load_synthetic(args.size, args.synthetic_dims, args.seed)
+    if len(vectors) <= args.k:
+        parser.error(f"need more than {args.k} vectors, found {len(vectors)}")
+    full_dims = len(vectors[0])
+    dims_list = [int(d) for d in args.dims.split(",")] if args.dims else _default_dims(full_dims)
+    result = report(vectors, [d for d in dims_list if d <= full_dims], args.k, args.queries, args.seed)
+
+    print(f"{'index_type':<10} {'dims':>5} {'recall@' + str(args.k):>9} {'bytes/vec':>9} {'size':>6} {'vectors/GiB':>12}",
+          file=sys.stderr)
+    for row in result["results"]:
+        print(f"{row['index_type']:<10} {row['dims']:>5} {row['recall_at_k']:>9.3f} {row['knn_bytes_per_vector']:>9} "
+              f"{row['size_vs_float32']:>6.3f} {row['vectors_per_gib']:>12}", file=sys.stderr)
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main_()
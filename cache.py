@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+class LRUCache:
+    """
+    Thread-safe bounded LRU cache with an optional per-entry TTL.
+    Keeps hit/miss counters so callers can report cache effectiveness.
+    """
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = max(int(maxsize), 0)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                # expired entry: drop it and count as a miss
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        if self.maxsize == 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+class RollupCache:
+    """
+    Cache for expensive aggregate results, such as the dashboard rollups.
+    Entries expire after ttl seconds, and invalidate() marks all of them stale when the data
+    changes. A stale entry is still served until it is min_age seconds old, so a burst of
+    writes causes at most one recomputation per min_age. Concurrent misses for the same key
+    wait for a single computation instead of each running their own.
+    """
+    def __init__(self, ttl=30.0, min_age=2.0, maxsize=64):
+        self.ttl = ttl
+        self.min_age = min_age
+        self.maxsize = maxsize
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = {}  # key -> (value, computed_at, generation)
+        self._key_locks = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+
+    def _fresh(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, computed_at, generation = entry
+                age = time.monotonic() - computed_at
+                if age < self.ttl and (generation == self.generation or age < self.min_age):
+                    self.hits += 1
+                    return value
+            return _MISSING
+
+    def get_or_compute(self, key, compute):
+        """Cached value for key, or compute() it (once, however many callers are waiting)."""
+        value = self._fresh(key)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # another caller may have computed it while we waited
+            value = self._fresh(key)
+            if value is not _MISSING:
+                return value
+            with self._lock:
+                self.misses += 1
+                generation = self.generation
+            value = compute()
+            self._store(key, value, generation)
+            return value
+
+    async def aget_or_compute(self, key, compute):
+        """Async get_or_compute: compute() returns a coroutine, awaited once per miss on this event loop."""
+        value = self._fresh(key)
+        if value is not _MISSING:
+            return value
+        task = self._tasks.get(key)
+        if task is not None:
+            return await asyncio.shield(task)
+        with self._lock:
+            self.misses += 1
+            generation = self.generation
+        task = self._tasks[key] = asyncio.ensure_future(compute())
+        try:
+            value = await asyncio.shield(task)
+        finally:
+            self._tasks.pop(key, None)
+        self._store(key, value, generation)
+        return value
+
+    def _store(self, key, value, generation):
+        with self._lock:
+            self._data[key] = (value, time.monotonic(), generation)
+            while len(self._data) > self.maxsize:
+                oldest = min(self._data, key=lambda k: self._data[k][1])
+                del self._data[oldest]
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
@@ -0,0 +1,276 @@
+"""
+Live incident change feed for the UI: Server-Sent Events on /api/incidents/stream.
+
+IncidentManager writes (UI edits, alert webhooks, the alert queue, bulk imports) publish
+the IDs of the incidents they touched. While anyone is subscribed, a dispatcher thread
+collects those IDs for FEED_COALESCE seconds (default 0.25), reads the rows with one mget
+and hands the same rows to every subscriber, so a write costs one read however many
+pages are open. Writes made by other worker processes never reach this process's feed;
+they are found by querying for recently updated incidents every FEED_POLL_INTERVAL
+seconds (default 5, 0 disables), once per process rather than once per viewer.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+from cache import LRUCache
+
+# seconds a poll reaches back before the newest updated_at seen, for writes that became
+# searchable (refresh) after newer ones, or carry another worker's slightly skewed clock
+POLL_OVERLAP = 10.0
+
+class Subscription:
+    """
+    One open stream. Rows are queued per subscriber (restricted to ids if given); a
+    subscriber that falls more than queue_size batches behind is dropped with a "reset"
+    so its page reloads instead of holding memory. With loop, rows are delivered to an
+    asyncio.Queue on that event loop for async servers.
+    """
+    def __init__(self, ids=None, queue_size=64, loop=None):
+        self.ids = set(ids) if ids else None
+        self.loop = loop
+        self.closed = False
+        if loop is not None:
+            # imported here so CLI commands (which never stream) don't pay for asyncio
+            import asyncio
+            self._queue = asyncio.Queue(maxsize=queue_size)
+            self._full, self._empty = asyncio.QueueFull, asyncio.QueueEmpty
+        else:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._full, self._empty = queue.Full, queue.Empty
+
+    def put(self, rows):
+        if self.ids is not None:
+            rows = [row for row in rows if row.get("node_id") in self.ids]
+        if not rows or self.closed:
+            return
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._offer, rows)
+        else:
+            self._offer(rows)
+
+    def _offer(self, rows):
+        try:
+            self._queue.put_nowait(rows)
+        except self._full:
+            self.reset()
+
+    def reset(self):
+        self.closed = True
+        # make room for the reset marker so the reader sees it next
+        while True:
+            try:
+                self._queue.get_nowait()
+            except self._empty:
+                break
+        self._queue.put_nowait(None)
+
+    def get(self, timeout):
+        """Next list of rows, [] after timeout seconds without changes, or None once reset."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return []
+
+    async def aget(self, timeout):
+        import asyncio
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return []
+
+def sse(rows=None, event=None, event_id=None, comment=None):
+    """Format one Server-Sent Events message; rows are sent as a JSON list."""
+    if comment is not None:
+        return f": {comment}\n\n"
+    prefix = f"id: {event_id}\n" if event_id else ""
+    if event:
+        prefix += f"event: {event}\n"
+    return f"{prefix}data: {json.dumps(rows if rows is not None else [])}\n\n"
+
+def _poll_since(watermark):
+    try:
+        return (datetime.fromisoformat(watermark) - timedelta(seconds=POLL_OVERLAP)).isoformat()
+    except ValueError:
+        return watermark
+
+def _last_updated(rows):
+    return max((row.get("updated_at") or "" for row in rows), default="") or None
+
+class ChangeFeed:
+    """
+    Fan-out of incident row deltas to SSE subscribers. source is an IncidentManager (or
+    any object with incident_rows(ids) and incidents_updated_since(since)); it is set with
+    attach() by the server that owns the feed.
+    """
+    def __init__(self, source=None, coalesce=0.25, poll_interval=5.0, queue_size=64):
+        self.source = source
+        self.coalesce = coalesce
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.published = 0
+        self.fetches = 0
+        self.polls = 0
+        self.rows_sent = 0
+        self._subscribers = set()
+        self._pending = set()
+        # updated_at last sent per incident, so a poll does not resend published rows
+        self._sent = LRUCache(maxsize=10000)
+        self._watermark = None
+        self._started_at = None
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def attach(self, source):
+        """Use source for reads unless another one is attached already (first server wins)."""
+        with self._cond:
+            if self.source is None:
+                self.source = source
+
+    def publish(self, incident_ids):
+        """Called after a write to these incidents; cheap and a no-op without subscribers."""
+        if not self._subscribers:
+            return
+        with self._cond:
+            self._pending.update(i for i in incident_ids if i)
+            self.published += 1
+            self._cond.notify()
+
+    def subscribe(self, ids=None, loop=None):
+        sub = Subscription(ids, self.queue_size, loop)
+        with self._cond:
+            if self._watermark is None:
+                self._watermark = self._started_at = datetime.utcnow().isoformat()
+            self._subscribers.add(sub)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="changefeed", daemon=True)
+                self._thread.start()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._cond:
+            self._subscribers.discard(sub)
+            self._cond.notify()
+
+    def catch_up(self, since, ids=None):
+        """Rows updated at or after since (an updated_at value), for a client that reconnects."""
+        if self.source is None or not since:
+            return []
+        rows = self.source.incidents_updated_since(since)
+        return [row for row in rows if ids is None or row.get("node_id") in ids]
+
+    def _run(self):
+        next_poll = time.monotonic() + self.poll_interval
+        while True:
+            with self._cond:
+                while not self._pending and self._subscribers and not self._poll_due(next_poll):
+                    self._cond.wait(timeout=max(next_poll - time.monotonic(), 0.05) if self.poll_interval else None)
+                if not self._subscribers:
+                    self._thread = None
+                    self._pending.clear()
+                    return
+                has_pending = bool(self._pending)
+            if has_pending:
+                # let a burst of writes (e.g. an alert storm) land in one read
+                time.sleep(self.coalesce)
+                with self._cond:
+                    ids, self._pending = list(self._pending), set()
+                self._deliver(self._read(lambda: self.source.incident_rows(ids)), "fetches")
+            if self._poll_due(next_poll):
+                next_poll = time.monotonic() + self.poll_interval
+                # pages rendered before the first subscriber already show older writes
+                since = max(_poll_since(self._watermark), self._started_at)
+                self._deliver(self._read(lambda: self.source.incidents_updated_since(since)), "polls")
+
+    def _poll_due(self, next_poll):
+        return bool(self.poll_interval) and time.monotonic() >= next_poll
+
+    def _read(self, fetch):
+        if self.source is None:
+            return []
+        try:
+            return fetch()
+        except Exception:
+            # Elasticsearch unavailable: the next write or poll tries again
+            return []
+
+    def _deliver(self, rows, counter):
+        setattr(self, counter, getattr(self, counter) + 1)
+        fresh = []
+        for row in rows:
+            updated_at = row.get("updated_at")
+            if updated_at and self._sent.get(row.get("node_id")) == updated_at:
+                continue
+            self._sent.set(row.get("node_id"), updated_at)
+            fresh.append(row)
+        if not fresh:
+            return
+        last = _last_updated(fresh)
+        with self._cond:
+            if last and last > (self._watermark or ""):
+                self._watermark = last
+            subscribers = list(self._subscribers)
+        self.rows_sent += len(fresh)
+        for sub in subscribers:
+            sub.put(fresh)
+
+    def events(self, sub, heartbeat=15.0, initial=None):
+        """SSE messages for a WSGI streaming response; unsubscribes when the client goes away."""
+        try:
+            yield sse(event="ready")
+            if initial:
+                yield sse(initial, event="incidents", event_id=_last_updated(initial))
+            while True:
+                rows = sub.get(heartbeat)
+                if rows is None:
+                    yield sse(event="reset")
+                    return
+                # comments keep proxies from closing an idle stream
+                yield sse(rows, event="incidents", event_id=_last_updated(rows)) if rows else sse(comment="keepalive")
+        finally:
+            self.unsubscribe(sub)
+
+    async def aevents(self, sub, heartbeat=15.0, initial=None):
+        """events() for ASGI servers; sub must be subscribed with the server's loop."""
+        try:
+            yield sse(event="ready")
+            if initial:
+                yield sse(initial, event="incidents", event_id=_last_updated(initial))
+            while True:
+                rows = await sub.aget(heartbeat)
+                if rows is None:
+                    yield sse(event="reset")
+                    return
+                yield sse(rows, event="incidents", event_id=_last_updated(rows)) if rows else sse(comment="keepalive")
+        finally:
+            self.unsubscribe(sub)
+
+    def stats(self):
+        return {
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "fetches": self.fetches,
+            "polls": self.polls,
+            "rows_sent": self.rows_sent,
+        }
+
+_feed = None
+_feed_lock = threading.Lock()
+
+def shared_feed():
+    """
+    The process-wide ChangeFeed, shared by every IncidentManager in the process so writes
+    through any of them (e.g. asgi.py's async one) reach the UI streams.
+    """
+    global _feed
+    if _feed is None:
+        with _feed_lock:
+            if _feed is None:
+                _feed = ChangeFeed(
+                    coalesce=float(os.getenv("FEED_COALESCE", "0.25")),
+                    poll_interval=float(os.getenv("FEED_POLL_INTERVAL", "5")),
+                )
+    return _feed
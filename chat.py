@@ -0,0 +1,174 @@
+import json
+import os
+import clients
+import telemetry
+
+# openai and tiktoken are imported on first use to keep process startup fast
+
+# Incident fields included in chat context, in order
+CONTEXT_FIELDS = ("title", "status", "priority", "assigned_to", "updated_at")
+
+_encoding = None
+
+def count_tokens(text):
+    """Token count of text (tiktoken when installed, otherwise ~4 characters per token)."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except ImportError:  # optional: fall back to a characters-per-token estimate
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+def _truncate(text, max_tokens):
+    """Cut text down to roughly max_tokens tokens."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    cut = text[: max(max_tokens, 0) * 4]
+    while cut and count_tokens(cut) > max_tokens:
+        cut = cut[: int(len(cut) * 0.9)]
+    return cut.rstrip() + "..."
+
+def format_incident(incident, description_tokens=120):
+    """Compact one-block summary of an incident for the prompt (no embedding, short description)."""
+    header = " | ".join(str(incident.get(f)) for f in CONTEXT_FIELDS if incident.get(f))
+    description = _truncate(str(incident.get("description") or ""), description_tokens)
+    return f"[{incident.get('node_id')}] {header}\n{description}"
+
+def build_context(incidents, token_budget):
+    """
+    Concatenate incident summaries, most relevant first, until the token budget is spent.
+    Returns (context text, IDs of the incidents included).
+    """
+    blocks = []
+    used = 0
+    ids = []
+    for incident in incidents:
+        block = format_incident(incident)
+        cost = count_tokens(block) + 1
+        if used + cost > token_budget:
+            remaining = token_budget - used
+            if remaining < 40:
+                break
+            block = _truncate(block, remaining - 1)
+            cost = remaining
+        blocks.append(block)
+        ids.append(incident.get("node_id"))
+        used += cost
+    return "\n\n".join(blocks), ids
+
+def retrieve_context(manager, question, k=None, token_budget=None):
+    """
+    Ground a question in our incident data: embed it (through the shared, cached provider),
+    take the top-k incidents from IncidentManager.search_semantic and trim them to a token budget.
+    Returns ("", []) when embeddings are unavailable.
+    """
+    k = k or int(os.getenv("CHAT_CONTEXT_K", "5"))
+    token_budget = token_budget or int(os.getenv("CHAT_CONTEXT_TOKENS", "1500"))
+    if not manager.embedder.available():
+        return "", []
+    vector = manager.embedder.embed(question)
+    incidents = manager.search_semantic(vector, k=k)
+    return build_context(incidents, token_budget)
+
+async def aretrieve_context(manager, question, k=None, token_budget=None):
+    """retrieve_context for the async manager (see aio.py)."""
+    k = k or int(os.getenv("CHAT_CONTEXT_K", "5"))
+    token_budget = token_budget or int(os.getenv("CHAT_CONTEXT_TOKENS", "1500"))
+    if not manager.embedder.available():
+        return "", []
+    vector = await manager.embedder.aembed(question)
+    incidents = await manager.search_semantic(vector, k=k)
+    return build_context(incidents, token_budget)
+
+def build_messages(system_prompt, user_message, context=""):
+    messages = [{"role": "system", "content": system_prompt}]
+    if context:
+        messages.append({
+            "role": "system",
+            "content": "Relevant incidents from the incident database (cite their IDs when you use them):\n\n" + context,
+        })
+    messages.append({"role": "user", "content": user_message})
+    return messages
+
+def _stream_options():
+    # ask for a final usage chunk only when it will be recorded (older SDKs lack the option)
+    return {"stream_options": {"include_usage": True}} if telemetry.enabled() else {}
+
+def complete(messages, model):
+    """Return the full chat completion text (new SDK v1.x or legacy v0.x)."""
+    import openai
+    with telemetry.openai_call("chat", model) as call, clients.openai_circuit():
+        client = clients.openai_client()
+        if client is not None:
+            resp = client.chat.completions.create(model=model, messages=messages)
+        else:
+            resp = openai.ChatCompletion.create(model=model, messages=messages, **clients.legacy_openai_options())
+        call.usage(resp)
+    return resp.choices[0].message.content
+
+def stream(messages, model):
+    """Yield chat completion text deltas as they arrive from the API."""
+    import openai
+    with telemetry.openai_call("chat.stream", model, current=False) as call, clients.openai_circuit():
+        client = clients.openai_client()
+        if client is not None:
+            chunks = client.chat.completions.create(model=model, messages=messages, stream=True, **_stream_options())
+            for chunk in chunks:
+                call.usage(chunk)
+                if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                    call.first_token()
+                    yield chunk.choices[0].delta.content
+        else:
+            for chunk in openai.ChatCompletion.create(
+                model=model, messages=messages, stream=True, **clients.legacy_openai_options()
+            ):
+                content = chunk["choices"][0].get("delta", {}).get("content")
+                if content:
+                    call.first_token()
+                    yield content
+
+async def acomplete(messages, model):
+    """Async complete() (AsyncOpenAI, or ChatCompletion.acreate on the legacy SDK)."""
+    import openai
+    with telemetry.openai_call("chat", model) as call, clients.openai_circuit():
+        client = clients.async_openai_client()
+        if client is not None:
+            resp = await client.chat.completions.create(model=model, messages=messages)
+        else:
+            resp = await openai.ChatCompletion.acreate(
+                model=model, messages=messages, **clients.legacy_openai_options()
+            )
+        call.usage(resp)
+    return resp.choices[0].message.content
+
+async def astream(messages, model):
+    """Async stream(): yield chat completion text deltas without blocking the event loop."""
+    import openai
+    with telemetry.openai_call("chat.stream", model, current=False) as call, clients.openai_circuit():
+        client = clients.async_openai_client()
+        if client is not None:
+            chunks = await client.chat.completions.create(
+                model=model, messages=messages, stream=True, **_stream_options()
+            )
+            async for chunk in chunks:
+                call.usage(chunk)
+                if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                    call.first_token()
+                    yield chunk.choices[0].delta.content
+        else:
+            async for chunk in await openai.ChatCompletion.acreate(
+                model=model, messages=messages, stream=True, **clients.legacy_openai_options()
+            ):
+                content = chunk["choices"][0].get("delta", {}).get("content")
+                if content:
+                    call.first_token()
+                    yield content
+
+def sse(data, event=None):
+    """Format one Server-Sent Events message with a JSON payload."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
@@ -0,0 +1,182 @@
+"""
+Shared connection management for Elasticsearch and OpenAI.
+
+Every entry point (main.py, app.py, asgi.py) builds its clients here, so pool sizes,
+compression, timeouts and retries are configured in one place:
+
+  ES_CONNECTIONS_PER_NODE   HTTP connections kept per Elasticsearch node (default 10)
+  ES_HTTP_COMPRESS          gzip request bodies (default true)
+  ES_REQUEST_TIMEOUT        seconds per Elasticsearch request (default 10)
+  ES_MAX_RETRIES            retries on another node or connection (default 3)
+  ES_RETRY_ON_STATUS        HTTP statuses that are retried (default 429,502,503,504)
+  OPENAI_TIMEOUT            seconds per OpenAI request (default 20)
+  OPENAI_MAX_RETRIES        SDK retries with exponential backoff (default 2)
+  OPENAI_CIRCUIT_FAILURES   consecutive failures that open the circuit (default 5, 0 disables)
+  OPENAI_CIRCUIT_RESET      seconds the circuit stays open before a trial call (default 30)
+"""
+import os
+import threading
+import time
+
+def _flag(name, default):
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+def es_options():
+    """Transport options shared by the sync and async Elasticsearch clients."""
+    statuses = os.getenv("ES_RETRY_ON_STATUS", "429,502,503,504")
+    return {
+        "connections_per_node": int(os.getenv("ES_CONNECTIONS_PER_NODE", "10")),
+        "http_compress": _flag("ES_HTTP_COMPRESS", "true"),
+        "request_timeout": float(os.getenv("ES_REQUEST_TIMEOUT", "10")),
+        "max_retries": int(os.getenv("ES_MAX_RETRIES", "3")),
+        "retry_on_timeout": _flag("ES_RETRY_ON_TIMEOUT", "true"),
+        "retry_on_status": tuple(int(s) for s in statuses.split(",") if s.strip()),
+    }
+
+def _es_location(cloud_id):
+    # ELASTICSEARCH_CLOUD_ID may also be a plain URL
+    if cloud_id.startswith("http://") or cloud_id.startswith("https://"):
+        return {"hosts": [cloud_id]}
+    return {"cloud_id": cloud_id}
+
+def elasticsearch_client(cloud_id=None, api_key=None):
+    """Elasticsearch client for a Cloud ID or URL (default: ELASTICSEARCH_CLOUD_ID / ELASTICSEARCH_API_KEY)."""
+    import elasticsearch
+    cloud_id = cloud_id or os.getenv("ELASTICSEARCH_CLOUD_ID")
+    api_key = api_key or os.getenv("ELASTICSEARCH_API_KEY")
+    return elasticsearch.Elasticsearch(api_key=api_key, **_es_location(cloud_id), **es_options())
+
+def async_elasticsearch_client(cloud_id=None, api_key=None):
+    """AsyncElasticsearch counterpart of elasticsearch_client()."""
+    import elasticsearch
+    cloud_id = cloud_id or os.getenv("ELASTICSEARCH_CLOUD_ID")
+    api_key = api_key or os.getenv("ELASTICSEARCH_API_KEY")
+    return elasticsearch.AsyncElasticsearch(api_key=api_key, **_es_location(cloud_id), **es_options())
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker, used as a context manager around upstream calls.
+
+    After failure_threshold failures in a row the circuit opens and calls fail at once
+    with CircuitOpenError for reset_timeout seconds. Then one trial call is let through:
+    success closes the circuit, failure opens it again. Client errors (4xx other than
+    408/409/429) are the caller's fault and do not count as upstream failures.
+    """
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.rejected = 0
+        self.opened = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def __enter__(self):
+        if not self.failure_threshold:
+            return self
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half-open" and self._trial):
+                self.rejected += 1
+                raise CircuitOpenError(f"{self.name} circuit is open; not calling it for up to {self.reset_timeout:.0f}s")
+            if state == "half-open":
+                self._trial = True
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.failure_threshold:
+            return False
+        with self._lock:
+            self._trial = False
+            if exc_type is not None and not issubclass(exc_type, Exception):
+                # a stream closed early (GeneratorExit) says nothing about the upstream
+                return False
+            if exc_type is None or not _upstream_failure(exc):
+                self.failures = 0
+                self._opened_at = None
+                return False
+            self.failures += 1
+            if self._opened_at is None and self.failures >= self.failure_threshold:
+                self.opened += 1
+                self._opened_at = time.monotonic()
+            elif self._opened_at is not None:
+                # the trial call failed: stay open for another reset_timeout
+                self._opened_at = time.monotonic()
+        return False
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+def _upstream_failure(exc):
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return not (isinstance(status, int) and 400 <= status < 500 and status not in (408, 409, 429))
+
+_lock = threading.Lock()
+_shared = {}
+
+def _per_process(name, factory):
+    # clients hold sockets, so each (forked) worker process builds its own
+    key = (name, os.getpid())
+    client = _shared.get(key)
+    if client is None:
+        with _lock:
+            client = _shared.get(key)
+            if client is None:
+                client = _shared[key] = factory()
+    return client
+
+def openai_circuit():
+    """The process-wide circuit breaker shared by all OpenAI calls (embeddings and chat)."""
+    return _per_process("openai_circuit", lambda: CircuitBreaker(
+        "OpenAI",
+        failure_threshold=int(os.getenv("OPENAI_CIRCUIT_FAILURES", "5")),
+        reset_timeout=float(os.getenv("OPENAI_CIRCUIT_RESET", "30")),
+    ))
+
+def _openai_timeout():
+    return float(os.getenv("OPENAI_TIMEOUT", "20"))
+
+def legacy_openai_options():
+    """Per-call options for the legacy v0.x SDK, which has no client to configure a timeout on."""
+    return {"request_timeout": _openai_timeout()}
+
+def _openai_options(openai):
+    return {
+        "api_key": openai.api_key or os.getenv("OPENAI_API_KEY"),
+        "timeout": _openai_timeout(),
+        "max_retries": int(os.getenv("OPENAI_MAX_RETRIES", "2")),
+    }
+
+def openai_client():
+    """Shared OpenAI client (SDK v1.x) with timeouts and retries, or None on the legacy v0.x SDK."""
+    import openai
+    if not hasattr(openai, "OpenAI"):
+        return None
+    return _per_process("openai", lambda: openai.OpenAI(**_openai_options(openai)))
+
+def async_openai_client():
+    """Shared AsyncOpenAI client, or None on the legacy v0.x SDK."""
+    import openai
+    if not hasattr(openai, "AsyncOpenAI"):
+        return None
+    return _per_process("async_openai", lambda: openai.AsyncOpenAI(**_openai_options(openai)))
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+# Values that differ between firings of otherwise identical alerts
+_MASKS = (
+    (re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b"), " <uuid> "),
+    (re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}\b"), " <ip> "),
+    (re.compile(r"\b[0-9a-f]{12,}\b"), " <hex> "),
+    (re.compile(r"\d+"), "<n>"),
+)
+_TOKEN_RE = re.compile(r"[a-z<>_]+")
+BITS = 64
+
+def _leaves(value):
+    if isinstance(value, dict):
+        for item in value.values():
+            yield from _leaves(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _leaves(item)
+    elif value is not None:
+        yield str(value)
+
+def normalize(alert):
+    """
+    Tokens of an alert's title and payload values (JSON keys are left out, since every
+    payload shares them), with IDs, addresses and numbers masked.
+    """
+    parts = [str(alert.get("title") or "")]
+    try:
+        parts.extend(_leaves(json.loads(alert.get("description") or "")))
+    except ValueError:
+        parts.append(str(alert.get("description") or ""))
+    text = " ".join(parts).lower()
+    for pattern, placeholder in _MASKS:
+        text = pattern.sub(placeholder, text)
+    return _TOKEN_RE.findall(text)
+
+def simhash(tokens):
+    """64-bit SimHash over the distinct words and word pairs of tokens."""
+    features = set(tokens)
+    features.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    weights = [0] * BITS
+    for feature in features:
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+        for bit in range(BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(BITS) if weights[bit] > 0)
+
+def fingerprint(alert):
+    """Hex SimHash of a normalized alert, as stored in the incident's alert_fingerprint field."""
+    return format(simhash(normalize(alert)), "016x")
+
+def distance(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+class AlertCorrelator:
+    """
+    In-process window of recent open incidents and the fingerprints of the alerts that
+    created them. An alert whose fingerprint is within max_distance bits of one of them
+    is a near-duplicate and is attached to that incident instead of creating its own.
+
+    Lookups use SimHash banding: the fingerprint is cut into max_distance + 1 bands, and
+    two fingerprints that close must agree on at least one whole band, so only incidents
+    sharing a band are compared. Entries expire window seconds after their last alert.
+    The window is reloaded from Elasticsearch every resync_interval seconds so workers
+    learn about incidents created by each other.
+    """
+    def __init__(self, window=3600.0, max_distance=3, max_size=10000, resync_interval=300.0):
+        self.window = window
+        self.max_distance = max_distance
+        self.max_size = max_size
+        self.resync_interval = resync_interval
+        self.correlated = 0
+        self.checked = 0
+        self._bands = max_distance + 1
+        self._entries = {}  # incident_id -> (fingerprint, last_seen)
+        self._buckets = {}  # (band, value) -> set of incident ids
+        self._attached = {}  # alert incident_id -> incident it was attached to
+        self._lock = threading.Lock()
+        self._synced_at = None
+
+    def __contains__(self, incident_id):
+        return incident_id in self._entries
+
+    def _band_keys(self, fp):
+        value = int(fp, 16)
+        width = -(-BITS // self._bands)
+        mask = (1 << width) - 1
+        return [(band, value >> (band * width) & mask) for band in range(self._bands)]
+
+    def match(self, incident_id, fp):
+        """
+        The open incident a new alert belongs to, as (incident_id, new_link):
+        the alert's own incident if tracked, else the closest near-duplicate within
+        max_distance. new_link is True the first time an alert's incident ID is attached
+        to another incident. Returns (None, False) if the alert starts a new incident.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.checked += 1
+            for known in (incident_id, self._attached.get(incident_id)):
+                if known in self._entries and now - self._entries[known][1] > self.window:
+                    self._remove(known)
+            if incident_id in self._entries:
+                self._touch(incident_id, now)
+                return incident_id, False
+            target = self._attached.get(incident_id)
+            new_link = target not in self._entries
+            if new_link:
+                target = None
+                best = self.max_distance + 1
+                candidates = set()
+                for key in self._band_keys(fp):
+                    candidates.update(self._buckets.get(key, ()))
+                for candidate in candidates:
+                    other, seen = self._entries[candidate]
+                    d = distance(fp, other)
+                    if now - seen <= self.window and d < best:
+                        target, best = candidate, d
+                if target is None:
+                    return None, False
+                self._attached[incident_id] = target
+            self.correlated += 1
+            self._touch(target, now)
+            return target, new_link
+
+    def remember(self, incident_id, fp, seen=None):
+        """Track an incident created (or refreshed) by an alert with fingerprint fp."""
+        with self._lock:
+            self._remove(incident_id)
+            self._entries[incident_id] = (fp, seen if seen is not None else time.monotonic())
+            for key in self._band_keys(fp):
+                self._buckets.setdefault(key, set()).add(incident_id)
+            if len(self._entries) > self.max_size:
+                self._evict()
+
+    def forget(self, incident_id):
+        """Stop correlating alerts into an incident (e.g. once it is resolved)."""
+        with self._lock:
+            self._remove(incident_id)
+
+    def _touch(self, incident_id, now):
+        fp, _ = self._entries[incident_id]
+        self._entries[incident_id] = (fp, now)
+
+    def _remove(self, incident_id):
+        entry = self._entries.pop(incident_id, None)
+        if entry is None:
+            return
+        for key in self._band_keys(entry[0]):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(incident_id)
+                if not bucket:
+                    del self._buckets[key]
+        for alert_id in [a for a, t in self._attached.items() if t == incident_id]:
+            del self._attached[alert_id]
+
+    def _evict(self):
+        now = time.monotonic()
+        expired = [i for i, (_, seen) in self._entries.items() if now - seen > self.window]
+        if len(self._entries) - len(expired) > self.max_size:
+            by_age = sorted(self._entries, key=lambda i: self._entries[i][1])
+            expired = by_age[:len(self._entries) - self.max_size]
+        for incident_id in expired:
+            self._remove(incident_id)
+
+    def replace_all(self, docs):
+        """Reload the window from (node_id, fingerprint, updated_at epoch seconds) triples."""
+        now_wall, now = time.time(), time.monotonic()
+        with self._lock:
+            attached = self._attached
+            self._entries, self._buckets, self._attached = {}, {}, {}
+            self._synced_at = now
+        for node_id, fp, updated in docs:
+            if node_id and fp:
+                self.remember(node_id, fp, seen=now - max(now_wall - updated, 0.0))
+        with self._lock:
+            # keep the links of alerts whose incident is still open
+            self._attached = {a: t for a, t in attached.items() if t in self._entries}
+
+    def needs_resync(self):
+        return self._synced_at is None or time.monotonic() - self._synced_at > self.resync_interval
+
+    def stats(self):
+        with self._lock:
+            return {
+                "incidents": len(self._entries),
+                "attached_alerts": len(self._attached),
+                "checked": self.checked,
+                "correlated": self.correlated,
+                "max_distance": self.max_distance,
+                "window_seconds": self.window,
+            }
+
+def correlator_from_env():
+    """
+    Build the alert correlator from the environment, or return None when disabled.
+    ALERT_CORRELATION (default false), ALERT_CORRELATION_WINDOW (seconds, default 3600),
+    ALERT_CORRELATION_MAX_DISTANCE (bits out of 64, default 3),
+    ALERT_CORRELATION_RESYNC_INTERVAL (seconds, default 300).
+    """
+    if os.getenv("ALERT_CORRELATION", "false").lower() not in ("1", "true", "yes"):
+        return None
+    return AlertCorrelator(
+        window=float(os.getenv("ALERT_CORRELATION_WINDOW", "3600")),
+        max_distance=int(os.getenv("ALERT_CORRELATION_MAX_DISTANCE", "3")),
+        resync_interval=float(os.getenv("ALERT_CORRELATION_RESYNC_INTERVAL", "300")),
+    )
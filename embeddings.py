@@ -0,0 +1,278 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+from array import array
+import clients
+import telemetry
+from cache import LRUCache
+
+DEFAULT_MODEL = "text-embedding-ada-002"
+
+def normalize_text(text):
+    """Collapse whitespace so trivially different payloads share a cache entry."""
+    return " ".join(str(text).split())
+
+def cache_key(model, text, dimensions=None):
+    """Content-addressed key: the model name (and shortened size) plus a SHA-256 of the normalized text."""
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    if dimensions:
+        return f"{model}/{dimensions}:{digest}"
+    return f"{model}:{digest}"
+
+class SqliteEmbeddingStore:
+    """
+    On-disk embedding cache backed by SQLite (WAL mode), so every gunicorn worker
+    on the host can share vectors computed by any other worker.
+    Holds at most max_rows vectors (0: unbounded): every prune_every writes, the oldest
+    rows beyond that are deleted. A rewritten vector counts as new.
+    """
+    def __init__(self, path, max_rows=100000, prune_every=100):
+        self.path = path
+        self.max_rows = max_rows
+        self.prune_every = prune_every
+        self._writes = 0
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+
+    def _conn(self):
+        # sqlite connections must not be shared across threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return array("f", row[0]).tolist()
+
+    def set(self, key, vector):
+        blob = array("f", vector).tobytes()
+        self._conn().execute("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", (key, blob))
+        self._writes += 1
+        if self.max_rows and self._writes % self.prune_every == 0:
+            self.prune()
+
+    def prune(self):
+        """Delete the oldest rows beyond max_rows (by rowid, so only the rowid index is read)."""
+        self._conn().execute(
+            "DELETE FROM embeddings WHERE rowid <= (SELECT rowid FROM embeddings ORDER BY rowid DESC LIMIT 1 OFFSET ?)",
+            (self.max_rows,),
+        )
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+class EmbeddingProvider:
+    """
+    Single entry point for computing text embeddings.
+    Lookups go memory LRU -> optional SQLite tier -> OpenAI, and every vector
+    fetched from the API is written back to both cache tiers.
+    With dimensions set, the API returns vectors shortened to that size
+    (text-embedding-3 models only).
+    """
+    def __init__(self, model=None, maxsize=1024, disk_path=None, dimensions=None, disk_max_rows=100000):
+        self.model = model or os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL)
+        self.dimensions = dimensions
+        self.memory = LRUCache(maxsize=maxsize)
+        self.disk = SqliteEmbeddingStore(disk_path, max_rows=disk_max_rows) if disk_path else None
+        self.disk_hits = 0
+        self.api_calls = 0
+
+    @property
+    def version(self):
+        """Identifier stored with every embedding (embedding_model): the model, plus the size if shortened."""
+        return f"{self.model}/{self.dimensions}" if self.dimensions else self.model
+
+    def available(self):
+        """Embeddings are only computed when an OpenAI API key is configured."""
+        # check the environment first so the openai package is not imported just to answer this
+        openai = sys.modules.get("openai")
+        return bool(os.getenv("OPENAI_API_KEY") or (openai is not None and openai.api_key))
+
+    def embed(self, text, model=None):
+        """Return the embedding vector for text, served from cache when possible."""
+        model = model or self.model
+        key = cache_key(model, text, self.dimensions)
+        vector = self._lookup(key)
+        if vector is not None:
+            return vector
+        vector = self._request(model, [normalize_text(text)])[0]
+        self._store(key, vector)
+        return vector
+
+    def _lookup(self, key):
+        """Check the memory tier, then the disk tier (promoting disk hits to memory)."""
+        vector = self.memory.get(key)
+        if vector is not None or self.disk is None:
+            return vector
+        try:
+            vector = self.disk.get(key)
+        except sqlite3.Error:
+            return None
+        if vector is not None:
+            self.disk_hits += 1
+            self.memory.set(key, vector)
+        return vector
+
+    def embed_many(self, texts, model=None, batch_size=None):
+        """
+        Return embeddings for a list of texts, in order.
+        Cached vectors are reused; the remaining distinct texts are sent to the API
+        in multi-input requests of up to batch_size (EMBEDDING_BATCH_SIZE, default 100).
+        """
+        model = model or self.model
+        keys, found, pending = self._partition(model, texts)
+        for batch in self._batches(pending, batch_size):
+            vectors = self._request(model, [pending[key] for key in batch])
+            for key, vector in zip(batch, vectors):
+                self._store(key, vector)
+                found[key] = vector
+        return [found[key] for key in keys]
+
+    async def aembed(self, text, model=None):
+        """Async embed(): same cache tiers, with the API call made through AsyncOpenAI."""
+        model = model or self.model
+        key = cache_key(model, text, self.dimensions)
+        vector = self._lookup(key)
+        if vector is not None:
+            return vector
+        vector = (await self._arequest(model, [normalize_text(text)]))[0]
+        self._store(key, vector)
+        return vector
+
+    async def aembed_many(self, texts, model=None, batch_size=None):
+        """Async embed_many(); the batches are requested concurrently."""
+        model = model or self.model
+        keys, found, pending = self._partition(model, texts)
+        batches = self._batches(pending, batch_size)
+        results = await asyncio.gather(*(self._arequest(model, [pending[key] for key in batch]) for batch in batches))
+        for batch, vectors in zip(batches, results):
+            for key, vector in zip(batch, vectors):
+                self._store(key, vector)
+                found[key] = vector
+        return [found[key] for key in keys]
+
+    def _partition(self, model, texts):
+        """Split texts into cached vectors and distinct texts still to embed."""
+        keys = [cache_key(model, text, self.dimensions) for text in texts]
+        found = {}
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key in found or key in pending:
+                continue
+            vector = self._lookup(key)
+            if vector is not None:
+                found[key] = vector
+            else:
+                pending[key] = normalize_text(text)
+        return keys, found, pending
+
+    @staticmethod
+    def _batches(pending, batch_size):
+        batch_size = batch_size or int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+        pending_keys = list(pending)
+        return [pending_keys[start:start + batch_size] for start in range(0, len(pending_keys), batch_size)]
+
+    def _store(self, key, vector):
+        self.memory.set(key, vector)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, vector)
+            except sqlite3.Error:
+                pass
+
+    def _request(self, model, inputs):
+        """
+        Call the embeddings API for a list of inputs (new SDK v1.x or legacy v0.x) through the
+        shared client and circuit breaker (see clients.py); raises CircuitOpenError while open.
+        """
+        import openai  # deferred: the SDK is slow to import and most processes never call it
+        if not openai.api_key and os.getenv("OPENAI_API_KEY"):
+            openai.api_key = os.getenv("OPENAI_API_KEY")
+        with telemetry.openai_call("embeddings", model, batch_size=len(inputs)) as call, clients.openai_circuit():
+            self.api_calls += 1
+            client = clients.openai_client()
+            if client is not None:
+                emb_resp = client.embeddings.create(model=model, input=inputs, **self._options())
+            else:
+                emb_resp = openai.Embedding.create(
+                    model=model, input=inputs, **self._options(), **clients.legacy_openai_options()
+                )
+            call.usage(emb_resp)
+        return self._vectors(emb_resp)
+
+    async def _arequest(self, model, inputs):
+        """Async _request: the shared AsyncOpenAI client on SDK v1.x, Embedding.acreate on v0.x."""
+        import openai
+        if not openai.api_key and os.getenv("OPENAI_API_KEY"):
+            openai.api_key = os.getenv("OPENAI_API_KEY")
+        with telemetry.openai_call("embeddings", model, batch_size=len(inputs)) as call, clients.openai_circuit():
+            self.api_calls += 1
+            client = clients.async_openai_client()
+            if client is not None:
+                emb_resp = await client.embeddings.create(model=model, input=inputs, **self._options())
+            else:
+                emb_resp = await openai.Embedding.acreate(
+                    model=model, input=inputs, **self._options(), **clients.legacy_openai_options()
+                )
+            call.usage(emb_resp)
+        return self._vectors(emb_resp)
+
+    def _options(self):
+        return {"dimensions": self.dimensions} if self.dimensions else {}
+
+    @staticmethod
+    def _vectors(emb_resp):
+        # extract embedding vectors (support new and legacy SDK responses)
+        if hasattr(emb_resp, 'data'):
+            items = sorted(emb_resp.data, key=lambda d: getattr(d, 'index', 0))
+            return [item.embedding if hasattr(item, 'embedding') else item['embedding'] for item in items]
+        items = sorted(emb_resp['data'], key=lambda d: d.get('index', 0))
+        return [item['embedding'] for item in items]
+
+    def stats(self):
+        memory = self.memory.stats()
+        return {
+            "model": self.model,
+            "dimensions": self.dimensions,
+            "memory_hits": memory["hits"],
+            "disk_hits": self.disk_hits,
+            "misses": memory["misses"] - self.disk_hits,
+            "api_calls": self.api_calls,
+            "memory_size": memory["size"],
+            "memory_maxsize": memory["maxsize"],
+            "disk_enabled": self.disk is not None,
+        }
+
+_provider = None
+_provider_lock = threading.Lock()
+
+def get_provider():
+    """
+    Return the process-wide EmbeddingProvider configured from the environment:
+    EMBEDDING_CACHE_SIZE (in-memory entries, default 1024) and
+    EMBEDDING_CACHE_PATH (SQLite file shared between workers, disabled if unset),
+    EMBEDDING_CACHE_DISK_MAX_ROWS (vectors kept in that file, default 100000, 0: unbounded) and
+    EMBEDDING_DIMENSIONS (shortened vector size, default: the model's full size).
+    """
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = EmbeddingProvider(
+                    maxsize=int(os.getenv("EMBEDDING_CACHE_SIZE", "1024")),
+                    disk_path=os.getenv("EMBEDDING_CACHE_PATH") or None,
+                    disk_max_rows=int(os.getenv("EMBEDDING_CACHE_DISK_MAX_ROWS", "100000")),
+                    dimensions=int(os.getenv("EMBEDDING_DIMENSIONS") or 0) or None,
+                )
+    return _provider
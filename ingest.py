@@ -0,0 +1,274 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+def alert_from_payload(payload, incident_id=None):
+    """Map an Elastic alert webhook payload to incident fields."""
+    rule = payload.get("rule", {}) or {}
+    if incident_id is None:
+        incident_id = f"alert-{rule.get('id') or uuid.uuid4()}"
+    return {
+        "incident_id": incident_id,
+        "title": rule.get("name", incident_id),
+        "description": json.dumps(payload),
+        "priority": rule.get("severity", "High"),
+    }
+
+class AlertQueue:
+    """
+    Coalescing ingestion queue for alert webhooks.
+
+    Alerts are acknowledged as soon as they are queued. Repeated firings of the
+    same rule within one window are merged into a single pending entry (latest
+    payload wins), and every window a background thread hands the pending alerts
+    to a worker pool that writes them with one bulk request per batch.
+    With a spool path, accepted alerts are also appended to a local file and
+    replayed on startup, so a worker restart does not lose queued alerts. Spool
+    entries record the incident ID they were queued under, so a replayed alert
+    without a rule ID updates the same incident. After a flush only the entries
+    of alerts that failed to write are kept, for the next worker that starts
+    after this one exits.
+    """
+    def __init__(self, manager, window=2.0, max_depth=10000, workers=2, batch_size=500, spool_path=None):
+        self.manager = manager
+        self.window = window
+        self.max_depth = max_depth
+        self.batch_size = batch_size
+        self.workers = workers
+        self.spool_path = spool_path
+        self.received = 0
+        self.merged = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.failed = 0
+        self.inflight = 0
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._pid = None
+        self._spool = None
+        self._replayed = []
+        self._executor = None
+        self._thread = None
+
+    def _ensure_started(self):
+        # start lazily (and again after a fork) so gunicorn workers each own their thread
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="alert-flush")
+        if self.spool_path:
+            self._replay_spool()
+            self._spool = open(self._spool_file(), "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._run, name="alert-queue", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def submit(self, payload):
+        """Queue an alert payload. Returns False if the queue is full and the alert was dropped."""
+        alert = alert_from_payload(payload)
+        with self._lock:
+            self._ensure_started()
+            self.received += 1
+            if not self._add(alert):
+                return False
+            if self._spool is not None:
+                self._spool.write(json.dumps({"incident_id": alert["incident_id"], "payload": payload}) + "\n")
+                self._spool.flush()
+        return True
+
+    def _add(self, alert):
+        key = alert["incident_id"]
+        current = self._pending.get(key)
+        if current is not None:
+            alert["fire_count"] = current["fire_count"] + 1
+            alert["first_seen"] = current["first_seen"]
+            self._pending[key] = alert
+            self.merged += 1
+            return True
+        if len(self._pending) >= self.max_depth:
+            self.dropped += 1
+            return False
+        alert["fire_count"] = 1
+        alert["first_seen"] = time.time()
+        self._pending[key] = alert
+        return True
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.window)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self, wait=False):
+        """Hand all pending alerts to the worker pool in bulk batches."""
+        with self._lock:
+            if not self._pending:
+                return
+            alerts = list(self._pending.values())
+            self._pending = OrderedDict()
+            spool_batch = self._rotate_spool()
+            self.inflight += len(alerts)
+        futures = []
+        failed = set()
+        for start in range(0, len(alerts), self.batch_size):
+            batch = alerts[start:start + self.batch_size]
+            if self._stopped:
+                # at interpreter exit the pool no longer accepts work; write inline
+                failed.update(self._write(batch))
+            else:
+                futures.append(self._executor.submit(self._write, batch))
+        if spool_batch or wait:
+            for future in futures:
+                failed.update(future.result())
+        if failed and spool_batch:
+            self._keep_failed(spool_batch, failed)
+        for path in spool_batch:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _write(self, batch):
+        """Write one batch; returns the incident IDs of the alerts that failed to write."""
+        ids = {alert["incident_id"] for alert in batch}
+        failed = ids
+        try:
+            # apply_alerts also reports duplicate_of edges; only incidents need a replay
+            failed = ids.intersection(self.manager.apply_alerts(batch))
+            if failed:
+                logger.error("Failed to write %d queued alerts: %s", len(failed), sorted(failed))
+        except Exception:
+            logger.exception("Failed to flush %d queued alerts", len(batch))
+        finally:
+            with self._lock:
+                self.flushed += len(batch) - len(failed)
+                self.failed += len(failed)
+                self.inflight -= len(batch)
+        return failed
+
+    def stop(self):
+        """Flush whatever is pending and stop the background thread."""
+        if self._stopped or self._pid != os.getpid():
+            return
+        self._stopped = True
+        self._wakeup.set()
+        self.flush(wait=True)
+        self._executor.shutdown(wait=True)
+        if self._spool is not None:
+            self._spool.close()
+            # everything accepted has been written; nothing left to replay
+            try:
+                os.remove(self._spool_file())
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "depth": len(self._pending),
+                "inflight": self.inflight,
+                "received": self.received,
+                "merged": self.merged,
+                "dropped": self.dropped,
+                "flushed": self.flushed,
+                "failed": self.failed,
+                "window_seconds": self.window,
+                "max_depth": self.max_depth,
+            }
+
+    # -- local spool file ------------------------------------------------------
+
+    def _spool_file(self):
+        return f"{self.spool_path}.{os.getpid()}"
+
+    def _rotate_spool(self):
+        """Move the current spool aside so it can be removed once its alerts are written."""
+        if self._spool is None:
+            return []
+        self._spool.close()
+        flushing = f"{self._spool_file()}.flushing-{uuid.uuid4().hex[:8]}"
+        os.replace(self._spool_file(), flushing)
+        self._spool = open(self._spool_file(), "a", encoding="utf-8")
+        done = [flushing] + self._replayed
+        self._replayed = []
+        return done
+
+    def _keep_failed(self, paths, failed):
+        """Copy the spool entries of failed alerts into a new spool file for replay."""
+        kept = f"{self._spool_file()}.failed-{uuid.uuid4().hex[:8]}"
+        count = 0
+        with open(kept, "w", encoding="utf-8") as out:
+            for path in paths:
+                for incident_id, payload in _read_spool(path):
+                    if incident_id in failed:
+                        out.write(json.dumps({"incident_id": incident_id, "payload": payload}) + "\n")
+                        count += 1
+        logger.warning("Keeping %d spool entries of %d failed alerts for replay: %s", count, len(failed), kept)
+
+    def _replay_spool(self):
+        """Claim spool files left by exited processes and queue their alerts again."""
+        for path in glob.glob(f"{self.spool_path}.*"):
+            owner = path[len(self.spool_path) + 1:].split(".")[0]
+            if not owner.isdigit() or _process_alive(int(owner)):
+                continue
+            claimed = f"{self._spool_file()}.replay-{uuid.uuid4().hex[:8]}"
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue  # another worker claimed it first
+            for incident_id, payload in _read_spool(claimed):
+                self._add(alert_from_payload(payload, incident_id))
+            # keep the claimed file until the replayed alerts are flushed
+            self._replayed.append(claimed)
+
+def _read_spool(path):
+    """Yield (incident_id, payload) per spool entry; bare payload lines come from older spools."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if "payload" in entry:
+                yield entry.get("incident_id"), entry["payload"]
+            else:
+                yield None, entry
+
+def _process_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def queue_from_env(manager):
+    """
+    Build the alert queue from the environment, or return None when disabled.
+    ALERT_QUEUE_ENABLED (default true), ALERT_COALESCE_WINDOW (seconds, default 2),
+    ALERT_QUEUE_MAX_DEPTH (default 10000), ALERT_QUEUE_WORKERS (default 2),
+    ALERT_QUEUE_SPOOL (optional local spool file path).
+    """
+    if os.getenv("ALERT_QUEUE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return AlertQueue(
+        manager,
+        window=float(os.getenv("ALERT_COALESCE_WINDOW", "2")),
+        max_depth=int(os.getenv("ALERT_QUEUE_MAX_DEPTH", "10000")),
+        workers=int(os.getenv("ALERT_QUEUE_WORKERS", "2")),
+        spool_path=os.getenv("ALERT_QUEUE_SPOOL") or None,
+    )
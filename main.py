@@ -1,70 +1,939 @@
+import base64
 import os
-import openai
+import changefeed
+import clients
+import correlate
+import embeddings
 import telemetry
-from elasticsearch import Elasticsearch
+import vector_index
+from cache import LRUCache, RollupCache
+from elasticsearch import BadRequestError, ConflictError, NotFoundError, helpers
 from dotenv import load_dotenv
 import argparse
+import csv
 import json
-from datetime import datetime
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
 
-class ElasticsearchGraph:
-    def __init__(self, es_client, node_index="nodes", edge_index="edges"):
+# Fields incidents can be listed by
+SORT_FIELDS = ("updated_at", "created_at")
+
+def _encode_page_token(sort_values):
+    """Opaque page token for a search_after cursor."""
+    return base64.urlsafe_b64encode(json.dumps(sort_values).encode("utf-8")).decode("ascii")
+
+def _decode_page_token(token):
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid page token")
+
+# Edge index mapping: endpoints and relation type are exact-match keywords
+EDGE_PROPERTIES = {
+    "edge_id": {"type": "keyword"},
+    "source": {"type": "keyword"},
+    "target": {"type": "keyword"},
+    "type": {"type": "keyword"},
+}
+
+# Merge params.doc into an existing node and add params.increments to counter fields
+UPSERT_SCRIPT = (
+    "for (entry in params.doc.entrySet()) { ctx._source[entry.getKey()] = entry.getValue(); } "
+    "for (entry in params.increments.entrySet()) { "
+    "def current = ctx._source[entry.getKey()]; "
+    "ctx._source[entry.getKey()] = (current == null ? 0 : current) + entry.getValue(); }"
+)
+
+# Merge params.doc into an incident; resolved_at is only stamped when the status leaves
+# params.open, so editing an incident that is already resolved keeps its time to resolve
+RESOLVE_UPDATE_SCRIPT = (
+    "boolean wasOpen = ctx._source.status == null || params.open.contains(ctx._source.status); "
+    "for (entry in params.doc.entrySet()) { ctx._source[entry.getKey()] = entry.getValue(); } "
+    "if (!params.open.contains(ctx._source.status) && (wasOpen || ctx._source.resolved_at == null)) { "
+    "ctx._source.resolved_at = params.doc.updated_at; }"
+)
+
+def _apply_upsert(source, doc, increments=None):
+    """What UPSERT_SCRIPT does to an existing node, for nodes merged outside Elasticsearch."""
+    merged = dict(source, **doc)
+    for field, value in (increments or {}).items():
+        merged[field] = (merged.get(field) or 0) + value
+    return merged
+
+# Open incidents with embeddings: the contents of the local vector index
+OPEN_INCIDENTS_QUERY = {"bool": {"filter": [
+    {"term": {"type.keyword": {"value": "incident"}}},
+    {"terms": {"status.keyword": list(vector_index.OPEN_STATUSES)}},
+    {"exists": {"field": "embedding"}},
+]}}
+
+# _source projections. Reads that never use the embedding leave the vector in Elasticsearch:
+# lists get only the columns they render, detail pages and search results everything else.
+SOURCE_LIST = {"includes": [
+    "node_id", "type", "title", "status", "priority", "assigned_to", "created_at", "updated_at",
+    "fire_count", "last_fired_at",
+]}
+SOURCE_NO_EMBEDDING = {"excludes": ["embedding"]}
+# Rows pushed to the list and detail pages by the change feed (see changefeed.py)
+SOURCE_FEED = {"includes": SOURCE_LIST["includes"] + ["description"]}
+# Incidents stored without their embedding (see IncidentManager.embed_pending)
+EMBEDDING_PENDING_QUERY = {"term": {"embedding_pending": True}}
+CORRELATION_SOURCE = {"includes": ["node_id", "alert_fingerprint", "updated_at"]}
+
+def _project(doc, source):
+    """Apply a _source projection ({"includes": [...], "excludes": [...]}) to a flat document."""
+    if source is None:
+        return dict(doc)
+    includes = source.get("includes")
+    excludes = source.get("excludes") or ()
+    return {k: v for k, v in doc.items() if (not includes or k in includes) and k not in excludes}
+
+def _source_params(source):
+    """get/mget keyword arguments for a _source projection."""
+    if source is None:
+        return {}
+    params = {}
+    if source.get("includes"):
+        params["source_includes"] = source["includes"]
+    if source.get("excludes"):
+        params["source_excludes"] = source["excludes"]
+    return params
+
+# Bump when the index mappings change so cached bootstrap checks are redone
+INDEX_SCHEMA_VERSION = 4
+
+def embedding_dims():
+    """
+    Stored embedding size: EMBEDDING_DIMENSIONS when vectors are shortened (see embeddings.py),
+    else EMBEDDING_DIMS (default 1536, the size of the model's vectors).
+    """
+    return int(os.getenv("EMBEDDING_DIMENSIONS") or os.getenv("EMBEDDING_DIMS", "1536"))
+
+# dense_vector index_options types accepted for EMBEDDING_INDEX_TYPE
+VECTOR_INDEX_TYPES = ("hnsw", "int8_hnsw", "int4_hnsw", "bbq_hnsw")
+
+# Reindex script keeping the first params.dims components of the embedding, renormalized
+# to unit length, which is what the API returns for a shortened text-embedding-3 vector
+TRUNCATE_EMBEDDING_SCRIPT = (
+    "def v = ctx._source.embedding; "
+    "if (v != null && v.size() > params.dims) { "
+    "double n = 0; for (int i = 0; i < params.dims; i++) { n += v[i] * v[i]; } "
+    "n = Math.sqrt(n); List out = new ArrayList(); "
+    "for (int i = 0; i < params.dims; i++) { out.add(n > 0 ? v[i] / n : v[i]); } "
+    "ctx._source.embedding = out; "
+    "def m = ctx._source.embedding_model; "
+    "if (m != null && (m == params.model || m.startsWith(params.model + '/'))) { "
+    "ctx._source.embedding_model = params.model + '/' + params.dims; } }"
+)
+
+def _bootstrap_cache_path():
+    return os.getenv("INDEX_BOOTSTRAP_CACHE") or os.path.join(tempfile.gettempdir(), "langcommander-indices.json")
+
+def _read_bootstrap_marker(key):
+    """Result of a recent index check by any process on this host, or None if the check is due."""
+    try:
+        with open(_bootstrap_cache_path(), encoding="utf-8") as f:
+            entry = json.load(f).get(key)
+    except (OSError, ValueError, AttributeError):
+        return None
+    ttl = float(os.getenv("INDEX_BOOTSTRAP_TTL", "3600"))
+    if not entry or entry.get("version") != INDEX_SCHEMA_VERSION or time.time() - entry.get("checked_at", 0) > ttl:
+        return None
+    return entry
+
+def _write_bootstrap_marker(key, vector_indexed):
+    path = _bootstrap_cache_path()
+    try:
+        with open(path, encoding="utf-8") as f:
+            markers = json.load(f)
+    except (OSError, ValueError):
+        markers = {}
+    if not isinstance(markers, dict):
+        markers = {}
+    markers[key] = {"version": INDEX_SCHEMA_VERSION, "checked_at": time.time(), "vector_indexed": vector_indexed}
+    tmp = f"{path}.{os.getpid()}"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(markers, f)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+# Largest number of IDs sent in one terms query when expanding a traversal frontier
+TERMS_CHUNK = 10000
+
+class GraphBase:
+    """
+    Configuration, caches and request bodies of the graph, without any I/O. Shared by
+    ElasticsearchGraph and the AsyncElasticsearchGraph in aio.py, which only differ in
+    how they send the requests; subclasses check the indices in _bootstrap.
+    """
+    def __init__(self, es_client, node_index="nodes", edge_index="edges", adjacency_cache_size=None, node_cache_size=None,
+                 bootstrap=None, history=None):
         self.es = es_client
         self.node_index = node_index
         self.edge_index = edge_index
+        # time-based indices behind the <node_index>-history alias that archive_nodes() moves
+        # old nodes into (INCIDENT_HISTORY); reads only include them when asked to
+        if history is None:
+            history = os.getenv("INCIDENT_HISTORY", "false").lower() in ("1", "true", "yes")
+        self.history_index = f"{node_index}-history" if history else None
+        # optional cache of node_id -> {(direction, edge_type): neighbor ids}; invalidated by add_edge
+        if adjacency_cache_size is None:
+            adjacency_cache_size = int(os.getenv("GRAPH_ADJACENCY_CACHE_SIZE", "0"))
+        self.adjacency_cache = LRUCache(
+            maxsize=adjacency_cache_size, ttl=float(os.getenv("GRAPH_ADJACENCY_CACHE_TTL", "60"))
+        ) if adjacency_cache_size else None
+        self._field_cache = {}
+        # read-through node cache (NODE_CACHE_SIZE entries for NODE_CACHE_TTL seconds; 0 disables)
+        if node_cache_size is None:
+            node_cache_size = int(os.getenv("NODE_CACHE_SIZE", "1024"))
+        self.node_cache = LRUCache(
+            maxsize=node_cache_size, ttl=float(os.getenv("NODE_CACHE_TTL", "5"))
+        ) if node_cache_size else None
+        # whether the embedding field supports approximate kNN (None: unknown)
+        self.vector_indexed = None
+        # after a rejected kNN request: when to try kNN again (see _knn_fallback)
+        self._knn_retry_at = None
+        self._bootstrap(bootstrap or os.getenv("INDEX_BOOTSTRAP", "auto"))
+
+    def _bootstrap_key(self):
+        return f"{os.getenv('ELASTICSEARCH_CLOUD_ID', '')}|{self.node_index}|{self.edge_index}|{self.history_index or ''}"
+
+    @staticmethod
+    def _index_settings():
+        """
+        Node index settings. INDEX_SOURCE_MODE=synthetic rebuilds _source from doc values
+        instead of storing it (Elasticsearch 8.17+, Enterprise licence), which mostly saves
+        the stored copy of every embedding; the default "stored" keeps the normal _source.
+        """
+        if os.getenv("INDEX_SOURCE_MODE", "stored").lower() == "synthetic":
+            return {"index": {"mapping": {"source": {"mode": "synthetic"}}}}
+        return {}
+
+    @staticmethod
+    def _embedding_mapping(dims, index_type=None):
+        """
+        dense_vector mapping indexed for approximate kNN (HNSW) with cosine similarity.
+        index_type (default EMBEDDING_INDEX_TYPE) picks how the HNSW graph stores vectors:
+        hnsw (float32), int8_hnsw (4x smaller), int4_hnsw (8x) or bbq_hnsw (32x); unset
+        leaves the choice to Elasticsearch (int8_hnsw on 8.14+).
+        """
+        mapping = {"type": "dense_vector", "dims": dims, "index": True, "similarity": "cosine"}
+        index_type = index_type or os.getenv("EMBEDDING_INDEX_TYPE")
+        if index_type:
+            if index_type not in VECTOR_INDEX_TYPES:
+                raise ValueError(f"Unknown embedding index type {index_type!r}; use one of {', '.join(VECTOR_INDEX_TYPES)}")
+            mapping["index_options"] = {"type": index_type}
+        return mapping
+
+    def _history_template(self):
+        """
+        Index template for the history indices: the embedding mapping and index settings of the
+        node index, allocated to warm nodes where the cluster has them (HISTORY_TIER_PREFERENCE).
+        """
+        settings = self._index_settings()
+        tiers = os.getenv("HISTORY_TIER_PREFERENCE", "data_warm,data_hot")
+        if tiers:
+            settings.setdefault("index", {})["routing"] = {"allocation": {"include": {"_tier_preference": tiers}}}
+        template = {"mappings": {"properties": {"embedding": self._embedding_mapping(embedding_dims())}}}
+        if settings:
+            template["settings"] = settings
+        return {"index_patterns": [f"{self.history_index}-*"], "template": template, "priority": 200}
+
+    def _node_index_body(self, dims):
+        """Create-index body of the node index: an indexed embedding of dims, plus the index settings."""
+        body = {"mappings": {"properties": {"embedding": self._embedding_mapping(dims)}}}
+        settings = self._index_settings()
+        if settings:
+            body["settings"] = settings
+        return body
+
+    @staticmethod
+    def _mapped_properties(mapping_response):
+        """Field mappings from a get_mapping response (of the last index when given an alias)."""
+        props = {}
+        for index_mapping in mapping_response.values():
+            props = index_mapping.get("mappings", {}).get("properties", {})
+        return props
+
+    def _first_history_index(self):
+        """Name and create-index body of the first history index behind the history write alias."""
+        return f"{self.history_index}-000001", {"aliases": {self.history_index: {"is_write_index": True}}}
+
+    def _long_requests(self):
+        """
+        The client for requests that can run for minutes (reindex, rollover, archive bulk
+        writes): no ES_REQUEST_TIMEOUT, and no retry on timeout, which would send the same
+        request again while the first one is still running.
+        """
+        return self.es.options(request_timeout=None, retry_on_timeout=False)
+
+    def _read_index(self, history=False):
+        """Index expression for reads: the node index, plus the history indices if asked and enabled."""
+        if history and self.history_index:
+            return f"{self.node_index},{self.history_index}"
+        return self.node_index
+
+    @staticmethod
+    def _node_document(node_id, properties):
+        body = properties.copy()
+        body["node_id"] = node_id
+        return body
+
+    def _edge_document(self, edge_id, source, target, properties):
+        """Edge source to index; drops the cached adjacency of both endpoints."""
+        if self.adjacency_cache is not None:
+            self.adjacency_cache.invalidate(source)
+            self.adjacency_cache.invalidate(target)
+        return dict(properties, edge_id=edge_id, source=source, target=target)
+
+    def _edge_actions(self, edges):
+        for edge_id, source, target, properties in edges:
+            yield {"_op_type": "index", "_index": self.edge_index, "_id": edge_id,
+                   "_source": self._edge_document(edge_id, source, target, properties)}
+
+    @staticmethod
+    def _bulk_item(item):
+        """The per-document info (_id, result, error) of a bulk helper result."""
+        return next(iter(item.values()), {})
+
+    def _invalidate_node(self, node_id):
+        if self.node_cache is not None:
+            self.node_cache.invalidate(node_id)
+
+    def _cached_node(self, node_id, source=None):
+        """
+        Node from the cache, projected to source. Entries remember the projection they
+        were read with, so a lean cached copy never answers a request for more fields.
+        """
+        if self.node_cache is None:
+            return None
+        entry = self.node_cache.get(node_id)
+        if entry is None:
+            return None
+        cached_source, doc = entry
+        if cached_source is not None and cached_source != source:
+            return None
+        return _project(doc, source)
+
+    def _cache_node(self, node_id, doc, source=None):
+        if self.node_cache is not None:
+            self.node_cache.set(node_id, (source, doc))
+
+    @staticmethod
+    def _upsert_request(node_id, doc, upsert, increments=None):
+        """Script and upsert document for a create-or-merge of one node."""
+        increments = increments or {}
+        body = dict(upsert, **increments)
+        body["node_id"] = node_id
+        script = {"source": UPSERT_SCRIPT, "lang": "painless", "params": {"doc": doc, "increments": increments}}
+        return script, body
+
+    def _upsert_actions(self, upserts, merges):
+        """
+        Bulk update actions for bulk_upsert_nodes. With history, each node's (doc, increments)
+        is kept in merges for restore_archived.
+        """
+        for item in upserts:
+            node_id, doc, upsert = item[:3]
+            increments = item[3] if len(item) > 3 else None
+            if self.history_index:
+                merges[node_id] = (doc, increments)
+            script, body = self._upsert_request(node_id, doc, upsert, increments)
+            yield {"_op_type": "update", "_index": self.node_index, "_id": node_id,
+                   "script": script, "upsert": body, "retry_on_conflict": 5}
+
+    @staticmethod
+    def _update_kwargs(properties=None, script=None):
+        return {"script": script} if script is not None else {"doc": properties}
+
+    def _find_archived_body(self, node_ids, source=None):
+        # newest copy first: an ID archived more than once has a copy in several history indices
+        body = {"size": len(node_ids), "query": {"ids": {"values": list(node_ids)}}, "seq_no_primary_term": True,
+                "sort": [{"updated_at": {"order": "desc", "unmapped_type": "date"}}]}
+        if source is not None:
+            body["_source"] = source
+        return body
+
+    @staticmethod
+    def _collect_archived(resp, node_ids, found):
+        """
+        Keep the newest hit of each ID of a find_archived search in found. Returns the IDs
+        to search again: those crowded out of a full page by older copies of other IDs.
+        """
+        hits = resp.get("hits", {}).get("hits", [])
+        for hit in hits:
+            found.setdefault(hit["_id"], hit)
+        if len(hits) < len(node_ids):
+            return []
+        return [node_id for node_id in node_ids if node_id not in found]
+
+    def _restore_actions(self, archived, merges=None):
+        """Index actions copying archived hits back to the node index, with pending upserts applied."""
+        for node_id, hit in archived.items():
+            body = hit["_source"]
+            if merges and node_id in merges:
+                body = _apply_upsert(body, *merges[node_id])
+            yield {"_op_type": "index", "_index": self.node_index, "_id": node_id, "_source": body}
+
+    @staticmethod
+    def _delete_actions(hits, conditional=True):
+        """Delete actions for search hits, only if unchanged since they were read when conditional."""
+        for hit in hits:
+            action = {"_op_type": "delete", "_index": hit["_index"], "_id": hit["_id"]}
+            if conditional:
+                action.update(if_seq_no=hit["_seq_no"], if_primary_term=hit["_primary_term"])
+            yield action
+
+    def _vector_mode(self, mode):
+        mode = mode or os.getenv("VECTOR_SEARCH_MODE", "auto")
+        if mode == "auto":
+            retry = self._knn_retry_at is not None and time.monotonic() >= self._knn_retry_at
+            mode = "exact" if self.vector_indexed is False and not retry else "knn"
+        return mode
+
+    def _knn_fallback(self):
+        """
+        Called when Elasticsearch rejected a kNN request with a 400 (the embedding is not
+        indexed for kNN). In auto mode, exact scoring is used instead until kNN is tried
+        again after KNN_RETRY_SECONDS (default 300), e.g. once another process has migrated
+        the index. Returns whether to fall back.
+        """
+        if os.getenv("VECTOR_SEARCH_MODE", "auto") != "auto":
+            return False
+        self.vector_indexed = False
+        self._knn_retry_at = time.monotonic() + float(os.getenv("KNN_RETRY_SECONDS", "300"))
+        return True
+
+    def _knn_succeeded(self):
+        if self._knn_retry_at is not None:
+            self.vector_indexed = True
+            self._knn_retry_at = None
+
+    def _knn_body(self, vector, k, num_candidates, filters, source=None):
+        """Approximate kNN request with incident pre-filters."""
+        if num_candidates is None:
+            num_candidates = int(os.getenv("KNN_NUM_CANDIDATES", "0")) or max(k * 10, 100)
+        body = {
+            "size": k,
+            "knn": {
+                "field": "embedding",
+                "query_vector": vector,
+                "k": k,
+                "num_candidates": min(max(num_candidates, k), 10000),
+                "filter": self._incident_filters(filters),
+            },
+        }
+        if source is not None:
+            body["_source"] = source
+        return body
+
+    def _exact_body(self, vector, k, filters, source=None):
+        # Perform semantic search via script_score using cosine similarity
+        # Filter to incident nodes and rank by similarity to the query vector
+        body = {
+            "size": k,
+            "query": {
+                "script_score": {
+                    "query": {"bool": {"filter": self._incident_filters(filters)}},
+                    "script": {
+                        # cosineSimilarity returns [-1,1]; shift to positive
+                        "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
+                        "params": {"query_vector": vector}
+                    }
+                }
+            }
+        }
+        if source is not None:
+            body["_source"] = source
+        return body
+
+    @staticmethod
+    def _vector_hits(resp, mode, with_scores):
+        """Sources from a vector search response, or (cosine similarity, source) pairs."""
+        hits = resp.get("hits", {}).get("hits", [])
+        if not with_scores:
+            return [hit.get("_source", {}) for hit in hits]
+        if mode == "knn":
+            # knn cosine scores are (1 + cosine) / 2
+            return [(2.0 * hit["_score"] - 1.0, hit.get("_source", {})) for hit in hits]
+        return [(hit["_score"] - 1.0, hit.get("_source", {})) for hit in hits]
+
+    def _lexical_body(self, text, size, filters=None, source=None):
+        """BM25 over title (boosted) and description, plus an exact match on the incident ID."""
+        body = {
+            "size": size,
+            "query": {"bool": {
+                "should": [
+                    {"multi_match": {"query": text, "fields": ["title^2", "description"]}},
+                    {"term": {"node_id.keyword": {"value": text, "boost": 10.0}}},
+                ],
+                "minimum_should_match": 1,
+                "filter": self._incident_filters(filters),
+            }},
+        }
+        if source is not None:
+            body["_source"] = source
+        return body
+
+    def _hybrid_searches(self, text, vector, window, filters, num_candidates, source):
+        """msearch request lines for the lexical and (with a vector) the vector leg."""
+        searches = [{}, self._lexical_body(text, window, filters, source)]
+        mode = None
+        if vector is not None:
+            mode = self._vector_mode(None)
+            if mode == "knn":
+                searches += [{}, self._knn_body(vector, window, num_candidates, filters, source)]
+            else:
+                searches += [{}, self._exact_body(vector, window, filters, source)]
+        return searches, mode
+
+    def _knn_failed(self, responses, mode):
+        """Whether the kNN leg of a hybrid msearch was rejected and should be retried with exact scoring."""
+        if mode != "knn" or len(responses) < 2:
+            return False
+        if "error" not in responses[1]:
+            self._knn_succeeded()
+            return False
+        if responses[1].get("status") != 400 or not self._knn_fallback():
+            raise RuntimeError(f"kNN search failed: {responses[1]['error']}")
+        return True
+
+    @staticmethod
+    def _hybrid_window(k, offset):
+        """Hits per hybrid leg: HYBRID_RANK_WINDOW, and at least enough for the requested page."""
+        return max(int(os.getenv("HYBRID_RANK_WINDOW", "50")), offset + k)
+
+    @staticmethod
+    def _fuse_rrf(responses, k, offset=0):
+        """
+        Reciprocal rank fusion: a document scores sum(1 / (HYBRID_RANK_CONSTANT + rank)) over
+        the result lists it appears in, so agreement between BM25 and vector search wins
+        without having to normalize their scores.
+        """
+        rank_constant = float(os.getenv("HYBRID_RANK_CONSTANT", "60"))
+        scores = {}
+        docs = {}
+        for resp in responses:
+            if "error" in resp:
+                raise RuntimeError(f"Hybrid search failed: {resp['error']}")
+            for rank, hit in enumerate(resp.get("hits", {}).get("hits", []), start=1):
+                scores[hit["_id"]] = scores.get(hit["_id"], 0.0) + 1.0 / (rank_constant + rank)
+                docs.setdefault(hit["_id"], hit.get("_source", {}))
+        ranked = sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))
+        return [docs[doc_id] for doc_id in ranked[offset:offset + k]]
+
+    @staticmethod
+    def _pit_sort(sort_field, order, unmapped_type="date"):
+        sort = [{sort_field: {"order": order, "unmapped_type": unmapped_type}}] if sort_field else []
+        sort.append({"_shard_doc": "asc"})
+        return sort
+
+    @staticmethod
+    def _pit_body(pit_id, keep_alive, query, sort, page_size, search_after=None, source=None, seq_no=False):
+        """One page of a point-in-time scan."""
+        q = query if query is not None else {"match_all": {}}
+        body = {"size": page_size, "query": q, "sort": sort, "pit": {"id": pit_id, "keep_alive": keep_alive}}
+        if search_after is not None:
+            body["search_after"] = search_after
+        if source is not None:
+            body["_source"] = source
+        if seq_no:
+            body["seq_no_primary_term"] = True
+        return body
+
+    @staticmethod
+    def _page_body(query, sort_field, order, size, search_after=None, source=None):
+        """One page of nodes for search_page, with the node ID as tie-breaker."""
+        q = query if query is not None else {"match_all": {}}
+        body = {
+            "size": size,
+            "query": q,
+            "sort": [
+                {sort_field: {"order": order, "unmapped_type": "date"}},
+                {"node_id.keyword": {"order": "asc", "unmapped_type": "keyword"}},
+            ],
+        }
+        if search_after:
+            body["search_after"] = search_after
+        if source is not None:
+            body["_source"] = source
+        return body
+
+    @staticmethod
+    def _page_result(resp, size):
+        """(sources, cursor) of a search_page response; cursor is None on the last page."""
+        hits = resp.get("hits", {}).get("hits", [])
+        cursor = hits[-1]["sort"] if len(hits) == size else None
+        return [hit["_source"] for hit in hits], cursor
+
+    @staticmethod
+    def _aggregate_body(query, aggs, runtime_mappings=None):
+        body = {"size": 0, "track_total_hits": True, "query": query, "aggs": aggs}
+        if runtime_mappings:
+            body["runtime_mappings"] = runtime_mappings
+        return body
+
+    def _incident_filters(self, filters=None):
+        """
+        Build filter clauses restricting results to incident nodes.
+        filters may contain "status" and "priority" (a value or list of values)
+        and "since"/"until" (date or date math bounds on updated_at).
+        """
+        filters = filters or {}
+        clauses = [{"term": {"type.keyword": {"value": "incident"}}}]
+        for field in ("status", "priority"):
+            value = filters.get(field)
+            if value:
+                values = value if isinstance(value, (list, tuple)) else [value]
+                clauses.append({"terms": {f"{field}.keyword": list(values)}})
+        bounds = {}
+        if filters.get("since"):
+            bounds["gte"] = filters["since"]
+        if filters.get("until"):
+            bounds["lte"] = filters["until"]
+        if bounds:
+            clauses.append({"range": {"updated_at": bounds}})
+        return clauses
+
+@telemetry.trace_methods("graph")
+class ElasticsearchGraph(GraphBase):
+    def _bootstrap(self, mode):
+        """
+        Make sure the indices exist before first use, per INDEX_BOOTSTRAP:
+        "auto" (default) checks them unless another process on this host did so within
+        INDEX_BOOTSTRAP_TTL seconds (cached in INDEX_BOOTSTRAP_CACHE), "always" checks on
+        every start, "never" skips the check (run `main.py init-indices` when deploying).
+        """
+        if mode == "never":
+            return
+        if mode == "auto":
+            entry = _read_bootstrap_marker(self._bootstrap_key())
+            if entry is not None:
+                self.vector_indexed = entry.get("vector_indexed")
+                return
+        self.init_indices()
+
+    def init_indices(self):
+        """Create the indices and mappings if needed and cache the result for other processes."""
         self._create_indices()
+        _write_bootstrap_marker(self._bootstrap_key(), self.vector_indexed)
 
     def _create_indices(self):
         """
         Create node and edge indices. For the node index, include a dense_vector field for semantic search embeddings.
+        The embedding is mapped as an indexed (HNSW) vector with cosine similarity so approximate kNN search can be used.
         If the node index already exists but lacks the embedding field, update its mapping.
+        Existing indices with a non-indexed embedding keep working with exact (script_score) search;
+        see migrate_vector_index to move them to an indexed mapping.
         """
-        dims = int(os.getenv("EMBEDDING_DIMS", "1536"))
+        dims = embedding_dims()
         # Ensure node_index exists and has embedding mapping
         if not self.es.indices.exists(index=self.node_index):
             # create node index with embedding mapping
-            mapping = {
-                "mappings": {
-                    "properties": {
-                        "embedding": {"type": "dense_vector", "dims": dims}
-                    }
-                }
-            }
-            self.es.indices.create(index=self.node_index, body=mapping)
+            self.es.indices.create(index=self.node_index, body=self._node_index_body(dims))
+            self.vector_indexed = True
         else:
             # node index exists: ensure embedding field is present
             try:
-                current = self.es.indices.get_mapping(index=self.node_index)
-                props = current.get(self.node_index, {}).get("mappings", {}).get("properties", {})
+                props = self._mapped_properties(self.es.indices.get_mapping(index=self.node_index))
                 if "embedding" not in props:
                     # add dense_vector mapping for embeddings
                     self.es.indices.put_mapping(
                         index=self.node_index,
-                        body={"properties": {"embedding": {"type": "dense_vector", "dims": dims}}}
+                        body={"properties": {"embedding": self._embedding_mapping(dims)}}
                     )
+                    self.vector_indexed = True
+                else:
+                    self.vector_indexed = props["embedding"].get("index") is True
             except Exception:
                 pass
-        # Ensure edge_index exists (no special mapping)
+        # Ensure edge_index exists, with keyword endpoints so neighbor lookups are exact term queries
         if not self.es.indices.exists(index=self.edge_index):
-            self.es.indices.create(index=self.edge_index)
+            self.es.indices.create(index=self.edge_index, body={"mappings": {"properties": EDGE_PROPERTIES}})
+        if self.history_index:
+            self._create_history()
+
+    def _create_history(self):
+        """Put the history index template, and create the first history index behind its write alias."""
+        self.es.indices.put_index_template(name=self.history_index, body=self._history_template())
+        if not self.es.indices.exists_alias(name=self.history_index):
+            index, body = self._first_history_index()
+            self.es.indices.create(index=index, body=body)
 
     def add_node(self, node_id, properties):
-        body = properties.copy()
-        body["node_id"] = node_id
+        body = self._node_document(node_id, properties)
         self.es.index(index=self.node_index, id=node_id, document=body)
+        # we just wrote the full document: refresh the cache with it
+        self._cache_node(node_id, body)
+
+    def bulk_add_nodes(self, nodes, chunk_size=500, thread_count=1, archived=False):
+        """
+        Index (node_id, properties) pairs through the bulk API.
+        Uses streaming_bulk, or parallel_bulk when thread_count > 1.
+        archived=True writes them to the history write alias instead (history must be enabled).
+        Yields (ok, node_id, error) for every node so callers can report failures.
+        """
+        if archived and not self.history_index:
+            raise ValueError("archived nodes need INCIDENT_HISTORY=true")
+        index = self.history_index if archived else self.node_index
+
+        def actions():
+            for node_id, properties in nodes:
+                yield {"_op_type": "index", "_index": index, "_id": node_id,
+                       "_source": self._node_document(node_id, properties)}
+
+        if thread_count > 1:
+            results = helpers.parallel_bulk(
+                self.es, actions(), thread_count=thread_count, chunk_size=chunk_size,
+                raise_on_error=False, raise_on_exception=False,
+            )
+        else:
+            results = helpers.streaming_bulk(
+                self.es, actions(), chunk_size=chunk_size,
+                raise_on_error=False, raise_on_exception=False,
+            )
+        for ok, item in results:
+            info = self._bulk_item(item)
+            self._invalidate_node(info.get("_id"))
+            yield ok, info.get("_id"), None if ok else info.get("error")
+
+    def create_node(self, node_id, properties):
+        """
+        Index a node only if no node with this ID exists (one write, no read; with history
+        enabled, one search first, since archived IDs are taken too).
+        Returns False if the node already exists.
+        """
+        if self.find_archived([node_id], source=False):
+            return False
+        body = self._node_document(node_id, properties)
+        try:
+            self.es.create(index=self.node_index, id=node_id, document=body)
+        except ConflictError:
+            return False
+        self._cache_node(node_id, body)
+        return True
+
+    def upsert_node(self, node_id, doc, upsert, increments=None):
+        """
+        Create-or-update a node with a single update request and no prior read.
+        If the node exists, doc is merged into it and each field in increments is
+        incremented server-side; otherwise upsert (plus the increments) is indexed.
+        Concurrent upserts of the same node are serialized by Elasticsearch (retry_on_conflict).
+        Returns the update response (result is "created" or "updated").
+        A node created here that turns out to be archived is merged into its restored copy.
+        """
+        script, body = self._upsert_request(node_id, doc, upsert, increments)
+        resp = self.es.update(index=self.node_index, id=node_id, script=script, upsert=body, retry_on_conflict=5)
+        self._invalidate_node(node_id)
+        if resp.get("result") == "created" and self.restore_archived([node_id], {node_id: (doc, increments)}):
+            resp = dict(resp, result="updated")
+        return resp
+
+    def bulk_upsert_nodes(self, upserts, chunk_size=500):
+        """
+        Create-or-update nodes in bulk without reading them first.
+        upserts yields (node_id, doc, upsert) or (node_id, doc, upsert, increments):
+        doc is merged into an existing node (and increments added server-side),
+        upsert is indexed as the full node when it does not exist yet.
+        Yields (ok, node_id, error) for every node; created nodes that turn out to be
+        archived are merged into their restored copies once all results are consumed.
+        """
+        merges = {}
+        created = []
+        for ok, item in helpers.streaming_bulk(
+            self.es, self._upsert_actions(upserts, merges), chunk_size=chunk_size,
+            raise_on_error=False, raise_on_exception=False,
+        ):
+            info = self._bulk_item(item)
+            self._invalidate_node(info.get("_id"))
+            if ok and info.get("result") == "created":
+                created.append(info.get("_id"))
+            yield ok, info.get("_id"), None if ok else info.get("error")
+        if created and self.history_index:
+            self.restore_archived(created, merges)
 
-    def get_node(self, node_id):
+    def bulk_update_nodes(self, updates, chunk_size=500):
+        """
+        Partially update existing nodes from (node_id, properties) pairs through the bulk API.
+        Yields (ok, node_id, error) for every node.
+        """
+        def actions():
+            for node_id, properties in updates:
+                yield {"_op_type": "update", "_index": self.node_index, "_id": node_id,
+                       "doc": properties, "retry_on_conflict": 5}
+
+        for ok, item in helpers.streaming_bulk(
+            self.es, actions(), chunk_size=chunk_size, raise_on_error=False, raise_on_exception=False
+        ):
+            info = self._bulk_item(item)
+            self._invalidate_node(info.get("_id"))
+            yield ok, info.get("_id"), None if ok else info.get("error")
+
+    def get_node(self, node_id, source=None, history=False):
+        """
+        Fetch a node by ID, optionally projected to source (see SOURCE_NO_EMBEDDING); None if missing.
+        With history=True a node missing from the node index is looked up in the history indices.
+        """
+        cached = self._cached_node(node_id, source)
+        if cached is not None:
+            return cached
         try:
-            return self.es.get(index=self.node_index, id=node_id)["_source"]
+            node = self.es.get(index=self.node_index, id=node_id, **_source_params(source))["_source"]
+        except NotFoundError:
+            if not history:
+                return None
+            hit = self.find_archived([node_id], source).get(node_id)
+            return hit["_source"] if hit else None
         except Exception:
             return None
+        self._cache_node(node_id, node, source)
+        return dict(node)
+
+    def get_nodes(self, node_ids, source=None, history=False):
+        """
+        Fetch many nodes in one round trip (mget), serving cached nodes from the node cache.
+        Returns a dict of node_id -> source; missing nodes are left out. With history=True
+        nodes missing from the node index are looked up in the history indices (one search).
+        """
+        found = {}
+        missing = []
+        for node_id in dict.fromkeys(node_ids):
+            cached = self._cached_node(node_id, source)
+            if cached is not None:
+                found[node_id] = cached
+            else:
+                missing.append(node_id)
+        if missing:
+            resp = self.es.mget(index=self.node_index, ids=missing, **_source_params(source))
+            for doc in resp.get("docs", []):
+                if doc.get("found"):
+                    found[doc["_id"]] = doc["_source"]
+                    self._cache_node(doc["_id"], doc["_source"], source)
+            if history:
+                for node_id, hit in self.find_archived([i for i in missing if i not in found], source).items():
+                    found[node_id] = hit["_source"]
+        return found
+
+    def find_archived(self, node_ids, source=None):
+        """
+        Search the history indices for nodes by ID. Returns a dict of node_id -> newest hit,
+        with _index, _seq_no and _primary_term for conditional deletes; {} without history.
+        """
+        found = {}
+        missing = list(dict.fromkeys(node_ids)) if self.history_index else []
+        while missing:
+            resp = self.es.search(index=self.history_index, body=self._find_archived_body(missing, source))
+            missing = self._collect_archived(resp, missing, found)
+        return found
+
+    def restore_archived(self, node_ids, merges=None):
+        """
+        Move archived nodes back into the node index, which is the only index written by ID.
+        merges maps a node ID to the (doc, increments) of an upsert that created a new copy
+        meanwhile; they are applied to the archived node as UPSERT_SCRIPT would have.
+        Returns the IDs restored.
+        """
+        archived = self.find_archived(node_ids)
+        if not archived:
+            return []
+        restored = []
+        for ok, item in helpers.streaming_bulk(
+            self.es, self._restore_actions(archived, merges), raise_on_error=False, raise_on_exception=False
+        ):
+            if ok:
+                restored.append(self._bulk_item(item).get("_id"))
+        self._delete_hits([archived[node_id] for node_id in restored])
+        for node_id in restored:
+            self._invalidate_node(node_id)
+        return restored
+
+    def _delete_hits(self, hits, conditional=True, es=None):
+        """
+        Bulk-delete search hits from their own indices, only if unchanged since they were
+        read when conditional. Returns (deleted IDs, IDs that failed or changed meanwhile).
+        """
+        deleted, failed = [], []
+        for ok, item in helpers.streaming_bulk(
+            es or self.es, self._delete_actions(hits, conditional), raise_on_error=False, raise_on_exception=False
+        ):
+            info = self._bulk_item(item)
+            (deleted if ok else failed).append(info.get("_id"))
+        return deleted, failed
+
+    def archive_nodes(self, query, rollover_conditions=None, page_size=500):
+        """
+        Move the nodes matching query from the node index to the history indices. The
+        history write alias is first rolled over if rollover_conditions (e.g. max_age,
+        max_primary_shard_size) are met, so each history index holds one period. A node is
+        only removed from the node index if it did not change since it was copied; one
+        written meanwhile stays and its history copy is dropped. Returns a report.
+        """
+        if not self.history_index:
+            raise ValueError("history indices are not enabled (INCIDENT_HISTORY)")
+        self._create_history()
+        report = {"rolled_over": False, "history_index": None, "archived": 0, "kept": 0, "failed_ids": []}
+        if rollover_conditions:
+            resp = self._long_requests().indices.rollover(alias=self.history_index, conditions=rollover_conditions)
+            report["rolled_over"] = bool(resp.get("rolled_over"))
+            report["history_index"] = resp.get("new_index") if report["rolled_over"] else resp.get("old_index")
+        batch = []
+        for hit in self._iter_hits(self.node_index, query, None, "asc", page_size, "1m", seq_no=True):
+            batch.append(hit)
+            if len(batch) >= page_size:
+                self._archive_batch(batch, report)
+                batch = []
+        if batch:
+            self._archive_batch(batch, report)
+        return report
+
+    def _archive_batch(self, hits, report):
+        def actions():
+            for hit in hits:
+                yield {"_op_type": "index", "_index": self.history_index, "_id": hit["_id"], "_source": hit["_source"]}
+
+        es = self._long_requests()
+        copied = set()
+        for ok, item in helpers.streaming_bulk(es, actions(), raise_on_error=False, raise_on_exception=False):
+            info = self._bulk_item(item)
+            if ok:
+                copied.add(info.get("_id"))
+            else:
+                report["failed_ids"].append(info.get("_id"))
+        deleted, changed = self._delete_hits([hit for hit in hits if hit["_id"] in copied], es=es)
+        for node_id in deleted:
+            self._invalidate_node(node_id)
+        report["archived"] += len(deleted)
+        if changed:
+            # written since it was read: the node index copy is the current one
+            self._delete_hits([{"_index": self.history_index, "_id": node_id} for node_id in changed], conditional=False,
+                              es=es)
+            report["kept"] += len(changed)
 
     def add_edge(self, edge_id, source, target, properties):
-        body = properties.copy()
-        body["edge_id"] = edge_id
-        body["source"] = source
-        body["target"] = target
-        self.es.index(index=self.edge_index, id=edge_id, document=body)
+        self.es.index(index=self.edge_index, id=edge_id, document=self._edge_document(edge_id, source, target, properties))
+
+    def bulk_add_edges(self, edges, chunk_size=500, thread_count=1):
+        """
+        Index (edge_id, source, target, properties) tuples through the bulk API
+        (parallel_bulk when thread_count > 1). Yields (ok, edge_id, error) for every edge.
+        """
+        if thread_count > 1:
+            results = helpers.parallel_bulk(
+                self.es, self._edge_actions(edges), thread_count=thread_count, chunk_size=chunk_size,
+                raise_on_error=False, raise_on_exception=False,
+            )
+        else:
+            results = helpers.streaming_bulk(
+                self.es, self._edge_actions(edges), chunk_size=chunk_size, raise_on_error=False, raise_on_exception=False
+            )
+        for ok, item in results:
+            info = self._bulk_item(item)
+            yield ok, info.get("_id"), None if ok else info.get("error")
 
     def get_edge(self, edge_id):
         try:
@@ -72,126 +941,1090 @@ class ElasticsearchGraph:
         except Exception:
             return None
     
-    def update_node(self, node_id, properties):
+    def update_node(self, node_id, properties=None, script=None):
         """
-        Partially update a node's properties by ID.
+        Partially update a node's properties by ID, or run a painless script on it instead;
+        an archived node is restored first.
         """
-        self.es.update(index=self.node_index, id=node_id, doc=properties)
+        kwargs = self._update_kwargs(properties, script)
+        try:
+            self.es.update(index=self.node_index, id=node_id, **kwargs)
+        except NotFoundError:
+            if not self.restore_archived([node_id]):
+                raise
+            self.es.update(index=self.node_index, id=node_id, **kwargs)
+        self._invalidate_node(node_id)
 
-    def search_nodes(self, query=None, size=10):
+    def search_nodes(self, query=None, size=10, source=None, history=False):
         """
-        Search nodes with an optional Elasticsearch query.
+        Search nodes with an optional Elasticsearch query and _source projection.
         """
         q = query if query is not None else {"match_all": {}}
-        resp = self.es.search(index=self.node_index, query=q, size=size)
+        kwargs = {"source": source} if source is not None else {}
+        resp = self.es.search(index=self._read_index(history), query=q, size=size, **kwargs)
         return [hit["_source"] for hit in resp.get("hits", {}).get("hits", [])]
     
-    def search_by_vector(self, vector, k=10):
+    def search_by_vector(self, vector, k=10, num_candidates=None, filters=None, mode=None, with_scores=False, source=None,
+                         history=False):
         """
         Perform a kNN search on the embedding vector field.
+        mode is "knn" (approximate HNSW search), "exact" (script_score brute force) or
+        "auto" (default, from VECTOR_SEARCH_MODE): kNN when the embedding is indexed,
+        falling back to exact scoring for legacy mappings or if Elasticsearch rejects the
+        kNN request (see _knn_fallback). Other errors are raised.
+        filters are applied as pre-filters (see _incident_filters).
+        With with_scores=True, returns (cosine similarity, source) pairs instead of sources.
+        source is an optional _source projection for the hits. history=True also searches
+        the history indices.
         """
-        # Perform semantic search via script_score using cosine similarity
-        # Filter to incident nodes and rank by similarity to the query vector
-        body = {
-            "size": k,
-            "query": {
-                "script_score": {
-                    "query": {"term": {"type.keyword": {"value": "incident"}}},
-                    "script": {
-                        # cosineSimilarity returns [-1,1]; shift to positive
-                        "source": "cosineSimilarity(params.query_vector, 'embedding') + 1.0",
-                        "params": {"query_vector": vector}
-                    }
-                }
-            }
-        }
-        resp = self.es.search(index=self.node_index, body=body)
-        # Extract source documents from hits
-        return [hit.get("_source", {}) for hit in resp.get("hits", {}).get("hits", [])]
+        index = self._read_index(history)
+        mode = self._vector_mode(mode)
+        if mode == "knn":
+            body = self._knn_body(vector, k, num_candidates, filters, source)
+            try:
+                resp = self.es.search(index=index, body=body)
+            except BadRequestError:
+                if not self._knn_fallback():
+                    raise
+            else:
+                self._knn_succeeded()
+                return self._vector_hits(resp, "knn", with_scores)
+        resp = self.es.search(index=index, body=self._exact_body(vector, k, filters, source))
+        return self._vector_hits(resp, "exact", with_scores)
 
-class IncidentManager:
-    """Manager for handling incident lifecycle using ElasticsearchGraph."""
-    def __init__(self, graph):
+    def search_hybrid(self, text, vector=None, k=10, offset=0, filters=None, num_candidates=None, source=None,
+                      history=False):
+        """
+        Hybrid search: BM25 over title and description plus vector search, sent together
+        in one msearch and fused with reciprocal rank fusion (see _fuse_rrf).
+        Each leg returns its top HYBRID_RANK_WINDOW hits (at least offset + k), so pages
+        further down come from the same fused ranking. Without a vector only the lexical
+        leg runs. Returns the incident sources at positions offset .. offset + k.
+        history=True also searches the history indices.
+        """
+        index = self._read_index(history)
+        window = self._hybrid_window(k, offset)
+        searches, mode = self._hybrid_searches(text, vector, window, filters, num_candidates, source)
+        responses = self.es.msearch(index=index, searches=searches).get("responses", [])
+        if self._knn_failed(responses, mode):
+            responses[1] = self.es.search(index=index, body=self._exact_body(vector, window, filters, source))
+        return self._fuse_rrf(responses, k, offset)
+
+    def iter_nodes(self, query=None, sort_field=None, order="desc", page_size=500, keep_alive="1m", source=None,
+                   history=False, unmapped_type="date"):
+        """
+        Stream every node matching an optional query, sorted by sort_field, in pages of page_size.
+        Uses a point-in-time plus search_after, so memory stays flat and results are not
+        capped by the 10k result window. Yields node sources (projected to source if given).
+        history=True includes the history indices. unmapped_type is the sort field's type
+        for indices that do not map it yet.
+        """
+        return self._iter_index(self._read_index(history), query, sort_field, order, page_size, keep_alive, source,
+                                unmapped_type)
+
+    def iter_archived(self, page_size=500, keep_alive="1m"):
+        """Stream every node of the history indices (PIT + search_after); nothing without history."""
+        if not self.history_index:
+            return iter(())
+        return self._iter_index(self.history_index, None, None, "asc", page_size, keep_alive)
+
+    def iter_edges(self, query=None, page_size=500, keep_alive="1m"):
+        """Stream every edge matching an optional query (PIT + search_after). Yields edge sources."""
+        return self._iter_index(self.edge_index, query, None, "asc", page_size, keep_alive)
+
+    def _iter_index(self, index, query, sort_field, order, page_size, keep_alive, source=None, unmapped_type="date"):
+        for hit in self._iter_hits(index, query, sort_field, order, page_size, keep_alive, source,
+                                   unmapped_type=unmapped_type):
+            yield hit["_source"]
+
+    def _iter_hits(self, index, query, sort_field, order, page_size, keep_alive, source=None, seq_no=False,
+                   unmapped_type="date"):
+        sort = self._pit_sort(sort_field, order, unmapped_type)
+        pit_id = self.es.open_point_in_time(index=index, keep_alive=keep_alive)["id"]
+        try:
+            search_after = None
+            while True:
+                body = self._pit_body(pit_id, keep_alive, query, sort, page_size, search_after, source, seq_no)
+                resp = self.es.search(body=body)
+                # the PIT id may change between requests; always use the latest one
+                pit_id = resp.get("pit_id", pit_id)
+                hits = resp.get("hits", {}).get("hits", [])
+                yield from hits
+                if len(hits) < page_size:
+                    break
+                search_after = hits[-1]["sort"]
+        finally:
+            try:
+                self.es.close_point_in_time(id=pit_id)
+            except Exception:
+                pass
+
+    def search_page(self, query=None, sort_field="updated_at", order="desc", size=10, search_after=None, source=None,
+                    history=False):
+        """
+        Fetch one sorted page of nodes. Returns (sources, cursor) where cursor is the sort
+        values of the last hit (pass it back as search_after), or None on the last page.
+        Stateless, so cursors can be handed to web clients. history=True includes the
+        history indices.
+        """
+        body = self._page_body(query, sort_field, order, size, search_after, source)
+        return self._page_result(self.es.search(index=self._read_index(history), body=body), size)
+
+    def aggregate_nodes(self, query, aggs, runtime_mappings=None, history=False):
+        """
+        Run aggregations over the nodes matching query in one request (no hits returned).
+        Returns (number of matching nodes, aggregations). history=True includes the
+        history indices.
+        """
+        body = self._aggregate_body(query, aggs, runtime_mappings)
+        resp = self.es.search(index=self._read_index(history), body=body)
+        return resp["hits"]["total"]["value"], resp.get("aggregations", {})
+
+    def _keyword_field(self, index, field):
+        """
+        Name of the exact-match variant of a field: the field itself when mapped as keyword,
+        otherwise its dynamic-mapping ".keyword" subfield. Looked up once per index.
+        """
+        key = (index, field)
+        if key not in self._field_cache:
+            name = field
+            try:
+                mapping = self.es.indices.get_mapping(index=index)
+                for index_mapping in mapping.values():
+                    spec = index_mapping.get("mappings", {}).get("properties", {}).get(field, {})
+                    if spec and spec.get("type") != "keyword" and "keyword" in spec.get("fields", {}):
+                        name = f"{field}.keyword"
+            except Exception:
+                pass
+            self._field_cache[key] = name
+        return self._field_cache[key]
+
+    def neighbors(self, node_ids, direction="both", edge_type=None):
+        """
+        Look up the neighbors of one or more nodes with batched terms queries on the edge index.
+        Each batch is one search; a PIT is only opened when a batch has more edges than fit in it.
+        direction is "out" (node is the edge source), "in" (node is the target) or "both".
+        Returns a dict mapping each node ID to the set of neighboring node IDs.
+        """
+        if isinstance(node_ids, str):
+            node_ids = [node_ids]
+        result = {}
+        missing = []
+        for node_id in node_ids:
+            cached = self.adjacency_cache.get(node_id) if self.adjacency_cache is not None else None
+            if cached is not None and (direction, edge_type) in cached:
+                result[node_id] = set(cached[(direction, edge_type)])
+            else:
+                result[node_id] = set()
+                missing.append(node_id)
+        source_field = self._keyword_field(self.edge_index, "source")
+        target_field = self._keyword_field(self.edge_index, "target")
+        for start in range(0, len(missing), TERMS_CHUNK):
+            chunk = missing[start:start + TERMS_CHUNK]
+            wanted = set(chunk)
+            should = []
+            if direction in ("out", "both"):
+                should.append({"terms": {source_field: chunk}})
+            if direction in ("in", "both"):
+                should.append({"terms": {target_field: chunk}})
+            filters = [{"bool": {"should": should, "minimum_should_match": 1}}]
+            if edge_type:
+                filters.append({"term": {self._keyword_field(self.edge_index, "type"): edge_type}})
+            query = {"bool": {"filter": filters}}
+            resp = self.es.search(
+                index=self.edge_index, body={"size": TERMS_CHUNK, "query": query, "_source": ["source", "target"]}
+            )
+            edges = [hit["_source"] for hit in resp.get("hits", {}).get("hits", [])]
+            if len(edges) >= TERMS_CHUNK:
+                # more edges than one search returns: page through all of them with a PIT
+                edges = self.iter_edges(query, page_size=TERMS_CHUNK)
+            for edge in edges:
+                source, target = edge.get("source"), edge.get("target")
+                if direction in ("out", "both") and source in wanted:
+                    result[source].add(target)
+                if direction in ("in", "both") and target in wanted:
+                    result[target].add(source)
+        if self.adjacency_cache is not None:
+            for node_id in missing:
+                cached = dict(self.adjacency_cache.get(node_id) or {})
+                cached[(direction, edge_type)] = frozenset(result[node_id])
+                self.adjacency_cache.set(node_id, cached)
+        return result
+
+    def traverse(self, start_ids, max_hops=3, direction="both", edge_type=None):
+        """
+        Breadth-first traversal from one or more start nodes, up to max_hops edges away.
+        Each level is expanded with one batched neighbor lookup for the whole frontier.
+        Returns a dict mapping every reached node ID to its hop distance (start nodes are 0).
+        """
+        if isinstance(start_ids, str):
+            start_ids = [start_ids]
+        depths = {node_id: 0 for node_id in start_ids}
+        frontier = list(depths)
+        for hop in range(1, max_hops + 1):
+            if not frontier:
+                break
+            adjacency = self.neighbors(frontier, direction=direction, edge_type=edge_type)
+            next_frontier = []
+            for node_id in frontier:
+                for neighbor in adjacency.get(node_id, ()):
+                    if neighbor not in depths:
+                        depths[neighbor] = hop
+                        next_frontier.append(neighbor)
+            frontier = next_frontier
+        return depths
+
+    def migrate_vector_index(self, target_index=None, replace=True, dims=None, index_type=None, model=None):
+        """
+        Copy the node index into a new index whose embedding is indexed for kNN, optionally
+        with another vector storage (index_type, see _embedding_mapping) or fewer dimensions.
+        With dims below the current size every stored embedding is truncated and renormalized
+        during the reindex (only meaningful for text-embedding-3 models; set
+        EMBEDDING_DIMENSIONS to the same value so new embeddings match). Truncated vectors made
+        by model (default: EMBEDDING_MODEL) are relabeled as its shortened version, so they
+        are not re-embedded as stale; vectors of other models keep their label.
+        With replace=True the old index is deleted and an alias with its name is pointed
+        at the new index in one atomic step, so clients keep using the same name.
+        Returns the name of the new index.
+        """
+        target_index = target_index or f"{self.node_index}-knn"
+        current = self.es.indices.get_mapping(index=self.node_index)
+        source_index = next(iter(current))
+        mappings = current[source_index].get("mappings", {})
+        props = dict(mappings.get("properties", {}))
+        current_dims = props.get("embedding", {}).get("dims", embedding_dims())
+        dims = dims or current_dims
+        if dims > current_dims:
+            raise ValueError(f"Cannot grow embeddings from {current_dims} to {dims} dimensions; re-embed instead")
+        props["embedding"] = self._embedding_mapping(dims, index_type)
+        body = {"mappings": dict(mappings, properties=props)}
+        settings = self._index_settings()
+        if settings:
+            body["settings"] = settings
+        self.es.indices.create(index=target_index, body=body)
+        script = None
+        if dims < current_dims:
+            model = model or os.getenv("EMBEDDING_MODEL", embeddings.DEFAULT_MODEL)
+            script = {"source": TRUNCATE_EMBEDDING_SCRIPT, "lang": "painless",
+                      "params": {"dims": dims, "model": model}}
+        # waits for the whole copy, which takes far longer than a normal request
+        self._long_requests().reindex(
+            source={"index": self.node_index},
+            dest={"index": target_index},
+            script=script,
+            wait_for_completion=True,
+            refresh=True,
+        )
+        if replace:
+            # also re-points the alias when node_index already is one (a repeated migration)
+            self.es.indices.update_aliases(actions=[
+                {"remove_index": {"index": source_index}},
+                {"add": {"index": target_index, "alias": self.node_index}},
+            ])
+        else:
+            self.node_index = target_index
+        if self.node_cache is not None:
+            # cached nodes may hold the old vectors
+            self.node_cache.clear()
+        self.vector_indexed = True
+        _write_bootstrap_marker(self._bootstrap_key(), True)
+        return target_index
+
+# Runtime field for the dashboard: milliseconds from created_at to resolved_at
+# (incidents resolved before resolved_at was recorded fall back to updated_at)
+RESOLUTION_TIME_SCRIPT = (
+    "def end = doc.containsKey('resolved_at') && doc['resolved_at'].size() > 0 "
+    "? doc['resolved_at'] : doc['updated_at']; "
+    "if (doc['created_at'].size() > 0 && end.size() > 0) { "
+    "emit(end.value.toInstant().toEpochMilli() - doc['created_at'].value.toInstant().toEpochMilli()); }"
+)
+
+_stats_cache = None
+_stats_cache_lock = threading.Lock()
+
+def shared_stats_cache():
+    """
+    The process-wide RollupCache for IncidentManager.incident_stats(), shared by every manager
+    in the process so writes through any of them (e.g. asgi.py's async one) invalidate it.
+    STATS_CACHE_TTL (seconds, default 30), STATS_CACHE_MIN_AGE (seconds, default 2).
+    """
+    global _stats_cache
+    if _stats_cache is None:
+        with _stats_cache_lock:
+            if _stats_cache is None:
+                _stats_cache = RollupCache(
+                    ttl=float(os.getenv("STATS_CACHE_TTL", "30")),
+                    min_age=float(os.getenv("STATS_CACHE_MIN_AGE", "2")),
+                )
+    return _stats_cache
+
+class IncidentManagerBase:
+    """
+    Incident rules without any I/O: document shapes, alert correlation, queries and stats
+    rollups. Shared by IncidentManager and the AsyncIncidentManager in aio.py.
+    """
+    def __init__(self, graph, embedder=None, vector_index=None, correlator=None, stats_cache=None, feed=None):
         self.graph = graph
+        # shared, cached embedding provider (see embeddings.py)
+        self.embedder = embedder or embeddings.get_provider()
+        # optional in-process hot index of open incidents (see vector_index.py)
+        self.vector_index = vector_index
+        # optional near-duplicate alert correlation (see correlate.py)
+        self.correlator = correlator
+        # EMBED_ON_WRITE=false stores incidents at once and leaves embedding to embed_pending()
+        self.embed_on_write = os.getenv("EMBED_ON_WRITE", "true").lower() in ("1", "true", "yes")
+        # dashboard rollups, marked stale by every incident write
+        self.stats_cache = stats_cache if stats_cache is not None else shared_stats_cache()
+        # live updates for the UI, fed with the IDs of every written incident
+        self.feed = feed if feed is not None else changefeed.shared_feed()
+
+    def _changed(self, incident_ids):
+        """After a write: mark the dashboard rollups stale and push the incidents to the change feed."""
+        self.stats_cache.invalidate()
+        self.feed.publish(incident_ids)
+
+    def _index_locally(self, incident_id, props):
+        """Keep the local vector index in step with a write to an incident."""
+        if self.vector_index is None:
+            return
+        status = props.get("status")
+        if status is not None and status not in vector_index.OPEN_STATUSES:
+            self.vector_index.remove(incident_id)
+        elif incident_id in self.vector_index:
+            # partial update: merge into the fields we already hold for this incident
+            self.vector_index.update_doc(incident_id, props)
+            if props.get("embedding"):
+                self.vector_index.upsert(incident_id, props["embedding"])
+        elif props.get("embedding") and props.get("title"):
+            self.vector_index.upsert(incident_id, props["embedding"], dict(props, node_id=incident_id))
+        # other partial writes are picked up by the next resync
+
+    def _correlation_query(self):
+        """Open incidents created by alerts that fired within the correlation window."""
+        return {"bool": {"filter": [
+            {"term": {"type.keyword": {"value": "incident"}}},
+            {"terms": {"status.keyword": list(vector_index.OPEN_STATUSES)}},
+            {"exists": {"field": "alert_fingerprint"}},
+            {"range": {"updated_at": {"gte": f"now-{int(self.correlator.window)}s"}}},
+        ]}}
+
+    @staticmethod
+    def _correlation_entry(doc):
+        try:
+            updated = datetime.fromisoformat(doc.get("updated_at")).replace(tzinfo=timezone.utc).timestamp()
+        except (TypeError, ValueError):
+            updated = 0.0
+        return doc.get("node_id"), doc.get("alert_fingerprint"), updated
+
+    def _correlate(self, alerts):
+        """
+        Split alerts into those written to their own incident and near-duplicates of a recent
+        open incident. Own alerts get their fingerprint attached; near-duplicates are returned
+        as (alert, incident_id, new_link) and need no embedding or incident of their own.
+        """
+        if self.correlator is None:
+            return alerts, []
+        own, attached = [], []
+        for alert in alerts:
+            fp = correlate.fingerprint(alert)
+            target, new_link = self.correlator.match(alert["incident_id"], fp)
+            if target is None or target == alert["incident_id"]:
+                if target is None:
+                    # later alerts, in this batch too, can attach to this one
+                    self.correlator.remember(alert["incident_id"], fp)
+                own.append(dict(alert, fingerprint=fp))
+            else:
+                attached.append((alert, target, new_link))
+        return own, attached
+
+    def _attachment_writes(self, attached, now):
+        """
+        Upserts and edges for near-duplicate alerts: one fire_count bump per absorbing
+        incident, and a duplicate_of edge the first time an alert is linked to it.
+        """
+        counts = {}
+        upserts = {}
+        edges = []
+        for alert, target, new_link in attached:
+            fired = alert.get("fire_count", 1)
+            counts[target] = counts.get(target, 0) + fired
+            if target not in upserts:
+                doc = {"status": "Triggered", "updated_at": now, "last_fired_at": now}
+                # only used if the incident was deleted in the meantime
+                _, new = self._alert_upsert(alert, None, now)
+                upserts[target] = (target, doc, new)
+            if new_link:
+                edges.append((
+                    f"{alert['incident_id']}:duplicate_of:{target}", alert["incident_id"], target,
+                    {"type": "duplicate_of", "title": alert["title"], "created_at": now},
+                ))
+        return [
+            item + ({"fire_count": counts[target], "correlated_alerts": counts[target]},)
+            for target, item in upserts.items()
+        ], edges
+
+    def _alert_writes(self, alerts, vectors, attached, now):
+        """
+        Upserts (node_id, doc, upsert, increments) and duplicate_of edges for a batch of
+        correlated alerts; fire_count grows by the number of merged firings.
+        """
+        upserts = []
+        for alert, vec in zip(alerts, vectors):
+            doc, new = self._alert_upsert(alert, vec, now)
+            upserts.append((alert["incident_id"], doc, new, {"fire_count": alert.get("fire_count", 1)}))
+        extra, edges = self._attachment_writes(attached, now)
+        return upserts + extra, edges
 
-    def create_incident(self, incident_id, title, description, priority, assigned_to=None):
-        props = {
+    def _alerts_written(self, upserts, failed):
+        """After an alert write: publish the incidents written and keep the local vector index in step."""
+        self._changed([node_id for node_id, _, _, _ in upserts if node_id not in failed])
+        if self.vector_index is not None:
+            for node_id, doc, new, _ in upserts:
+                if node_id not in failed:
+                    self._index_locally(node_id, doc if node_id in self.vector_index else new)
+
+    def _embedding_fields(self, vec):
+        """
+        Fields that store an incident's embedding. When it is missing (EMBED_ON_WRITE=false,
+        OpenAI failing or its circuit open) the incident is flagged for embed_pending() instead.
+        """
+        if vec is not None:
+            return {"embedding": vec, "embedding_model": self.embedder.version, "embedding_pending": False}
+        if self.embedder.available():
+            return {"embedding_pending": True}
+        return {}
+
+    def stale_embedding_query(self, include_unversioned=False, after=None):
+        """
+        Query for incidents whose embedding needs (re)computing: missing, pending, or made by
+        another model or size than the current one (embedding_model). Incidents embedded before
+        embedding_model was recorded are only included with include_unversioned=True.
+        after restricts it to node IDs sorting after a checkpointed one.
+        """
+        stale = [
+            {"bool": {"must_not": [{"exists": {"field": "embedding"}}]}},
+            {"term": {"embedding_pending": True}},
+            {"bool": {
+                "filter": [{"exists": {"field": "embedding_model"}}],
+                "must_not": [{"term": {"embedding_model.keyword": self.embedder.version}}],
+            }},
+        ]
+        if include_unversioned:
+            stale.append({"bool": {"must_not": [{"exists": {"field": "embedding_model"}}]}})
+        clauses = self.graph._incident_filters()
+        if after is not None:
+            clauses.append({"range": {"node_id.keyword": {"gt": after}}})
+        return {"bool": {"filter": clauses, "should": stale, "minimum_should_match": 1}}
+
+    @staticmethod
+    def _new_incident(title, description, priority, assigned_to=None):
+        now = datetime.utcnow().isoformat()
+        return {
             "type": "incident",
             "title": title,
             "description": description,
             "status": "New",
             "priority": priority,
             "assigned_to": assigned_to,
-            "created_at": datetime.utcnow().isoformat(),
-            "updated_at": datetime.utcnow().isoformat(),
+            "created_at": now,
+            "updated_at": now,
+        }
+
+    def _alert_upsert(self, alert, vec, now):
+        """Merge document and new-incident document for an alert firing."""
+        doc = {
+            "description": alert["description"],
+            "status": "Triggered",
+            "priority": alert["priority"],
+            "updated_at": now,
+            "last_fired_at": now,
+        }
+        new = {
+            "type": "incident",
+            "title": alert["title"],
+            "description": alert["description"],
+            "status": "New",
+            "priority": alert["priority"],
+            "assigned_to": None,
+            "created_at": now,
+            "updated_at": now,
+            "last_fired_at": now,
+        }
+        doc.update(self._embedding_fields(vec))
+        new.update(self._embedding_fields(vec))
+        if alert.get("fingerprint"):
+            doc["alert_fingerprint"] = alert["fingerprint"]
+            new["alert_fingerprint"] = alert["fingerprint"]
+        return doc, new
+
+    def _incident_created(self, incident_id, props):
+        self._index_locally(incident_id, props)
+        self._changed([incident_id])
+
+    @staticmethod
+    def _edit_fields(title=None, description=None, status=None, priority=None, assigned_to=None):
+        """The fields an update_incident() call sets (its embedding is added separately)."""
+        fields = {}
+        for field, value in [("title", title), ("description", description), ("status", status), ("priority", priority), ("assigned_to", assigned_to)]:
+            if value is not None:
+                fields[field] = value
+        return fields
+
+    def _incident_updated(self, incident_id, fields):
+        self._index_locally(incident_id, fields)
+        self._changed([incident_id])
+        status = fields.get("status")
+        if self.correlator is not None and status is not None and status not in vector_index.OPEN_STATUSES:
+            # resolved incidents stop absorbing new alerts
+            self.correlator.forget(incident_id)
+
+    @staticmethod
+    def _edge_request(source_id, target_id, relation="related_to", properties=None):
+        """(edge_id, properties) of a typed edge created by link()."""
+        edge_id = f"{source_id}:{relation}:{target_id}"
+        return edge_id, dict(properties or {}, type=relation, created_at=datetime.utcnow().isoformat())
+
+    @staticmethod
+    def _list_request(sort_by, page_token=None):
+        """(query, search_after) for a page of incidents sorted by sort_by."""
+        if sort_by not in SORT_FIELDS:
+            raise ValueError(f"sort_by must be one of {SORT_FIELDS}")
+        search_after = _decode_page_token(page_token) if page_token else None
+        return {"term": {"type": {"value": "incident"}}}, search_after
+
+    @staticmethod
+    def _updated_since_query(since):
+        return {"bool": {"filter": [
+            {"term": {"type": {"value": "incident"}}},
+            {"range": {"updated_at": {"gte": since}}},
+        ]}}
+
+    @staticmethod
+    def _status_script(fields):
+        """
+        Update script for an edit that sets the status: resolved_at (time to resolve on the
+        dashboard, and the archive cutoff) is stamped only when the incident goes from an open
+        status to a resolved one. None for edits that leave the status alone.
+        """
+        if "status" not in fields:
+            return None
+        return {"source": RESOLVE_UPDATE_SCRIPT, "lang": "painless",
+                "params": {"doc": fields, "open": list(vector_index.OPEN_STATUSES)}}
+
+    @staticmethod
+    def archive_query(days):
+        """Resolved and closed incidents resolved (or, lacking resolved_at, last updated) over days ago."""
+        cutoff = f"now-{days}d"
+        return {"bool": {
+            "filter": [{"term": {"type.keyword": {"value": "incident"}}}],
+            "must_not": [{"terms": {"status.keyword": list(vector_index.OPEN_STATUSES)}}],
+            "should": [
+                {"range": {"resolved_at": {"lt": cutoff}}},
+                {"bool": {
+                    "must_not": [{"exists": {"field": "resolved_at"}}],
+                    "filter": [{"range": {"updated_at": {"lt": cutoff}}}],
+                }},
+            ],
+            "minimum_should_match": 1,
+        }}
+
+    def _stats_request(self, days):
+        """(query, aggs, runtime_mappings) of the incident_stats() request."""
+        resolved = {"bool": {"must_not": [{"terms": {"status.keyword": list(vector_index.OPEN_STATUSES)}}]}}
+        aggs = {
+            "by_status": {"terms": {"field": "status.keyword", "size": 20}},
+            "by_priority": {"terms": {"field": "priority.keyword", "size": 20}},
+            "by_assignee": {"terms": {"field": "assigned_to.keyword", "size": 20, "missing": "Unassigned"}},
+            "recent": {
+                "filter": {"range": {"created_at": {"gte": f"now-{days}d/d"}}},
+                "aggs": {"per_day": {"date_histogram": {
+                    "field": "created_at", "calendar_interval": "day", "format": "yyyy-MM-dd",
+                    "min_doc_count": 0, "extended_bounds": {"min": f"now-{days}d/d", "max": "now/d"},
+                }}},
+            },
+            "resolved": {
+                "filter": resolved,
+                "aggs": {
+                    "time_to_resolve": {"percentiles": {"field": "resolution_ms", "percents": [50, 90, 99]}},
+                    "mean_time_to_resolve": {"avg": {"field": "resolution_ms"}},
+                },
+            },
         }
+        query = {"bool": {"filter": self.graph._incident_filters()}}
+        runtime = {"resolution_ms": {"type": "long", "script": {"source": RESOLUTION_TIME_SCRIPT}}}
+        return query, aggs, runtime
+
+    @staticmethod
+    def _stats_result(total, aggs, days):
+        def counts(name):
+            return {b["key"]: b["doc_count"] for b in aggs.get(name, {}).get("buckets", [])}
+
+        def minutes(ms):
+            return round(ms / 60000.0, 1) if ms is not None else None
+
+        by_status = counts("by_status")
+        resolved = aggs.get("resolved", {})
+        percentiles = resolved.get("time_to_resolve", {}).get("values") or {}
+        per_day = aggs.get("recent", {}).get("per_day", {}).get("buckets", [])
+        return {
+            "total": total,
+            "open": sum(by_status.get(status, 0) for status in vector_index.OPEN_STATUSES),
+            "by_status": by_status,
+            "by_priority": counts("by_priority"),
+            "by_assignee": counts("by_assignee"),
+            "created_per_day": [{"date": b["key_as_string"], "count": b["doc_count"]} for b in per_day],
+            "resolved": resolved.get("doc_count", 0),
+            "time_to_resolve_minutes": {
+                "mean": minutes(resolved.get("mean_time_to_resolve", {}).get("value")),
+                "p50": minutes(percentiles.get("50.0")),
+                "p90": minutes(percentiles.get("90.0")),
+                "p99": minutes(percentiles.get("99.0")),
+            },
+            "days": days,
+            "generated_at": datetime.utcnow().isoformat(),
+        }
+
+    def _skips_local_index(self, filters, mode, history):
+        """Whether a semantic search goes straight to Elasticsearch instead of the local vector index."""
+        return self.vector_index is None or mode or history or not vector_index.supports_filters(filters)
+
+    def _local_search(self, vector, k, filters):
+        """Local vector index hits as (cosine, doc), and whether they answer the search on their own."""
+        local = self.vector_index.search(vector, k, filters=filters)
+        return local, vector_index.covers_statuses(filters) and self._local_results_enough(local, k)
+
+    @staticmethod
+    def _local_results_enough(local, k):
+        min_score = float(os.getenv("LOCAL_VECTOR_INDEX_MIN_SCORE", "0.8"))
+        return len(local) >= k and local[-1][0] >= min_score
+
+    @staticmethod
+    def _merge_results(local, tail, k):
+        """Merge local and Elasticsearch (score, doc) lists by cosine, dropping duplicates."""
+        seen = {doc.get("node_id") for _, doc in local}
+        merged = local + [(score, doc) for score, doc in tail if doc.get("node_id") not in seen]
+        merged.sort(key=lambda pair: pair[0], reverse=True)
+        return [doc for _, doc in merged[:k]]
+
+@telemetry.trace_methods("incidents")
+class IncidentManager(IncidentManagerBase):
+    """Manager for handling incident lifecycle using ElasticsearchGraph."""
+    def resync_vector_index(self):
+        """Reload the local vector index with all open incidents that have embeddings."""
+        self.vector_index.replace_all((doc.get("node_id"), doc) for doc in self.graph.iter_nodes(OPEN_INCIDENTS_QUERY))
+
+    def resync_correlator(self):
+        """Reload the alert correlation window with the recent alert incidents of all workers."""
+        docs = self.graph.iter_nodes(self._correlation_query(), source=CORRELATION_SOURCE)
+        self.correlator.replace_all(self._correlation_entry(doc) for doc in docs)
+
+    def _embed(self, text):
+        """Return the embedding for text, or None if embeddings are unavailable or fail."""
+        if not self.embedder.available():
+            return None
+        try:
+            return self.embedder.embed(text)
+        except Exception:
+            return None
+
+    def write_embeddings(self, docs, vectors, chunk_size=500):
+        """
+        Store vectors for docs (node sources with node_id) with bulk partial updates.
+        Returns (number written, IDs that failed).
+        """
+        fields = {doc["node_id"]: self._embedding_fields(vec) for doc, vec in zip(docs, vectors)}
+        written, failed = 0, []
+        for ok, node_id, _ in self.graph.bulk_update_nodes(list(fields.items()), chunk_size=chunk_size):
+            if ok:
+                written += 1
+                self._index_locally(node_id, fields[node_id])
+            else:
+                failed.append(node_id)
+        return written, failed
+
+    def embed_pending(self, batch_size=100, limit=None):
+        """
+        Embed the incidents stored without an embedding, batch_size descriptions per API
+        request, and write the vectors back with bulk partial updates. Stops at the first
+        failed embedding request so a later run can pick up where this one left off.
+        Returns a dict with the number of incidents embedded and failed.
+        """
+        report = {"embedded": 0, "failed": 0, "error": None}
+        if not self.embedder.available():
+            report["error"] = "embeddings are not configured"
+            return report
+        docs = self.graph.iter_nodes(EMBEDDING_PENDING_QUERY, source={"includes": ["node_id", "description"]})
+        batch = []
+        seen = 0
+        for doc in docs:
+            if limit is not None and seen >= limit:
+                break
+            seen += 1
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                if not self._embed_batch(batch, report):
+                    return report
+                batch = []
+        if batch:
+            self._embed_batch(batch, report)
+        return report
+
+    def _embed_batch(self, docs, report):
+        try:
+            vectors = self.embedder.embed_many([doc.get("description") or "" for doc in docs])
+        except Exception as e:
+            report["error"] = str(e)
+            return False
+        written, failed = self.write_embeddings(docs, vectors)
+        report["embedded"] += written
+        report["failed"] += len(failed)
+        return True
+
+    def create_incident(self, incident_id, title, description, priority, assigned_to=None, if_absent=False):
+        """
+        Create an incident. With if_absent=True an existing incident is left untouched
+        and False is returned (a single conditional write, no read).
+        """
+        props = self._new_incident(title, description, priority, assigned_to)
         # compute embedding for semantic search if OpenAI key is provided
-        api_key = os.getenv("OPENAI_API_KEY")
-        if api_key:
-            openai.api_key = api_key
-            model = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+        vec = self._embed(description) if self.embed_on_write else None
+        props.update(self._embedding_fields(vec))
+        # index node with embedding vector
+        if if_absent:
+            if not self.graph.create_node(incident_id, props):
+                return False
+        else:
+            self.graph.add_node(incident_id, props)
+        self._incident_created(incident_id, props)
+        return True
+
+    def bulk_import(self, records, batch_size=500, chunk_size=500, thread_count=1):
+        """
+        Import incidents from an iterable of dicts (id, title, description, priority, ...).
+        Descriptions are embedded in multi-input batches and documents are written with
+        the bulk API. Yields a report dict per batch with throughput and failed IDs.
+        """
+        batch = []
+        number = 0
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                number += 1
+                yield self._import_batch(number, batch, chunk_size, thread_count)
+                batch = []
+        if batch:
+            number += 1
+            yield self._import_batch(number, batch, chunk_size, thread_count)
+
+    def _import_batch(self, number, records, chunk_size, thread_count):
+        started = time.monotonic()
+        failed = []
+        nodes = []
+        now = datetime.utcnow().isoformat()
+        for record in records:
+            if not isinstance(record, dict):
+                failed.append("<invalid record>")
+                continue
+            if record.get("_error"):
+                failed.append(record["_error"])
+                continue
+            incident_id = str(record.get("id") or record.get("node_id") or "").strip()
+            if not incident_id or not record.get("title") or not record.get("description"):
+                failed.append(incident_id or "<missing id>")
+                continue
+            nodes.append((incident_id, {
+                "type": "incident",
+                "title": record["title"],
+                "description": record["description"],
+                "status": record.get("status") or "New",
+                "priority": record.get("priority") or "Medium",
+                "assigned_to": record.get("assigned_to") or None,
+                "created_at": record.get("created_at") or now,
+                "updated_at": record.get("updated_at") or record.get("created_at") or now,
+            }))
+        # embed all descriptions of the batch in as few API requests as possible
+        vectors = [None] * len(nodes)
+        if nodes and self.embed_on_write and self.embedder.available():
             try:
-                if hasattr(openai, 'embeddings') and hasattr(openai.embeddings, 'create'):
-                    emb_resp = openai.embeddings.create(model=model, input=description)
-                else:
-                    emb_resp = openai.Embedding.create(model=model, input=description)
-                # extract embedding vector
-                if hasattr(emb_resp, 'data'):
-                    vec = emb_resp.data[0].embedding
-                else:
-                    vec = emb_resp['data'][0]['embedding']
-                props['embedding'] = vec
+                vectors = self.embedder.embed_many([props["description"] for _, props in nodes])
             except Exception:
                 pass
-        # index node with embedding vector
-        self.graph.add_node(incident_id, props)
+        for (_, props), vec in zip(nodes, vectors):
+            props.update(self._embedding_fields(vec))
+        indexed_ids = []
+        by_id = dict(nodes) if self.vector_index is not None else {}
+        for ok, node_id, _ in self.graph.bulk_add_nodes(nodes, chunk_size=chunk_size, thread_count=thread_count):
+            if ok:
+                indexed_ids.append(node_id)
+                if node_id in by_id:
+                    self._index_locally(node_id, by_id[node_id])
+            else:
+                failed.append(node_id)
+        if indexed_ids:
+            self._changed(indexed_ids)
+        indexed = len(indexed_ids)
+        elapsed = time.monotonic() - started
+        return {
+            "batch": number,
+            "records": len(records),
+            "indexed": indexed,
+            "failed_ids": failed,
+            "seconds": round(elapsed, 3),
+            "docs_per_sec": round(indexed / elapsed, 1) if elapsed > 0 else None,
+        }
+
+    def record_alert(self, incident_id, title, description, priority):
+        """
+        Create-or-update the incident for an alert firing with exactly one write and no read.
+        A new incident starts with fire_count 1; an existing one is set to "Triggered",
+        gets the latest description/priority and has fire_count incremented.
+        With a correlator, a near-duplicate of another recent open incident is counted on
+        that incident instead (and linked to it with a duplicate_of edge).
+        Returns "created", "updated" or "correlated".
+        """
+        alert = {"incident_id": incident_id, "title": title, "description": description, "priority": priority}
+        now = datetime.utcnow().isoformat()
+        self._refresh_correlator()
+        own, attached = self._correlate([alert])
+        if attached:
+            upserts, edges = self._attachment_writes(attached, now)
+            for target, doc, new, increments in upserts:
+                self.graph.upsert_node(target, doc, new, increments=increments)
+                self._index_locally(target, doc)
+            for edge_id, source, target, props in edges:
+                self.graph.add_edge(edge_id, source, target, props)
+            self._changed([target for target, _, _, _ in upserts])
+            return "correlated"
+        alert = own[0]
+        vec = self._embed(description) if self.embed_on_write else None
+        doc, new = self._alert_upsert(alert, vec, now)
+        resp = self.graph.upsert_node(incident_id, doc, new, increments={"fire_count": 1})
+        self._changed([incident_id])
+        if self.vector_index is not None:
+            self._index_locally(incident_id, doc if incident_id in self.vector_index else new)
+        return resp.get("result")
+
+    def apply_alerts(self, alerts):
+        """
+        Write a batch of coalesced alerts (see ingest.AlertQueue) with one bulk request.
+        New incidents are created; existing ones get the latest description, status
+        "Triggered" and priority, and fire_count grows by the number of merged firings.
+        Near-duplicates found by the correlator are only counted on the incident they match.
+        Returns the IDs of the incidents (and duplicate_of edges) that failed to write.
+        """
+        now = datetime.utcnow().isoformat()
+        self._refresh_correlator()
+        alerts, attached = self._correlate(alerts)
+        vectors = [None] * len(alerts)
+        if alerts and self.embed_on_write and self.embedder.available():
+            try:
+                vectors = self.embedder.embed_many([a["description"] for a in alerts])
+            except Exception:
+                pass
+        upserts, edges = self._alert_writes(alerts, vectors, attached, now)
+        failed = []
+        for ok, node_id, _ in self.graph.bulk_upsert_nodes(upserts):
+            if not ok:
+                failed.append(node_id)
+        if edges:
+            for ok, edge_id, _ in self.graph.bulk_add_edges(edges):
+                if not ok:
+                    failed.append(edge_id)
+        self._alerts_written(upserts, failed)
+        return failed
 
-    def get_incident(self, incident_id):
-        incident = self.graph.get_node(incident_id)
+    def _refresh_correlator(self):
+        if self.correlator is None or not self.correlator.needs_resync():
+            return
+        try:
+            self.resync_correlator()
+        except Exception:
+            pass
+
+    def get_incident(self, incident_id, source=SOURCE_NO_EMBEDDING, history=True):
+        incident = self.graph.get_node(incident_id, source=source, history=history)
         if incident and incident.get("type") == "incident":
             return incident
         return None
 
+    def incident_rows(self, incident_ids):
+        """Current list and detail fields of these incidents (one mget), for the change feed."""
+        nodes = self.graph.get_nodes(incident_ids, source=SOURCE_FEED)
+        return [doc for doc in nodes.values() if doc.get("type") == "incident"]
+
+    def incidents_updated_since(self, since, size=200):
+        """Incidents with updated_at at or after since, newest first (at most size)."""
+        rows, _ = self.graph.search_page(
+            query=self._updated_since_query(since), sort_field="updated_at", order="desc", size=size, source=SOURCE_FEED
+        )
+        return rows
+
     def update_incident(self, incident_id, title=None, description=None, status=None, priority=None, assigned_to=None):
-        fields = {}
-        for field, value in [("title", title), ("description", description), ("status", status), ("priority", priority), ("assigned_to", assigned_to)]:
-            if value is not None:
-                fields[field] = value
+        fields = self._edit_fields(title, description, status, priority, assigned_to)
         # if description changed, recompute embedding vector
         if "description" in fields:
-            api_key = os.getenv("OPENAI_API_KEY")
-            if api_key:
-                openai.api_key = api_key
-                model = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
-                try:
-                    if hasattr(openai, 'embeddings') and hasattr(openai.embeddings, 'create'):
-                        emb_resp = openai.embeddings.create(model=model, input=fields["description"])
-                    else:
-                        emb_resp = openai.Embedding.create(model=model, input=fields["description"])
-                    # extract embedding vector
-                    if hasattr(emb_resp, 'data'):
-                        vec = emb_resp.data[0].embedding
-                    else:
-                        vec = emb_resp['data'][0]['embedding']
-                    fields['embedding'] = vec
-                except Exception:
-                    pass
+            vec = self._embed(fields["description"]) if self.embed_on_write else None
+            fields.update(self._embedding_fields(vec))
         if not fields:
             return False
         fields["updated_at"] = datetime.utcnow().isoformat()
-        self.graph.update_node(incident_id, fields)
+        self.graph.update_node(incident_id, fields, script=self._status_script(fields))
+        self._incident_updated(incident_id, fields)
         return True
 
-    def list_incidents(self, size=10):
-        # List all incidents ordered by created_at (not implemented sort yet)
-        query = {"term": {"type": {"value": "incident"}}}
-        return self.graph.search_nodes(query=query, size=size)
-    
-    def search_semantic(self, vector, k=10):
+    def link(self, source_id, target_id, relation="related_to", properties=None):
+        """Create (or overwrite) a typed edge between two nodes, e.g. incident -> service."""
+        edge_id, props = self._edge_request(source_id, target_id, relation, properties)
+        self.graph.add_edge(edge_id, source_id, target_id, props)
+        return edge_id
+
+    def related_incidents(self, node_id, max_hops=3, direction="both", edge_type=None):
+        """
+        Incidents within max_hops of a node (an incident, service, host, ...), nearest first.
+        Each returned incident carries its hop distance as "hops".
+        """
+        depths = self.graph.traverse(node_id, max_hops=max_hops, direction=direction, edge_type=edge_type)
+        depths.pop(node_id, None)
+        if not depths:
+            return []
+        nodes = self.graph.get_nodes(list(depths), source=SOURCE_NO_EMBEDDING, history=True)
+        incidents = [dict(doc, hops=depths[node_id]) for node_id, doc in nodes.items() if doc.get("type") == "incident"]
+        incidents.sort(key=lambda inc: (inc["hops"], inc["node_id"]))
+        return incidents
+
+    def list_incidents(self, size=10, sort_by="updated_at", order="desc", history=False):
+        # List incidents, most recently updated first by default
+        return self.list_incidents_page(size=size, sort_by=sort_by, order=order, history=history)[0]
+
+    def list_incidents_page(self, size=10, sort_by="updated_at", order="desc", page_token=None, history=False):
+        """
+        Return (incidents, next_page_token) for one page of incidents sorted by
+        updated_at or created_at. next_page_token is None on the last page.
+        Archived incidents are only listed with history=True.
+        """
+        query, search_after = self._list_request(sort_by, page_token)
+        incidents, cursor = self.graph.search_page(
+            query=query, sort_field=sort_by, order=order, size=size, search_after=search_after, source=SOURCE_LIST,
+            history=history,
+        )
+        return incidents, _encode_page_token(cursor) if cursor else None
+
+    def iter_incidents(self, sort_by="updated_at", order="desc", page_size=500, source=SOURCE_NO_EMBEDDING, history=False):
+        """
+        Stream all incidents in sort order with constant memory (PIT + search_after).
+        Pass source=None to include the embeddings, history=True to include archived incidents.
+        """
+        query, _ = self._list_request(sort_by)
+        return self.graph.iter_nodes(
+            query=query, sort_field=sort_by, order=order, page_size=page_size, source=source, history=history
+        )
+
+    def archive_resolved(self, days=None, rollover=True):
+        """
+        Move incidents resolved more than days (default ARCHIVE_AFTER_DAYS, 30) ago to the
+        history indices, rolling the history alias over first once its write index is older
+        than HISTORY_ROLLOVER_MAX_AGE (30d) or a primary shard is larger than
+        HISTORY_ROLLOVER_MAX_SIZE (50gb). Returns the archive_nodes() report.
+        """
+        if days is None:
+            days = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+        conditions = None
+        if rollover:
+            conditions = {
+                "max_age": os.getenv("HISTORY_ROLLOVER_MAX_AGE", "30d"),
+                "max_primary_shard_size": os.getenv("HISTORY_ROLLOVER_MAX_SIZE", "50gb"),
+            }
+        return self.graph.archive_nodes(self.archive_query(days), rollover_conditions=conditions)
+
+    def incident_stats(self, days=30):
+        """
+        Dashboard rollups from one aggregation request: counts by status, priority and
+        assignee, incidents created per day over the last `days` days, and time-to-resolve
+        percentiles (minutes) of resolved and closed incidents. Served from stats_cache.
+        """
+        return self.stats_cache.get_or_compute((self.graph.node_index, days), lambda: self._compute_stats(days))
+
+    def _compute_stats(self, days):
+        # archived incidents still count towards totals and time to resolve
+        total, aggs = self.graph.aggregate_nodes(*self._stats_request(days), history=True)
+        return self._stats_result(total, aggs, days)
+
+    def search_semantic(self, vector, k=10, filters=None, num_candidates=None, mode=None, history=False):
         """
-        Semantic search for incidents using a vector via kNN.
+        Semantic search for incidents using a vector via kNN. Results leave out the embedding.
+        With a local vector index, open incidents are ranked in-process. Elasticsearch is only
+        queried for the long tail (other incidents) when the local results are too few or too
+        weak (k-th cosine below LOCAL_VECTOR_INDEX_MIN_SCORE), or when the status filter asks
+        for other statuses, and the two lists are merged.
+        Archived incidents are only searched with history=True, which skips the local index.
         """
-        return self.graph.search_by_vector(vector, k)
+        if self._skips_local_index(filters, mode, history):
+            return self.graph.search_by_vector(
+                vector, k, num_candidates=num_candidates, filters=filters, mode=mode, source=SOURCE_NO_EMBEDDING,
+                history=history,
+            )
+        if self.vector_index.needs_resync():
+            try:
+                self.resync_vector_index()
+            except Exception:
+                return self.graph.search_by_vector(
+                    vector, k, num_candidates=num_candidates, filters=filters, source=SOURCE_NO_EMBEDDING, history=history
+                )
+        local, enough = self._local_search(vector, k, filters)
+        if enough:
+            return [doc for _, doc in local]
+        tail = self.graph.search_by_vector(
+            vector, k, num_candidates=num_candidates, filters=filters, with_scores=True, source=SOURCE_NO_EMBEDDING,
+            history=history,
+        )
+        return self._merge_results(local, tail, k)
+
+    def search_hybrid(self, text, vector=None, k=10, offset=0, filters=None, num_candidates=None, history=False,
+                      embed=True):
+        """
+        Hybrid lexical + semantic search for incidents (see ElasticsearchGraph.search_hybrid).
+        Exact hostnames, error codes and rule IDs are found by BM25 even when the embedding
+        ranks them poorly. The query text is embedded here when no vector is given and embed
+        is true (pass embed=False when embedding it already failed); without embeddings the
+        search is lexical only.
+        """
+        if vector is None and embed:
+            vector = self._embed(text)
+        return self.graph.search_hybrid(
+            text, vector, k=k, offset=offset, filters=filters, num_candidates=num_candidates, source=SOURCE_NO_EMBEDDING,
+            history=history,
+        )
+
+def _read_records(path, fmt=None):
+    """
+    Stream incident records from an NDJSON or CSV file ('-' reads stdin).
+    The format is taken from the file extension unless given explicitly.
+    Unparseable lines yield an {"_error": ...} record that the import reports as failed.
+    """
+    if fmt is None:
+        fmt = "csv" if path.lower().endswith(".csv") else "ndjson"
+    stream = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+    try:
+        if fmt == "csv":
+            for row in csv.DictReader(stream):
+                yield row
+        else:
+            for number, line in enumerate(stream, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    yield {"_error": f"line {number}: invalid JSON"}
+                    continue
+                if not isinstance(record, dict):
+                    yield {"_error": f"line {number}: not a JSON object"}
+                    continue
+                yield record
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
 
 def _parse_args():
     parser = argparse.ArgumentParser(prog="incident_manager", description="Incident management CLI")
@@ -221,6 +2054,87 @@ def _parse_args():
     # list
     pl = sub.add_parser("list", help="List incidents")
     pl.add_argument("-n", "--number", type=int, default=10, help="Number of incidents to list")
+    pl.add_argument("--all", action="store_true", help="Stream every incident (ignores --number)")
+    pl.add_argument("--sort", choices=["updated_at", "created_at"], default="updated_at", help="Sort field")
+    pl.add_argument("--order", choices=["asc", "desc"], default="desc", help="Sort order")
+    pl.add_argument("--history", action="store_true", help="Include archived incidents (INCIDENT_HISTORY)")
+
+    # bulk-import
+    pb = sub.add_parser("bulk-import", help="Bulk import incidents from NDJSON or CSV")
+    pb.add_argument("file", help="Input file path, or '-' for stdin")
+    pb.add_argument("-f", "--format", choices=["ndjson", "csv"], help="Input format (default: from file extension, else ndjson)")
+    pb.add_argument("-b", "--batch-size", type=int, default=500, help="Records per embedding/bulk batch")
+    pb.add_argument("-c", "--chunk-size", type=int, default=500, help="Documents per bulk request")
+    pb.add_argument("-j", "--concurrency", type=int, default=1, help="Parallel bulk threads (1 uses streaming_bulk)")
+
+    # link
+    pk = sub.add_parser("link", help="Link two nodes (e.g. an incident and a service)")
+    pk.add_argument("source", help="Source node ID")
+    pk.add_argument("target", help="Target node ID")
+    pk.add_argument("-r", "--relation", default="related_to", help="Relation type (default: related_to)")
+
+    # related
+    pr = sub.add_parser("related", help="List incidents within N hops of a node")
+    pr.add_argument("id", help="Start node ID (incident, service, ...)")
+    pr.add_argument("--hops", type=int, default=3, help="Maximum number of hops (default: 3)")
+    pr.add_argument("--direction", choices=["out", "in", "both"], default="both", help="Edge direction to follow")
+    pr.add_argument("-r", "--relation", help="Only follow edges of this relation type")
+
+    # search
+    ps = sub.add_parser("search", help="Hybrid (keyword + semantic) incident search")
+    ps.add_argument("query", help="Search text, e.g. a hostname, error code or description")
+    ps.add_argument("-k", "--number", type=int, default=10, help="Number of results (default: 10)")
+    ps.add_argument("--offset", type=int, default=0, help="Skip this many results (pagination)")
+    ps.add_argument("-s", "--status", action="append", help="Only incidents with this status (repeatable)")
+    ps.add_argument("-p", "--priority", action="append", help="Only incidents with this priority (repeatable)")
+    ps.add_argument("--since", help="Only incidents updated since this date (e.g. now-7d)")
+    ps.add_argument("--history", action="store_true", help="Include archived incidents (INCIDENT_HISTORY)")
+
+    # embed-pending
+    pe = sub.add_parser("embed-pending", help="Embed incidents stored without an embedding (EMBED_ON_WRITE=false or OpenAI down)")
+    pe.add_argument("-b", "--batch-size", type=int, default=100, help="Descriptions per embedding request")
+    pe.add_argument("--limit", type=int, help="Embed at most this many incidents")
+
+    # reembed
+    pre = sub.add_parser("reembed", help="Embed incidents with a missing, pending or outdated embedding (resumable)")
+    pre.add_argument("-b", "--batch-size", type=int, default=100, help="Descriptions per embedding request")
+    pre.add_argument("-j", "--workers", type=int, default=4, help="Batches embedded in parallel")
+    pre.add_argument("--rpm", type=int, default=int(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "0")),
+                     help="Max embedding requests per minute across workers (default: EMBEDDING_REQUESTS_PER_MINUTE, 0 = no limit)")
+    pre.add_argument("--checkpoint", help="Progress file (default: reembed-<index>.json in the current directory)")
+    pre.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint and start from the beginning")
+    pre.add_argument("--include-unversioned", action="store_true",
+                     help="Also re-embed incidents embedded before the model was recorded")
+    pre.add_argument("--limit", type=int, help="Process at most this many incidents")
+
+    # export / import
+    px = sub.add_parser("export", help="Export the incident and edge indices to a compressed NDJSON snapshot")
+    px.add_argument("directory", help="Snapshot directory (created if missing)")
+    px.add_argument("-z", "--compression", choices=["gzip", "zstd", "none"], default="gzip", help="Default: gzip")
+    px.add_argument("--embeddings", choices=["inline", "sidecar", "exclude"], default="inline",
+                    help="Keep vectors in the NDJSON, move them to a float32 sidecar file, or leave them out")
+    px.add_argument("--page-size", type=int, default=1000, help="Documents per search page")
+    pi = sub.add_parser("import", help="Import a snapshot written by export")
+    pi.add_argument("directory", help="Snapshot directory")
+    pi.add_argument("-c", "--chunk-size", type=int, default=500, help="Documents per bulk request")
+    pi.add_argument("-j", "--concurrency", type=int, default=4, help="Parallel bulk threads (1 uses streaming_bulk)")
+    pi.add_argument("--skip-embeddings", action="store_true",
+                    help="Drop the vectors and mark incidents for embed-pending (e.g. to switch models)")
+
+    # archive
+    pa = sub.add_parser("archive", help="Move long-resolved incidents to the history indices (INCIDENT_HISTORY)")
+    pa.add_argument("--days", type=int, help="Archive incidents resolved more than this many days ago (default: ARCHIVE_AFTER_DAYS, 30)")
+    pa.add_argument("--no-rollover", action="store_true", help="Do not roll the history alias over first")
+
+    # init-indices
+    sub.add_parser("init-indices", help="Create the incident and edge indices and their mappings")
+
+    # migrate-knn
+    pm = sub.add_parser("migrate-knn", help="Reindex incidents into an index with a kNN-indexed embedding")
+    pm.add_argument("--target", help="New index name (default: <index>-knn)")
+    pm.add_argument("--keep-old", action="store_true", help="Keep the old index instead of replacing it with an alias")
+    pm.add_argument("--index-type", choices=VECTOR_INDEX_TYPES, help="Vector storage (default: EMBEDDING_INDEX_TYPE, else the Elasticsearch default)")
+    pm.add_argument("--dims", type=int, help="Truncate stored embeddings to this many dimensions (text-embedding-3 models)")
 
     return parser.parse_args()
 
@@ -242,20 +2156,9 @@ def main():
         print("Please update .env with valid Elasticsearch credentials instead of placeholders.")
         return
 
-    # Initialize Elasticsearch client, support both Cloud ID and direct URL
+    # Initialize Elasticsearch client, support both Cloud ID and direct URL (see clients.py)
     try:
-        if cloud_id.startswith("http://") or cloud_id.startswith("https://"):
-            # Treat cloud_id as the Elasticsearch host URL
-            es = Elasticsearch(
-                hosts=[cloud_id],
-                api_key=api_key
-            )
-        else:
-            # Treat cloud_id as an Elastic Cloud ID
-            es = Elasticsearch(
-                cloud_id=cloud_id,
-                api_key=api_key
-            )
+        es = clients.elasticsearch_client(cloud_id, api_key)
     except ValueError as e:
         print(f"Error initializing Elasticsearch client: {e}")
         return
@@ -268,6 +2171,13 @@ def main():
 
     # Determine Elasticsearch index for incidents
     incident_index = os.getenv("ELASTICSEARCH_INDEX", "incidents")
+    if args.command == "init-indices":
+        graph = ElasticsearchGraph(es, node_index=incident_index, bootstrap="never")
+        graph.init_indices()
+        print(f"Indices {graph.node_index} and {graph.edge_index} are ready (kNN-indexed embedding: {graph.vector_indexed}).")
+        if graph.history_index:
+            print(f"History alias {graph.history_index} and its index template are ready.")
+        return
     graph = ElasticsearchGraph(es, node_index=incident_index)
     manager = IncidentManager(graph)
 
@@ -297,9 +2207,129 @@ def main():
         else:
             print(f"No updates applied to incident {args.id}.")
     elif args.command == "list":
-        incidents = manager.list_incidents(size=args.number)
-        for inc in incidents:
-            print(json.dumps(inc, indent=2))
+        # stream NDJSON, one incident per line, with constant memory
+        page_size = 500 if args.all else max(min(args.number, 500), 1)
+        incidents = manager.iter_incidents(sort_by=args.sort, order=args.order, page_size=page_size, history=args.history)
+        for count, inc in enumerate(incidents):
+            if not args.all and count >= args.number:
+                break
+            sys.stdout.write(json.dumps(inc) + "\n")
+    elif args.command == "bulk-import":
+        total = 0
+        failed_ids = []
+        started = time.monotonic()
+        records = _read_records(args.file, args.format)
+        for report in manager.bulk_import(
+            records, batch_size=args.batch_size, chunk_size=args.chunk_size, thread_count=args.concurrency
+        ):
+            total += report["indexed"]
+            failed_ids.extend(report["failed_ids"])
+            print(
+                f"Batch {report['batch']}: {report['indexed']}/{report['records']} indexed "
+                f"in {report['seconds']}s ({report['docs_per_sec']} docs/s)",
+                file=sys.stderr,
+            )
+        elapsed = time.monotonic() - started
+        print(f"Imported {total} incidents in {elapsed:.1f}s; {len(failed_ids)} failed.")
+        for failed_id in failed_ids:
+            print(f"FAILED {failed_id}")
+    elif args.command == "link":
+        edge_id = manager.link(args.source, args.target, relation=args.relation)
+        print(f"Edge {edge_id} created.")
+    elif args.command == "search":
+        filters = {"status": args.status, "priority": args.priority, "since": args.since}
+        results = manager.search_hybrid(args.query, k=args.number, offset=args.offset, filters=filters, history=args.history)
+        for inc in results:
+            sys.stdout.write(json.dumps(inc) + "\n")
+    elif args.command == "related":
+        for inc in manager.related_incidents(args.id, max_hops=args.hops, direction=args.direction, edge_type=args.relation):
+            sys.stdout.write(json.dumps(inc) + "\n")
+    elif args.command == "embed-pending":
+        report = manager.embed_pending(batch_size=args.batch_size, limit=args.limit)
+        print(f"Embedded {report['embedded']} incidents; {report['failed']} failed to write.")
+        if report["error"]:
+            print(f"Stopped early: {report['error']}", file=sys.stderr)
+            sys.exit(1)
+    elif args.command == "reembed":
+        import reembed
+        job = reembed.ReembedJob(
+            manager, batch_size=args.batch_size, workers=args.workers, requests_per_minute=args.rpm,
+            checkpoint_path=args.checkpoint or f"reembed-{graph.node_index}.json",
+            include_unversioned=args.include_unversioned, limit=args.limit,
+        )
+        if args.restart:
+            job.clear_checkpoint()
+        if not manager.embedder.available():
+            print("Embeddings are not configured (set OPENAI_API_KEY).")
+            sys.exit(1)
+
+        def progress(report):
+            print(f"Embedded {report['embedded']} (up to {report['after']}) at {report['docs_per_sec']} docs/s", file=sys.stderr)
+
+        report = job.run(progress)
+        print(f"Embedded {report['embedded']} incidents in {report['seconds']}s ({report['docs_per_sec']} docs/s); "
+              f"{len(report['failed_ids'])} failed to write.")
+        for failed_id in report["failed_ids"]:
+            print(f"FAILED {failed_id}")
+        if report["error"]:
+            print(f"Stopped early: {report['error']}. Run the command again to resume.", file=sys.stderr)
+            sys.exit(1)
+    elif args.command == "export":
+        import snapshot
+        try:
+            manifest = snapshot.export_graph(
+                graph, args.directory, compression=args.compression, embeddings=args.embeddings, page_size=args.page_size,
+                progress=lambda name, count: print(f"Exported {count} {name}", file=sys.stderr),
+            )
+        except (ValueError, RuntimeError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"Exported {manifest['nodes']} nodes and {manifest['edges']} edges to {args.directory} "
+              f"in {manifest['seconds']}s.")
+    elif args.command == "import":
+        import snapshot
+        try:
+            report = snapshot.import_graph(
+                graph, args.directory, chunk_size=args.chunk_size, thread_count=args.concurrency,
+                skip_embeddings=args.skip_embeddings, expected_dims=embedding_dims(),
+            )
+        except (ValueError, RuntimeError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"Imported {report['nodes']} nodes ({report['archived']} archived) and {report['edges']} edges "
+              f"in {report['seconds']}s; "
+              f"{len(report['failed_ids'])} failed.")
+        for failed_id in report["failed_ids"]:
+            print(f"FAILED {failed_id}")
+        if args.skip_embeddings:
+            print("Run `python main.py embed-pending` to embed the imported incidents.")
+    elif args.command == "archive":
+        if not graph.history_index:
+            print("Set INCIDENT_HISTORY=true to archive incidents to history indices.")
+            sys.exit(1)
+        report = manager.archive_resolved(days=args.days, rollover=not args.no_rollover)
+        if report["rolled_over"]:
+            print(f"Rolled {graph.history_index} over to {report['history_index']}.")
+        print(f"Archived {report['archived']} incidents to {graph.history_index}; "
+              f"{report['kept']} changed meanwhile and were kept, {len(report['failed_ids'])} failed.")
+        for failed_id in report["failed_ids"]:
+            print(f"FAILED {failed_id}")
+    elif args.command == "migrate-knn":
+        old_index = graph.node_index
+        try:
+            new_index = graph.migrate_vector_index(
+                args.target, replace=not args.keep_old, dims=args.dims, index_type=args.index_type,
+                model=manager.embedder.model,
+            )
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        if args.keep_old:
+            print(f"Reindexed {old_index} into {new_index}. Set ELASTICSEARCH_INDEX={new_index} to use it.")
+        else:
+            print(f"Reindexed {old_index} into {new_index}; {old_index} is now an alias for it.")
+        if args.dims:
+            print(f"Set EMBEDDING_DIMENSIONS={args.dims} so new and query embeddings have the same size.")
     else:
         print("No command specified. Use -h for help.")
 
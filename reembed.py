@@ -0,0 +1,213 @@
+"""
+Resumable backfill that (re)computes incident embeddings: `python main.py reembed`.
+
+Finds incidents whose embedding is missing, pending or made by another model or size
+(see IncidentManager.stale_embedding_query), embeds their descriptions in batches on a
+thread pool, and writes the vectors back with bulk partial updates. Incidents are visited
+in node ID order, and after every batch the ID up to which all batches are done is saved
+to a checkpoint file, so an interrupted run continues from there. If the point in time
+expires while batches are embedded, the scan is reopened after the last fetched ID.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import clients
+from elasticsearch import NotFoundError
+
+logger = logging.getLogger(__name__)
+
+class RateLimiter:
+    """
+    Spaces requests across threads to at most per_minute (0 disables the limit).
+    pause() holds every caller back, e.g. for the Retry-After of a 429 response.
+    """
+    def __init__(self, per_minute=0):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
+def _retry_after(exc):
+    """Seconds to wait after a rate-limited (429) embeddings request, or None for other errors."""
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    if status != 429:
+        return None
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return max(float(headers.get("retry-after", 10)), 1.0)
+    except (TypeError, ValueError):
+        return 10.0
+
+class ReembedJob:
+    """
+    One backfill run. workers batches are embedded concurrently; requests_per_minute caps
+    the embedding requests of all workers together. Rate-limited batches wait and are
+    retried up to max_retries times; any other failure (or an open OpenAI circuit) stops
+    the run after the batches in flight, keeping the checkpoint at the last finished one.
+    """
+    def __init__(self, manager, batch_size=100, workers=4, requests_per_minute=0, checkpoint_path=None,
+                 include_unversioned=False, limit=None, max_retries=5):
+        self.manager = manager
+        self.batch_size = batch_size
+        self.workers = max(workers, 1)
+        self.limiter = RateLimiter(requests_per_minute)
+        self.checkpoint_path = checkpoint_path
+        self.include_unversioned = include_unversioned
+        self.limit = limit
+        self.max_retries = max_retries
+
+    def _load_checkpoint(self):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return {}
+        with open(self.checkpoint_path, encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        # a checkpoint of another index or model does not apply to this run
+        if checkpoint.get("index") != self.manager.graph.node_index or checkpoint.get("model") != self.manager.embedder.version:
+            return {}
+        return checkpoint
+
+    def _save_checkpoint(self, report):
+        if not self.checkpoint_path:
+            return
+        tmp = f"{self.checkpoint_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(dict(report, index=self.manager.graph.node_index, model=self.manager.embedder.version), f)
+        os.replace(tmp, self.checkpoint_path)
+
+    def clear_checkpoint(self):
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def _batches(self, after, limit):
+        query = self.manager.stale_embedding_query(self.include_unversioned, after)
+        docs = self.manager.graph.iter_nodes(
+            query, sort_field="node_id.keyword", order="asc", source={"includes": ["node_id", "description"]},
+            unmapped_type="keyword",
+        )
+        batch = []
+        seen = 0
+        for doc in docs:
+            if limit is not None and seen >= limit:
+                break
+            seen += 1
+            batch.append(doc)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _run_batch(self, docs):
+        texts = [doc.get("description") or "" for doc in docs]
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                vectors = self.manager.embedder.embed_many(texts, batch_size=len(texts))
+                break
+            except clients.CircuitOpenError:
+                raise
+            except Exception as e:
+                wait_for = _retry_after(e)
+                if wait_for is None or attempt == self.max_retries:
+                    raise
+                logger.warning("Embeddings rate limited; retrying in %.0fs", wait_for)
+                self.limiter.pause(wait_for)
+        return self.manager.write_embeddings(docs, vectors)
+
+    def run(self, progress=None):
+        """
+        Process every stale incident (or up to limit). progress(report) is called after
+        each batch. Returns the report: embedded, failed_ids, after (checkpoint), seconds,
+        docs_per_sec, error and done (False if the run stopped early).
+        """
+        checkpoint = self._load_checkpoint()
+        report = {
+            "embedded": checkpoint.get("embedded", 0),
+            "failed_ids": checkpoint.get("failed_ids", []),
+            "after": checkpoint.get("after"),
+            "error": None,
+            "done": False,
+        }
+        started = time.monotonic()
+        embedded_before = report["embedded"]
+        inflight = deque()
+        fetched_after = report["after"]
+        fetched = 0
+        reopened = False
+        batches = self._batches(fetched_after, self.limit)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="reembed") as pool:
+            exhausted = False
+            while True:
+                while not exhausted and report["error"] is None and len(inflight) < self.workers * 2:
+                    try:
+                        batch = next(batches, None)
+                    except NotFoundError as e:
+                        # the point in time expired while the batches in flight were embedded:
+                        # scan again after the last batch handed out (once, a missing index fails)
+                        if reopened:
+                            report["error"] = str(e)
+                            break
+                        logger.warning("Search context expired; reopening after %s", fetched_after)
+                        reopened = True
+                        remaining = None if self.limit is None else self.limit - fetched
+                        batches = self._batches(fetched_after, remaining)
+                        continue
+                    reopened = False
+                    if batch is None:
+                        exhausted = True
+                    else:
+                        fetched += len(batch)
+                        fetched_after = batch[-1]["node_id"]
+                        inflight.append((batch[-1]["node_id"], pool.submit(self._run_batch, batch)))
+                if not inflight:
+                    break
+                wait([future for _, future in inflight], return_when=FIRST_COMPLETED)
+                # the checkpoint only moves past batches that finished in order
+                while inflight and inflight[0][1].done():
+                    last_id, future = inflight.popleft()
+                    try:
+                        written, failed = future.result()
+                    except Exception as e:
+                        if report["error"] is None:
+                            report["error"] = str(e)
+                        # later batches are not checkpointed; a rerun picks up those that were not written
+                        for _, other in inflight:
+                            other.cancel()
+                        wait([other for _, other in inflight])
+                        inflight.clear()
+                        break
+                    report["embedded"] += written
+                    report["failed_ids"].extend(failed)
+                    report["after"] = last_id
+                    self._save_checkpoint(report)
+                    if progress is not None:
+                        progress(self._with_rate(report, started, embedded_before))
+            if report["error"] is None:
+                report["done"] = True
+        batches.close()
+        if report["done"]:
+            # incidents that turn stale later may sort before the checkpoint: start over next time
+            self.clear_checkpoint()
+        return self._with_rate(report, started, embedded_before)
+
+    @staticmethod
+    def _with_rate(report, started, embedded_before):
+        elapsed = time.monotonic() - started
+        done = report["embedded"] - embedded_before
+        return dict(report, seconds=round(elapsed, 3), docs_per_sec=round(done / elapsed, 1) if elapsed > 0 else None)
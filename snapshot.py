@@ -0,0 +1,237 @@
+"""
+Streaming export and import of the node and edge indices: `python main.py export|import`.
+
+A snapshot is a directory:
+
+  manifest.json           indices, document counts, compression and embedding layout
+  nodes.ndjson[.gz|.zst]  one node source per line; archived nodes (INCIDENT_HISTORY) are
+                          marked "archived": true and imported back into the history indices
+  edges.ndjson[.gz|.zst]  one edge source per line
+  embeddings.f32          (embeddings="sidecar") raw little-endian float32 vectors, one row per
+                          node that has an embedding; the node line holds its row as embedding_row
+
+Export reads the indices with a point in time (ElasticsearchGraph.iter_nodes/iter_archived/iter_edges)
+and import writes through the bulk helpers, so memory stays flat whatever the index size.
+The sidecar can be mapped without parsing:
+numpy.memmap("embeddings.f32", dtype="<f4", mode="r").reshape(-1, manifest["dims"]).
+"""
+import gzip
+import io
+import itertools
+import json
+import os
+import sys
+import time
+from array import array
+from datetime import datetime, timezone
+
+FORMAT_VERSION = 1
+COMPRESSIONS = ("gzip", "zstd", "none")
+EMBEDDING_MODES = ("inline", "sidecar", "exclude")
+SUFFIXES = {"gzip": ".gz", "zstd": ".zst", "none": ""}
+MANIFEST = "manifest.json"
+SIDECAR = "embeddings.f32"
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd compression needs the zstandard package (pip install zstandard)")
+    return zstandard
+
+def _open_write(path, compression):
+    if compression == "gzip":
+        # level 6 is much faster than gzip's default 9 for about the same size on JSON
+        return gzip.open(path, "wt", encoding="utf-8", compresslevel=6)
+    if compression == "zstd":
+        raw = open(path, "wb")
+        return io.TextIOWrapper(_zstandard().ZstdCompressor(level=3).stream_writer(raw), encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+def _open_read(path, compression):
+    if compression == "gzip":
+        return gzip.open(path, "rt", encoding="utf-8")
+    if compression == "zstd":
+        raw = open(path, "rb")
+        return io.TextIOWrapper(_zstandard().ZstdDecompressor().stream_reader(raw, closefd=True), encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+def _data_file(name, compression):
+    return f"{name}.ndjson{SUFFIXES[compression]}"
+
+def _float32_bytes(vector):
+    row = array("f", vector)
+    if sys.byteorder != "little":
+        row.byteswap()
+    return row.tobytes()
+
+def _float32_list(data):
+    row = array("f")
+    row.frombytes(data)
+    if sys.byteorder != "little":
+        row.byteswap()
+    return row.tolist()
+
+def _dump(doc):
+    return json.dumps(doc, separators=(",", ":"), ensure_ascii=False) + "\n"
+
+def export_graph(graph, directory, compression="gzip", embeddings="inline", page_size=1000, progress=None):
+    """
+    Write every node and edge of graph to a snapshot in directory (created if missing).
+    embeddings is "inline" (kept in the node lines), "sidecar" (moved to embeddings.f32) or
+    "exclude" (dropped; nodes are marked embedding_pending so embed-pending restores them).
+    progress(name, count) is called every 10,000 documents. Returns the manifest.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"compression must be one of {', '.join(COMPRESSIONS)}")
+    if embeddings not in EMBEDDING_MODES:
+        raise ValueError(f"embeddings must be one of {', '.join(EMBEDDING_MODES)}")
+    os.makedirs(directory, exist_ok=True)
+    started = time.monotonic()
+    manifest = {
+        "format": FORMAT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "node_index": graph.node_index,
+        "edge_index": graph.edge_index,
+        "compression": compression,
+        "embeddings": embeddings,
+        "dims": None,
+    }
+    sidecar = open(os.path.join(directory, SIDECAR), "wb") if embeddings == "sidecar" else None
+    try:
+        count = rows = archived = 0
+        with _open_write(os.path.join(directory, _data_file("nodes", compression)), compression) as out:
+            current = ((doc, False) for doc in graph.iter_nodes(page_size=page_size))
+            history = ((doc, True) for doc in graph.iter_archived(page_size=page_size))
+            for doc, is_archived in itertools.chain(current, history):
+                if is_archived:
+                    doc["archived"] = True
+                    archived += 1
+                vector = doc.get("embedding")
+                if vector and embeddings != "inline":
+                    del doc["embedding"]
+                    if sidecar is not None:
+                        if manifest["dims"] is None:
+                            manifest["dims"] = len(vector)
+                        elif len(vector) != manifest["dims"]:
+                            raise ValueError(f"node {doc.get('node_id')} has a {len(vector)}-dim embedding, "
+                                             f"expected {manifest['dims']}")
+                        sidecar.write(_float32_bytes(vector))
+                        doc["embedding_row"] = rows
+                        rows += 1
+                    else:
+                        doc.pop("embedding_model", None)
+                        doc["embedding_pending"] = True
+                elif vector and manifest["dims"] is None:
+                    manifest["dims"] = len(vector)
+                out.write(_dump(doc))
+                count += 1
+                if progress is not None and count % 10000 == 0:
+                    progress("nodes", count)
+        manifest["nodes"] = count
+        manifest["archived"] = archived
+        manifest["embedding_rows"] = rows
+    finally:
+        if sidecar is not None:
+            sidecar.close()
+    count = 0
+    with _open_write(os.path.join(directory, _data_file("edges", compression)), compression) as out:
+        for doc in graph.iter_edges(page_size=page_size):
+            out.write(_dump(doc))
+            count += 1
+            if progress is not None and count % 10000 == 0:
+                progress("edges", count)
+    manifest["edges"] = count
+    manifest["seconds"] = round(time.monotonic() - started, 3)
+    # the manifest is written last, so a snapshot without one is incomplete
+    with open(os.path.join(directory, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        raise ValueError(f"{directory} is not a complete snapshot (no {MANIFEST})")
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ValueError(f"unsupported snapshot format {manifest.get('format')}")
+    return manifest
+
+def _iter_lines(path, compression):
+    with _open_read(path, compression) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def iter_nodes(directory, manifest=None, skip_embeddings=False, archived=None):
+    """
+    Stream (node_id, properties) pairs from a snapshot, with sidecar embeddings put back
+    in place. With skip_embeddings, vectors are dropped and nodes marked embedding_pending.
+    archived=True or False streams only the archived or only the current nodes.
+    """
+    manifest = manifest or read_manifest(directory)
+    sidecar = None
+    if manifest.get("embedding_rows") and not skip_embeddings:
+        sidecar = open(os.path.join(directory, SIDECAR), "rb")
+        row_size = manifest["dims"] * 4
+    try:
+        for doc in _iter_lines(os.path.join(directory, _data_file("nodes", manifest["compression"])), manifest["compression"]):
+            if archived is not None and doc.pop("archived", False) != archived:
+                continue
+            doc.pop("archived", None)
+            row = doc.pop("embedding_row", None)
+            if skip_embeddings:
+                if row is not None or doc.pop("embedding", None) is not None:
+                    doc.pop("embedding_model", None)
+                    doc["embedding_pending"] = True
+            elif row is not None:
+                # rows are written in node order, so reading them is sequential
+                sidecar.seek(row * row_size)
+                doc["embedding"] = _float32_list(sidecar.read(row_size))
+            yield doc.pop("node_id"), doc
+    finally:
+        if sidecar is not None:
+            sidecar.close()
+
+def iter_edges(directory, manifest=None):
+    """Stream (edge_id, source, target, properties) tuples from a snapshot."""
+    manifest = manifest or read_manifest(directory)
+    for doc in _iter_lines(os.path.join(directory, _data_file("edges", manifest["compression"])), manifest["compression"]):
+        yield doc.pop("edge_id"), doc.pop("source"), doc.pop("target"), doc
+
+def import_graph(graph, directory, chunk_size=500, thread_count=4, skip_embeddings=False, expected_dims=None):
+    """
+    Load a snapshot into graph's indices with parallel bulk requests (documents with the
+    same ID are overwritten). Archived nodes go back to the history indices, or to the node
+    index when graph has no history. expected_dims guards against loading vectors of another
+    size than the index maps. Returns a report with counts, failed IDs and seconds.
+    """
+    manifest = read_manifest(directory)
+    if (not skip_embeddings and expected_dims and manifest.get("dims")
+            and manifest["dims"] != expected_dims and manifest["embeddings"] != "exclude"):
+        raise ValueError(f"snapshot embeddings have {manifest['dims']} dims but the index expects {expected_dims}; "
+                         "import with --skip-embeddings and re-embed, or set EMBEDDING_DIMENSIONS")
+    started = time.monotonic()
+    report = {"nodes": 0, "archived": 0, "edges": 0, "failed_ids": []}
+    passes = [(False, False)]
+    if manifest.get("archived"):
+        passes.append((True, bool(graph.history_index)))
+    for archived, to_history in passes:
+        for ok, node_id, _ in graph.bulk_add_nodes(
+            iter_nodes(directory, manifest, skip_embeddings, archived=archived),
+            chunk_size=chunk_size, thread_count=thread_count, archived=to_history,
+        ):
+            if ok:
+                report["nodes"] += 1
+                if to_history:
+                    report["archived"] += 1
+            else:
+                report["failed_ids"].append(node_id)
+    for ok, edge_id, _ in graph.bulk_add_edges(iter_edges(directory, manifest), chunk_size=chunk_size, thread_count=thread_count):
+        if ok:
+            report["edges"] += 1
+        else:
+            report["failed_ids"].append(edge_id)
+    report["seconds"] = round(time.monotonic() - started, 3)
+    return report
@@ -1,13 +1,26 @@
-import os
-from opentelemetry import trace
-from opentelemetry.sdk.resources import Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+import contextlib
+import functools
+import inspect
 import logging
+import os
+import threading
+import time
+
+# The OpenTelemetry SDK and gRPC exporters are imported on first use, and only when
+# an exporter is configured, so processes without tracing start faster.
 
 # Module-level guard to ensure tracer provider is only set up once
 _tracer_provider_initialized = False
+# Same for the meter provider; caches registered for hit/miss export by name
+_meter_provider_initialized = False
+_caches = {}
+_stats = {}
+# Metric instruments and tracer for the hot-path helpers below: None until first use,
+# False when no exporter is configured (every helper is then a cheap no-op)
+_instruments = None
+_instruments_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
 
 def _configure_logging():
     """Configure Python logging for OpenTelemetry debug output."""
@@ -23,11 +36,23 @@ def _configure_logging():
     ):
         logging.getLogger(name).setLevel(logging.DEBUG)
 
+def _export_configured():
+    """Telemetry is only collected when an OTLP endpoint, Prometheus or the console exporter is configured."""
+    return (
+        bool(os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"))
+        or os.getenv("OTEL_CONSOLE_EXPORTER", "").lower() in ("1", "true", "yes")
+        or os.getenv("METRICS_EXPORTER", "").lower() == "prometheus"
+    )
+
 def _setup_tracer_provider():
     global _tracer_provider_initialized
     if _tracer_provider_initialized:
         return
     _tracer_provider_initialized = True
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
     # Read OTLP exporter endpoint and headers from environment
     endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
     # Ensure endpoint URI includes scheme (default to https)
@@ -37,7 +62,13 @@ def _setup_tracer_provider():
     service_name = os.getenv("OTEL_SERVICE_NAME", "langcommander")
 
     resource = Resource.create({"service.name": service_name})
-    provider = TracerProvider(resource=resource)
+    # TRACE_SAMPLE_RATIO keeps that fraction of new traces (children follow their parent);
+    # without it the SDK default applies, which honours OTEL_TRACES_SAMPLER/OTEL_TRACES_SAMPLER_ARG
+    sampler = None
+    if os.getenv("TRACE_SAMPLE_RATIO"):
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+        sampler = ParentBased(TraceIdRatioBased(float(os.getenv("TRACE_SAMPLE_RATIO"))))
+    provider = TracerProvider(resource=resource, sampler=sampler)
     trace.set_tracer_provider(provider)
 
     # OTLP gRPC exporter
@@ -47,10 +78,9 @@ def _setup_tracer_provider():
         header_items = []
         if token:
             header_items = [("authorization", token)]
-        # Debug: print header_items to stderr so we can confirm exactly what's sent
-        import sys
-        print(f"OTLP metadata headers: {header_items}", file=sys.stderr)
+        logger.debug("OTLP endpoint %s, authorization header %s", endpoint, "set" if token else "not set")
         # Create OTLP gRPC exporter with explicit metadata
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
         exporter = OTLPSpanExporter(endpoint=endpoint, headers=header_items)
         span_processor = BatchSpanProcessor(exporter)
         provider.add_span_processor(span_processor)
@@ -63,8 +93,88 @@ def _setup_tracer_provider():
         provider.add_span_processor(SimpleSpanProcessor(console_exporter))
     # Note: tracer provider is initialized here; instrumentation functions will use it
 
+def _otlp_endpoint_and_headers():
+    endpoint = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+    if endpoint and not endpoint.lower().startswith(("http://", "https://")):
+        endpoint = f"https://{endpoint}"
+    token = os.getenv("OTEL_EXPORTER_OTLP_HEADERS", "").strip().strip('"').strip("'")
+    return endpoint, [("authorization", token)] if token else []
+
+def _setup_meter_provider():
+    global _meter_provider_initialized
+    if _meter_provider_initialized:
+        return
+    _meter_provider_initialized = True
+    from opentelemetry import metrics
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+    from opentelemetry.sdk.resources import Resource
+
+    endpoint, header_items = _otlp_endpoint_and_headers()
+    readers = []
+    exporter = os.getenv("METRICS_EXPORTER", "otlp").lower()
+    if exporter == "prometheus":
+        # served from the app's /metrics route (prometheus_client default registry)
+        from opentelemetry.exporter.prometheus import PrometheusMetricReader
+        readers.append(PrometheusMetricReader())
+    elif endpoint and exporter != "none":
+        from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+        readers.append(PeriodicExportingMetricReader(OTLPMetricExporter(endpoint=endpoint, headers=header_items)))
+    if os.getenv("OTEL_CONSOLE_EXPORTER", "").lower() in ("1", "true", "yes"):
+        from opentelemetry.sdk.metrics.export import ConsoleMetricExporter
+        readers.append(PeriodicExportingMetricReader(ConsoleMetricExporter()))
+    service_name = os.getenv("OTEL_SERVICE_NAME", "langcommander")
+    metrics.set_meter_provider(MeterProvider(resource=Resource.create({"service.name": service_name}), metric_readers=readers))
+
+    meter = metrics.get_meter("langcommander")
+    meter.create_observable_counter(
+        "cache.hits", callbacks=[lambda options: _observe_caches("hits")], description="Cache hits"
+    )
+    meter.create_observable_counter(
+        "cache.misses", callbacks=[lambda options: _observe_caches("misses")], description="Cache misses"
+    )
+    meter.create_observable_gauge(
+        "cache.hit_ratio", callbacks=[lambda options: _observe_caches("hit_ratio")], description="Cache hit ratio (0-1)"
+    )
+    meter.create_observable_gauge(
+        "cache.size", callbacks=[lambda options: _observe_caches("size")], description="Entries held in the cache"
+    )
+    meter.create_observable_gauge(
+        "component.stat", callbacks=[lambda options: _observe_stats()],
+        description="Numeric counters reported by a component's stats() (alert queue, embeddings, ...)",
+    )
+
+def _observe_caches(stat):
+    from opentelemetry.metrics import Observation
+    return [Observation(cache.stats()[stat], {"cache": name}) for name, cache in list(_caches.items())]
+
+def _observe_stats():
+    from opentelemetry.metrics import Observation
+    observations = []
+    for component, stats in list(_stats.items()):
+        for stat, value in stats().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                observations.append(Observation(value, {"component": component, "stat": stat}))
+    return observations
+
+def register_stats(name, stats):
+    """Export every numeric value returned by stats() as the component.stat gauge."""
+    _stats[name] = stats
+    if _export_configured():
+        _setup_meter_provider()
+
+def register_cache(name, cache):
+    """Export hits, misses, hit ratio and size of a cache.LRUCache as OpenTelemetry metrics."""
+    if cache is None:
+        return
+    _caches[name] = cache
+    if _export_configured():
+        _setup_meter_provider()
+
 def instrument_app(app):
     """Instrument Flask app for OpenTelemetry tracing."""
+    if not _export_configured():
+        return
     # Enable debug logging if OTEL_DEBUG is truthy
     if os.getenv("OTEL_DEBUG", "").lower() in ("1", "true", "yes"):
         _configure_logging()
@@ -76,8 +186,26 @@ def instrument_app(app):
     except ImportError:
         pass
 
+def instrument_asgi(app):
+    """Wrap an ASGI app with OpenTelemetry request tracing; returns the app to serve."""
+    if not _export_configured():
+        return app
+    if os.getenv("OTEL_DEBUG", "").lower() in ("1", "true", "yes"):
+        _configure_logging()
+    _setup_tracer_provider()
+    try:
+        from opentelemetry.instrumentation.asgi import OpenTelemetryMiddleware
+        return OpenTelemetryMiddleware(app)
+    except ImportError:
+        return app
+
 def instrument_es():
-    """Instrument Elasticsearch client for OpenTelemetry tracing."""
+    """
+    Instrument Elasticsearch client for OpenTelemetry tracing.
+    AsyncElasticsearch is traced by the client's built-in OpenTelemetry support once the tracer provider is set.
+    """
+    if not _export_configured():
+        return
     # Enable debug logging if OTEL_DEBUG is truthy
     if os.getenv("OTEL_DEBUG", "").lower() in ("1", "true", "yes"):
         _configure_logging()
@@ -87,4 +215,220 @@ def instrument_es():
         from opentelemetry.instrumentation.elasticsearch import ElasticsearchInstrumentor
         ElasticsearchInstrumentor().instrument()
     except ImportError:
-        pass
\ No newline at end of file
+        pass
+
+# ------------------------------------------------------------------
+# Hot-path instrumentation: spans and metrics for graph operations and OpenAI calls
+# ------------------------------------------------------------------
+
+def _telemetry():
+    """Tracer and metric instruments, created on first use; None when telemetry is off."""
+    global _instruments
+    if _instruments is None:
+        with _instruments_lock:
+            if _instruments is None:
+                _instruments = _create_instruments() if _export_configured() else False
+    return _instruments or None
+
+def enabled():
+    """Whether spans and metrics are being recorded in this process."""
+    return _telemetry() is not None
+
+def _create_instruments():
+    _setup_tracer_provider()
+    _setup_meter_provider()
+    from opentelemetry import metrics, trace
+    meter = metrics.get_meter("langcommander")
+    seconds = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+    return {
+        "tracer": trace.get_tracer("langcommander"),
+        "spans": os.getenv("TELEMETRY_GRAPH_SPANS", "true").lower() in ("1", "true", "yes"),
+        "operation_duration": meter.create_histogram(
+            "operation.duration", unit="s", description="Duration of graph and incident operations",
+            explicit_bucket_boundaries_advisory=seconds,
+        ),
+        "openai_duration": meter.create_histogram(
+            "openai.request.duration", unit="s", description="Duration of OpenAI API calls",
+            explicit_bucket_boundaries_advisory=seconds,
+        ),
+        "openai_first_token": meter.create_histogram(
+            "openai.time_to_first_token", unit="s", description="Time until the first streamed chat token",
+            explicit_bucket_boundaries_advisory=seconds,
+        ),
+        "openai_tokens": meter.create_counter(
+            "openai.tokens", unit="{token}", description="Tokens used by OpenAI API calls"
+        ),
+        "openai_batch": meter.create_histogram(
+            "openai.batch.size", unit="{input}", description="Inputs per embeddings request",
+            explicit_bucket_boundaries_advisory=[1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2048],
+        ),
+    }
+
+@contextlib.contextmanager
+def _operation(t, name):
+    """
+    Span and operation.duration sample around a call. Yields a dict; setting its "iterator"
+    hands the duration sample over to the iteration of that iterator (see _timed_iteration).
+    """
+    attributes = {"operation": name}
+    state = {"start": time.perf_counter(), "iterator": None}
+    span = t["tracer"].start_as_current_span(name) if t["spans"] else contextlib.nullcontext()
+    try:
+        with span:
+            yield state
+    except Exception:
+        attributes["outcome"] = "error"
+        raise
+    else:
+        attributes["outcome"] = "ok"
+    finally:
+        if state["iterator"] is None or attributes["outcome"] == "error":
+            t["operation_duration"].record(time.perf_counter() - state["start"], attributes)
+
+def _timed_iteration(t, name, iterator, start):
+    """Yield from iterator, recording operation.duration from start until it is exhausted or closed."""
+    attributes = {"operation": name, "outcome": "ok"}
+    try:
+        yield from iterator
+    except Exception:
+        attributes["outcome"] = "error"
+        raise
+    finally:
+        t["operation_duration"].record(time.perf_counter() - start, attributes)
+
+def traced(name):
+    """
+    Decorator recording a span (unless TELEMETRY_GRAPH_SPANS=false) and an operation.duration
+    sample per call. Works on plain functions, coroutines and (async) generators; a generator
+    returned by a plain function is timed until it is exhausted. Costs one function call when
+    telemetry is off.
+    """
+    def decorate(fn):
+        if inspect.isasyncgenfunction(fn):
+            async def wrapper(*args, **kwargs):
+                t = _telemetry()
+                if t is None:
+                    async for item in fn(*args, **kwargs):
+                        yield item
+                    return
+                start = time.perf_counter()
+                try:
+                    async for item in fn(*args, **kwargs):
+                        yield item
+                finally:
+                    t["operation_duration"].record(time.perf_counter() - start, {"operation": name})
+        elif inspect.iscoroutinefunction(fn):
+            async def wrapper(*args, **kwargs):
+                t = _telemetry()
+                if t is None:
+                    return await fn(*args, **kwargs)
+                with _operation(t, name):
+                    return await fn(*args, **kwargs)
+        elif inspect.isgeneratorfunction(fn):
+            # no current span across yields: the consumer's context changes between items
+            def wrapper(*args, **kwargs):
+                t = _telemetry()
+                if t is None:
+                    yield from fn(*args, **kwargs)
+                    return
+                start = time.perf_counter()
+                try:
+                    yield from fn(*args, **kwargs)
+                finally:
+                    t["operation_duration"].record(time.perf_counter() - start, {"operation": name})
+        else:
+            def wrapper(*args, **kwargs):
+                t = _telemetry()
+                if t is None:
+                    return fn(*args, **kwargs)
+                with _operation(t, name) as op:
+                    result = fn(*args, **kwargs)
+                    if inspect.isgenerator(result):
+                        # a plain method returning a generator (iter_nodes, ...): time the iteration too
+                        op["iterator"] = result
+                        return _timed_iteration(t, name, result, op["start"])
+                    return result
+        return functools.wraps(fn)(wrapper)
+    return decorate
+
+def trace_methods(prefix):
+    """Class decorator applying traced("<prefix>.<method>") to every public method the class defines."""
+    def decorate(cls):
+        for name, member in list(vars(cls).items()):
+            if name.startswith("_") or isinstance(member, (staticmethod, classmethod)) or not inspect.isfunction(member):
+                continue
+            setattr(cls, name, traced(f"{prefix}.{name}")(member))
+        return cls
+    return decorate
+
+class _OpenAICall:
+    """Handed to the body of an openai_call block to report usage and streaming progress."""
+    def __init__(self, t=None, attributes=None, span=None, start=None):
+        self._t = t
+        self._attributes = attributes
+        self._span = span
+        self._start = start
+        self._first_token = False
+
+    def usage(self, response):
+        """Record token usage from an API response (or the final chunk of a stream)."""
+        if self._t is None or response is None:
+            return
+        usage = response.get("usage") if isinstance(response, dict) else getattr(response, "usage", None)
+        if not usage:
+            return
+        for kind in ("prompt_tokens", "completion_tokens"):
+            value = usage.get(kind) if isinstance(usage, dict) else getattr(usage, kind, None)
+            if value:
+                self._t["openai_tokens"].add(value, dict(self._attributes, token_type=kind.split("_")[0]))
+                if self._span is not None:
+                    self._span.set_attribute(f"openai.usage.{kind}", value)
+
+    def first_token(self):
+        """Mark the first streamed chunk (records openai.time_to_first_token once)."""
+        if self._t is None or self._first_token:
+            return
+        self._first_token = True
+        self._t["openai_first_token"].record(time.perf_counter() - self._start, self._attributes)
+
+_NO_CALL = _OpenAICall()
+
+@contextlib.contextmanager
+def openai_call(operation, model, batch_size=None, current=True):
+    """
+    Span plus duration/token/batch-size metrics around one OpenAI API call:
+
+        with telemetry.openai_call("embeddings", model, batch_size=len(inputs)) as call:
+            resp = openai.embeddings.create(...)
+            call.usage(resp)
+
+    Use current=False when the block spans a generator (streaming), so the span is not
+    made current across yields.
+    """
+    t = _telemetry()
+    if t is None:
+        yield _NO_CALL
+        return
+    attributes = {"openai.operation": operation, "openai.model": model}
+    if batch_size is not None:
+        t["openai_batch"].record(batch_size, attributes)
+    from opentelemetry import trace
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+    start = time.perf_counter()
+    span = t["tracer"].start_span(f"openai.{operation}", kind=SpanKind.CLIENT, attributes=attributes)
+    if batch_size is not None:
+        span.set_attribute("openai.batch_size", batch_size)
+    scope = trace.use_span(span, end_on_exit=False, record_exception=False, set_status_on_exception=False) if current else contextlib.nullcontext()
+    outcome = "ok"
+    try:
+        with scope:
+            yield _OpenAICall(t, attributes, span, start)
+    except BaseException as exc:
+        if not isinstance(exc, GeneratorExit):
+            outcome = "error"
+            span.record_exception(exc)
+            span.set_status(Status(StatusCode.ERROR, str(exc)))
+        raise
+    finally:
+        span.end()
+        t["openai_duration"].record(time.perf_counter() - start, dict(attributes, outcome=outcome))
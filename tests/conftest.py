@@ -0,0 +1,54 @@
+"""
+Shared fixtures: the application runs against the in-memory cluster and the
+deterministic embeddings from benchmarks/, so the tests need no network.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+import fake_es  # noqa: E402
+import main  # noqa: E402
+import run  # noqa: E402
+from cache import RollupCache  # noqa: E402
+from changefeed import ChangeFeed  # noqa: E402
+from fake_embeddings import FakeEmbeddingProvider  # noqa: E402
+
+DIMS = 32
+
+fake_es.register_script(main.UPSERT_SCRIPT, run._upsert_script)
+fake_es.register_script(main.RESOLUTION_TIME_SCRIPT, run._resolution_time)
+fake_es.register_script(main.RESOLVE_UPDATE_SCRIPT, run._resolve_update)
+fake_es.register_script(main.TRUNCATE_EMBEDDING_SCRIPT, run._truncate_embedding)
+
+
+@pytest.fixture(autouse=True)
+def _environment(monkeypatch, tmp_path):
+    monkeypatch.setenv("EMBEDDING_DIMS", str(DIMS))
+    monkeypatch.setenv("INDEX_BOOTSTRAP_CACHE", str(tmp_path / "indices.json"))
+    for name in ("EMBEDDING_DIMENSIONS", "EMBEDDING_INDEX_TYPE", "VECTOR_SEARCH_MODE", "INCIDENT_HISTORY",
+                 "EMBED_ON_WRITE", "LOCAL_VECTOR_INDEX", "EMBEDDING_MODEL"):
+        monkeypatch.delenv(name, raising=False)
+
+
+@pytest.fixture
+def cluster():
+    return fake_es.FakeCluster()
+
+
+@pytest.fixture
+def embedder():
+    return FakeEmbeddingProvider(dims=DIMS)
+
+
+@pytest.fixture
+def graph(cluster):
+    return main.ElasticsearchGraph(fake_es.client(cluster), node_index="incidents", bootstrap="always")
+
+
+@pytest.fixture
+def manager(graph, embedder):
+    return main.IncidentManager(graph, embedder=embedder, stats_cache=RollupCache(ttl=0, min_age=0), feed=ChangeFeed())
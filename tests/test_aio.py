@@ -0,0 +1,165 @@
+import asyncio
+import inspect
+import sys
+
+import pytest
+
+import aio
+import clients
+import embeddings
+import fake_es
+import main
+from cache import RollupCache
+from changefeed import ChangeFeed
+from fake_embeddings import FakeEmbeddingProvider
+from conftest import DIMS
+
+# shared methods that only build queries and never call Elasticsearch
+PURE = {"archive_query", "stale_embedding_query"}
+
+@pytest.fixture
+def amanager(cluster, embedder):
+    graph = aio.AsyncElasticsearchGraph(fake_es.async_client(cluster), node_index="incidents", bootstrap="always")
+    asyncio.run(graph.bootstrap())
+    return aio.AsyncIncidentManager(graph, embedder=embedder, stats_cache=RollupCache(ttl=0, min_age=0),
+                                    feed=ChangeFeed())
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.mark.parametrize("cls", [aio.AsyncElasticsearchGraph, aio.AsyncIncidentManager])
+def test_every_public_method_is_async(cls):
+    for name, member in inspect.getmembers(cls, inspect.isfunction):
+        if name.startswith("_") or name in PURE:
+            continue
+        assert inspect.iscoroutinefunction(member) or inspect.isasyncgenfunction(member), name
+
+
+@pytest.mark.parametrize("sync_cls, async_cls", [
+    (main.ElasticsearchGraph, aio.AsyncElasticsearchGraph),
+    (main.IncidentManager, aio.AsyncIncidentManager),
+])
+def test_async_methods_match_the_synchronous_signatures(sync_cls, async_cls):
+    for name, member in inspect.getmembers(async_cls, inspect.isfunction):
+        if name.startswith("_") or name in PURE or name == "bootstrap":
+            continue
+        # thread pools (thread_count) have no async counterpart, so trailing parameters may be missing
+        sync_params = list(inspect.signature(getattr(sync_cls, name)).parameters)
+        async_params = list(inspect.signature(member).parameters)
+        assert sync_params[:len(async_params)] == async_params, name
+
+
+def test_get_node_returns_none_when_the_read_fails(amanager, cluster, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise fake_es.ApiError(503, "unavailable_shards_exception", "no shard available")
+
+    monkeypatch.setattr(cluster, "get_doc", unavailable)
+    assert _run(amanager.graph.get_node("inc-1")) is None
+
+
+def test_update_incident_writes_and_stamps_resolved_at(amanager, cluster):
+    async def scenario():
+        await amanager.create_incident("inc-1", "Disk full", "disk full on db-1", "High")
+        assert await amanager.update_incident("inc-1", status="Resolved", assigned_to="ops")
+        return await amanager.get_incident("inc-1")
+
+    incident = _run(scenario())
+    assert incident["status"] == "Resolved" and incident["assigned_to"] == "ops"
+    assert incident["resolved_at"] == incident["updated_at"]
+
+
+def test_list_incidents_and_stats(amanager):
+    async def scenario():
+        for i in range(3):
+            await amanager.create_incident(f"inc-{i}", f"Incident {i}", f"description {i}", "High")
+        await amanager.update_incident("inc-0", status="Closed")
+        page, token = await amanager.list_incidents_page(size=2)
+        rest = await amanager.list_incidents_page(size=2, page_token=token)
+        return page, rest, await amanager.incident_stats(days=7)
+
+    page, (rest, last_token), stats = _run(scenario())
+    assert len(page) == 2 and len(rest) == 1 and last_token is None
+    assert {inc["node_id"] for inc in page + rest} == {"inc-0", "inc-1", "inc-2"}
+    assert (stats["total"], stats["open"], stats["resolved"]) == (3, 2, 1)
+
+
+def test_link_and_get_edge(amanager):
+    async def scenario():
+        edge_id = await amanager.link("inc-1", "svc-checkout", relation="affects")
+        return edge_id, await amanager.graph.get_edge(edge_id)
+
+    edge_id, edge = _run(scenario())
+    assert edge_id == "inc-1:affects:svc-checkout"
+    assert (edge["source"], edge["target"], edge["type"]) == ("inc-1", "svc-checkout", "affects")
+
+
+@pytest.fixture
+def asgi_app(cluster, monkeypatch):
+    monkeypatch.setenv("ELASTICSEARCH_CLOUD_ID", "test")
+    monkeypatch.setenv("ELASTICSEARCH_API_KEY", "test")
+    monkeypatch.setenv("ALERT_QUEUE_ENABLED", "false")
+    monkeypatch.setenv("FEED_POLL_INTERVAL", "0")
+    monkeypatch.setattr(clients, "async_elasticsearch_client", lambda *args, **kwargs: fake_es.async_client(cluster))
+    monkeypatch.setattr(embeddings, "get_provider", lambda: FakeEmbeddingProvider(dims=DIMS))
+    sys.modules.pop("asgi", None)
+    import asgi
+    yield asgi
+    sys.modules.pop("asgi", None)
+
+
+def test_asgi_pages_run_on_the_async_manager(asgi_app, cluster):
+    app = asgi_app.app
+
+    async def scenario():
+        client = app.test_client()
+        async with app.test_app():
+            created = await client.post("/incidents/new", form={
+                "id": "inc-1", "title": "Disk full", "description": "disk full on db-1", "priority": "High",
+            })
+            edited = await client.post("/incidents/inc-1/edit", form={
+                "title": "Disk full", "description": "disk full on db-1", "status": "Resolved", "priority": "High",
+            })
+            listing = await client.get("/")
+            stats = await client.get("/stats")
+            return created, edited, listing, stats, await listing.get_data(as_text=True)
+
+    created, edited, listing, stats, html = _run(scenario())
+    assert (created.status_code, edited.status_code) == (302, 302)
+    assert (listing.status_code, stats.status_code) == (200, 200)
+    assert "inc-1" in html
+    assert "app" not in sys.modules
+    assert cluster.indices["incidents"]["docs"]["inc-1"]["_source"]["resolved_at"]
+
+
+class FailingEmbeddings(FakeEmbeddingProvider):
+    async def _arequest(self, model, inputs):
+        self.api_calls += 1
+        raise ConnectionError("embeddings unavailable")
+
+
+def test_hybrid_mcp_search_does_not_embed_again_after_a_failure(cluster, monkeypatch):
+    provider = FailingEmbeddings(dims=DIMS)
+    monkeypatch.setenv("ELASTICSEARCH_CLOUD_ID", "test")
+    monkeypatch.setenv("ELASTICSEARCH_API_KEY", "test")
+    monkeypatch.setenv("ALERT_QUEUE_ENABLED", "false")
+    monkeypatch.setattr(clients, "async_elasticsearch_client", lambda *args, **kwargs: fake_es.async_client(cluster))
+    monkeypatch.setattr(embeddings, "get_provider", lambda: provider)
+    sys.modules.pop("asgi", None)
+    import asgi
+
+    async def scenario():
+        await asgi.manager.create_incident("inc-1", "Disk full", "disk full on db-1", "High")
+        provider.api_calls = 0
+        async with asgi.app.test_app():
+            resp = await asgi.app.test_client().post("/mcp", json={"query": "disk full", "mode": "hybrid"})
+            return resp.status_code, await resp.get_json()
+
+    try:
+        status, body = _run(scenario())
+    finally:
+        sys.modules.pop("asgi", None)
+    assert status == 200
+    assert [hit["node_id"] for hit in body["results"]] == ["inc-1"]
+    assert provider.api_calls == 1
@@ -0,0 +1,105 @@
+from datetime import datetime
+
+import pytest
+
+import fake_es
+import main
+from cache import RollupCache
+from changefeed import ChangeFeed
+
+
+@pytest.fixture
+def history_graph(cluster):
+    return main.ElasticsearchGraph(fake_es.client(cluster), node_index="incidents", bootstrap="always", history=True)
+
+
+@pytest.fixture
+def history_manager(history_graph, embedder):
+    manager = main.IncidentManager(history_graph, embedder=embedder, stats_cache=RollupCache(ttl=0, min_age=0),
+                                   feed=ChangeFeed())
+    for i, text in enumerate(("disk full on db-1", "checkout latency spike", "dns resolution failures")):
+        manager.create_incident(f"inc-{i}", f"Incident {i}", text, "High")
+    return manager
+
+
+def _ids(cluster, index):
+    return {doc_id for name in cluster.resolve(index) for doc_id in cluster.indices[name]["docs"]}
+
+
+def _archive(graph, *node_ids, **kwargs):
+    return graph.archive_nodes({"ids": {"values": list(node_ids)}}, **kwargs)
+
+
+def test_archive_moves_nodes_to_history(history_manager, history_graph, cluster):
+    history_manager.update_incident("inc-0", status="Resolved")
+
+    report = history_graph.archive_nodes(history_manager.archive_query(0))
+
+    assert (report["archived"], report["kept"], report["failed_ids"]) == (1, 0, [])
+    assert _ids(cluster, "incidents") == {"inc-1", "inc-2"}
+    assert _ids(cluster, "incidents-history") == {"inc-0"}
+    assert history_graph.get_node("inc-0") is None
+    assert history_graph.get_node("inc-0", history=True)["status"] == "Resolved"
+
+
+def test_node_written_during_archive_stays(history_manager, history_graph, cluster, monkeypatch):
+    delete_hits = history_graph._delete_hits
+
+    def concurrent_update(hits, *args, **kwargs):
+        if kwargs.get("conditional", True):
+            # an alert lands between the copy to history and the delete
+            history_manager.update_incident("inc-0", priority="Low")
+        return delete_hits(hits, *args, **kwargs)
+
+    monkeypatch.setattr(history_graph, "_delete_hits", concurrent_update)
+    report = _archive(history_graph, "inc-0", "inc-1")
+
+    assert (report["archived"], report["kept"]) == (1, 1)
+    assert _ids(cluster, "incidents") == {"inc-0", "inc-2"}
+    assert _ids(cluster, "incidents-history") == {"inc-1"}
+    assert history_graph.get_node("inc-0")["priority"] == "Low"
+
+
+def test_alert_firing_again_restores_the_archived_incident(history_manager, history_graph, cluster):
+    history_manager.record_alert("inc-0", "Incident 0", "disk full on db-1", "High")
+    history_manager.update_incident("inc-0", status="Resolved")
+    _archive(history_graph, "inc-0")
+
+    assert history_manager.record_alert("inc-0", "Incident 0", "disk full on db-1 again", "Critical") == "updated"
+
+    assert _ids(cluster, "incidents-history") == set()
+    node = history_graph.get_node("inc-0")
+    assert (node["status"], node["priority"], node["fire_count"]) == ("Triggered", "Critical", 2)
+    assert node["title"] == "Incident 0"
+
+
+def test_archived_incidents_are_found_after_rollover(history_manager, history_graph, cluster):
+    _archive(history_graph, "inc-0")
+    report = _archive(history_graph, "inc-1", rollover_conditions={"max_docs": 1})
+
+    assert report["rolled_over"] and report["history_index"] == "incidents-history-000002"
+    assert _ids(cluster, "incidents-history-000001") == {"inc-0"}
+    assert _ids(cluster, "incidents-history-000002") == {"inc-1"}
+    archived = history_graph.find_archived(["inc-0", "inc-1", "inc-2"])
+    assert {node_id: hit["_index"] for node_id, hit in archived.items()} == {
+        "inc-0": "incidents-history-000001", "inc-1": "incidents-history-000002",
+    }
+    assert history_graph.restore_archived(["inc-0"]) == ["inc-0"]
+    assert _ids(cluster, "incidents") == {"inc-0", "inc-2"}
+
+
+def test_find_archived_returns_the_newest_copy(history_manager, history_graph, cluster):
+    history_manager.update_incident("inc-0", priority="Low")
+    _archive(history_graph, "inc-0", "inc-1")
+    cluster.rollover("incidents-history", None)
+    # inc-0 restored, edited and archived again, while its first copy failed to be deleted
+    newer = dict(history_graph.get_node("inc-0", history=True), title="Reopened",
+                 updated_at=datetime.utcnow().isoformat())
+    history_graph.es.index(index="incidents-history", id="inc-0", refresh=True, document=newer)
+
+    # both inc-0 copies sort before inc-1, filling the first page
+    archived = history_graph.find_archived(["inc-0", "inc-1"], source=["title"])
+
+    assert archived.keys() == {"inc-0", "inc-1"}
+    assert archived["inc-0"]["_source"]["title"] == "Reopened"
+    assert archived["inc-0"]["_index"] == "incidents-history-000002"
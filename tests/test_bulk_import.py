@@ -0,0 +1,55 @@
+import json
+
+import main
+
+
+def _write_ndjson(path, lines):
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def _record(n):
+    return {"id": f"inc-{n}", "title": f"Incident {n}", "description": f"service {n} is down", "priority": "High"}
+
+
+def test_bulk_import_reports_one_batch_per_batch_size(manager, graph):
+    reports = list(manager.bulk_import((_record(n) for n in range(5)), batch_size=2))
+
+    assert [r["batch"] for r in reports] == [1, 2, 3]
+    assert [r["records"] for r in reports] == [2, 2, 1]
+    assert sum(r["indexed"] for r in reports) == 5
+    assert all(r["failed_ids"] == [] for r in reports)
+    doc = graph.es.get(index=graph.node_index, id="inc-4")["_source"]
+    assert doc["status"] == "New" and doc["embedding"] is not None
+
+
+def test_bulk_import_reports_records_without_required_fields(manager):
+    records = [_record(1), {"id": "inc-2", "title": "no description"}, {"title": "no id", "description": "x"}]
+
+    (report,) = manager.bulk_import(records)
+
+    assert report["indexed"] == 1
+    assert report["failed_ids"] == ["inc-2", "<missing id>"]
+
+
+def test_malformed_ndjson_lines_are_reported_and_skipped(manager, graph, tmp_path):
+    path = _write_ndjson(tmp_path / "incidents.ndjson", [
+        json.dumps(_record(1)),
+        "{not json",
+        "",
+        json.dumps(["a", "list"]),
+        json.dumps(_record(2)),
+    ])
+
+    reports = list(manager.bulk_import(main._read_records(path), batch_size=2))
+
+    assert sum(r["indexed"] for r in reports) == 2
+    assert [f for r in reports for f in r["failed_ids"]] == ["line 2: invalid JSON", "line 4: not a JSON object"]
+    assert graph.es.get(index=graph.node_index, id="inc-2")["found"]
+
+
+def test_csv_records_are_read_by_extension(tmp_path):
+    path = tmp_path / "incidents.csv"
+    path.write_text("id,title,description\ninc-1,Disk full,disk full on db-1\n", encoding="utf-8")
+
+    assert list(main._read_records(str(path))) == [{"id": "inc-1", "title": "Disk full", "description": "disk full on db-1"}]
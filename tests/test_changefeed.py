@@ -0,0 +1,116 @@
+import time
+
+import pytest
+
+import main
+from cache import RollupCache
+from changefeed import ChangeFeed
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for the change feed"
+        time.sleep(0.01)
+
+
+def _messages(events, count):
+    return [next(events) for _ in range(count)]
+
+
+@pytest.fixture
+def feed():
+    return ChangeFeed(coalesce=0.2, poll_interval=0, queue_size=4)
+
+
+@pytest.fixture
+def feed_manager(graph, embedder, feed):
+    manager = main.IncidentManager(graph, embedder=embedder, stats_cache=RollupCache(ttl=0, min_age=0), feed=feed)
+    feed.attach(manager)
+    for i in range(5):
+        manager.create_incident(f"inc-{i}", f"Incident {i}", f"checkout latency spike {i}", "High")
+    return manager
+
+
+def test_writes_reach_subscribers(feed_manager, feed):
+    sub = feed.subscribe()
+    feed_manager.update_incident("inc-1", status="Resolved")
+
+    rows = sub.get(timeout=5)
+
+    assert [(row["node_id"], row["status"]) for row in rows] == [("inc-1", "Resolved")]
+    assert "embedding" not in rows[0]
+    feed.unsubscribe(sub)
+
+
+def test_subscriptions_only_get_their_incidents(feed_manager, feed):
+    sub = feed.subscribe(ids=["inc-2"])
+    feed_manager.update_incident("inc-1", status="Resolved")
+    feed_manager.update_incident("inc-2", priority="Low")
+
+    rows = sub.get(timeout=5)
+
+    assert [row["node_id"] for row in rows] == ["inc-2"]
+    feed.unsubscribe(sub)
+
+
+def test_a_burst_of_writes_costs_one_read(feed_manager, feed, monkeypatch):
+    reads = []
+    incident_rows = feed_manager.incident_rows
+    monkeypatch.setattr(feed_manager, "incident_rows", lambda ids: reads.append(sorted(ids)) or incident_rows(ids))
+    subs = [feed.subscribe() for _ in range(3)]
+
+    for i in range(5):
+        feed_manager.update_incident(f"inc-{i}", priority="Low")
+
+    for sub in subs:
+        assert sorted(row["node_id"] for row in sub.get(timeout=5)) == [f"inc-{i}" for i in range(5)]
+    assert reads == [[f"inc-{i}" for i in range(5)]]
+    assert feed.stats()["fetches"] == 1
+    assert feed.stats()["rows_sent"] == 5
+    for sub in subs:
+        feed.unsubscribe(sub)
+
+
+def test_slow_subscriber_is_reset(feed_manager, feed):
+    slow, fast = feed.subscribe(), feed.subscribe()
+    for i in range(feed.queue_size + 1):
+        feed_manager.update_incident("inc-0", priority=f"P{i}")
+        _wait_for(lambda: feed.stats()["fetches"] == i + 1)
+        assert fast.get(timeout=5)[0]["priority"] == f"P{i}"
+
+    assert slow.closed
+    assert list(feed.events(slow)) == ["event: ready\ndata: []\n\n", "event: reset\ndata: []\n\n"]
+    # the reset stream is over and unsubscribed; the fast one keeps getting rows
+    assert feed.stats()["subscribers"] == 1
+    feed.unsubscribe(fast)
+
+
+def test_reconnect_catches_up_from_last_event_id(feed_manager, feed):
+    sub = feed.subscribe()
+    events = feed.events(sub, heartbeat=5)
+    feed_manager.update_incident("inc-0", status="Resolved")
+    ready, first = _messages(events, 2)
+    assert ready.startswith("event: ready")
+    last_event_id = first.split("\n")[0].removeprefix("id: ")
+    assert '"inc-0"' in first
+    events.close()
+    assert feed.stats()["subscribers"] == 0
+
+    # written while the client was disconnected
+    feed_manager.update_incident("inc-3", status="Resolved")
+    feed_manager.update_incident("inc-4", status="Resolved")
+
+    missed = feed.catch_up(last_event_id, ids={"inc-0", "inc-3"})
+    assert {row["node_id"] for row in missed} == {"inc-0", "inc-3"}
+    sub = feed.subscribe(ids={"inc-0", "inc-3"})
+    events = feed.events(sub, initial=missed)
+    ready, initial = _messages(events, 2)
+    assert initial.startswith(f"id: {missed[0]['updated_at']}\nevent: incidents\n")
+    events.close()
+
+
+def test_publish_without_subscribers_is_free(feed_manager, feed, monkeypatch):
+    monkeypatch.setattr(feed_manager, "incident_rows", lambda ids: pytest.fail("read without subscribers"))
+    feed_manager.update_incident("inc-0", status="Resolved")
+    assert feed.stats()["published"] == 0
@@ -0,0 +1,82 @@
+import pytest
+
+import clients
+
+
+class ClientError(Exception):
+    status_code = 400
+
+
+def _fail(breaker, exc=RuntimeError("upstream down")):
+    with pytest.raises(type(exc)):
+        with breaker:
+            raise exc
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(clients.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_circuit_opens_after_consecutive_failures(clock):
+    breaker = clients.CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    _fail(breaker)
+    assert breaker.state == "closed"
+    _fail(breaker)
+    assert breaker.state == "open"
+
+    with pytest.raises(clients.CircuitOpenError):
+        with breaker:
+            pass
+    assert breaker.stats() == {"state": "open", "consecutive_failures": 2, "opened": 1, "rejected": 1}
+
+
+def test_successful_trial_call_closes_the_circuit(clock):
+    breaker = clients.CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    _fail(breaker)
+    clock[0] += 30
+    assert breaker.state == "half-open"
+
+    with breaker:
+        # only the trial call goes through while it is running
+        with pytest.raises(clients.CircuitOpenError):
+            with breaker:
+                pass
+
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+    with breaker:
+        pass
+
+
+def test_failed_trial_call_reopens_the_circuit(clock):
+    breaker = clients.CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    _fail(breaker)
+    clock[0] += 30
+    _fail(breaker)
+
+    assert breaker.state == "open"
+    assert breaker.opened == 1
+    clock[0] += 29
+    with pytest.raises(clients.CircuitOpenError):
+        with breaker:
+            pass
+    clock[0] += 1
+    assert breaker.state == "half-open"
+
+
+def test_client_errors_do_not_open_the_circuit(clock):
+    breaker = clients.CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    _fail(breaker, ClientError("bad request"))
+    assert breaker.state == "closed"
+
+
+def test_zero_threshold_disables_the_circuit(clock):
+    breaker = clients.CircuitBreaker("test", failure_threshold=0)
+    for _ in range(3):
+        _fail(breaker)
+    with breaker:
+        pass
+    assert breaker.state == "closed"
@@ -0,0 +1,125 @@
+import json
+
+import pytest
+
+import correlate
+import main
+from cache import RollupCache
+from changefeed import ChangeFeed
+
+
+def _disk(host, percent, address):
+    return {"host": host, "message": f"disk /var at {percent}% on {address}"}
+
+
+DISK_TITLE = "Disk usage high"
+CPU_PAYLOAD = {"host": "web-1", "message": "load average 12 on web-1, run queue growing"}
+
+
+def _alert(incident_id, title, payload):
+    return {"incident_id": incident_id, "title": title, "description": json.dumps(payload), "priority": "High"}
+
+
+def _flip(fp, *bits):
+    value = int(fp, 16)
+    for bit in bits:
+        value ^= 1 << bit
+    return format(value, "016x")
+
+
+def test_fingerprint_ignores_ids_addresses_and_numbers():
+    first = correlate.fingerprint(_alert("alert-1", DISK_TITLE, _disk("db-1", 91, "10.0.0.12")))
+    again = correlate.fingerprint(_alert("alert-2", DISK_TITLE, _disk("db-7", 97, "10.0.0.13")))
+    other = correlate.fingerprint(_alert("alert-3", "CPU saturated", CPU_PAYLOAD))
+
+    assert first == again
+    assert correlate.distance(first, other) > 3
+
+
+def test_banding_finds_every_fingerprint_within_max_distance():
+    correlator = correlate.AlertCorrelator(max_distance=3)
+    fp = "0123456789abcdef"
+    correlator.remember("inc-1", fp)
+
+    # 3 flipped bits leave at least one of the 4 bands (16 bits each) intact
+    assert correlator.match("alert-2", _flip(fp, 0, 20, 40)) == ("inc-1", True)
+    # one flipped bit in every band: no band is shared, so it is not even compared
+    assert correlator.match("alert-3", _flip(fp, 0, 16, 32, 48)) == (None, False)
+    # the same alert attaches to the same incident again, without a new link
+    assert correlator.match("alert-2", _flip(fp, 0, 20, 40)) == ("inc-1", False)
+    assert correlator.stats()["correlated"] == 2
+
+
+def test_closest_incident_wins():
+    correlator = correlate.AlertCorrelator(max_distance=3)
+    fp = "0123456789abcdef"
+    correlator.remember("inc-far", _flip(fp, 1, 2))
+    correlator.remember("inc-near", _flip(fp, 1))
+
+    assert correlator.match("alert-9", fp) == ("inc-near", True)
+
+
+def test_incidents_expire_after_the_window(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(correlate.time, "monotonic", lambda: clock[0])
+    correlator = correlate.AlertCorrelator(window=60)
+    correlator.remember("inc-1", "0123456789abcdef")
+
+    clock[0] += 59
+    assert correlator.match("alert-2", "0123456789abcdef") == ("inc-1", True)
+    # matching refreshed the incident's last alert time
+    clock[0] += 59
+    assert correlator.match("alert-3", "0123456789abcdef") == ("inc-1", True)
+    clock[0] += 61
+    assert correlator.match("alert-4", "0123456789abcdef") == (None, False)
+
+
+@pytest.fixture
+def correlating(graph, embedder):
+    correlator = correlate.AlertCorrelator()
+    manager = main.IncidentManager(graph, embedder=embedder, correlator=correlator,
+                                   stats_cache=RollupCache(ttl=0, min_age=0), feed=ChangeFeed())
+    return manager
+
+
+def _record(manager, incident_id, title, payload):
+    return manager.record_alert(incident_id, title, json.dumps(payload), "High")
+
+
+def _source(graph, index, doc_id):
+    return graph.es.get(index=index, id=doc_id)["_source"]
+
+
+def test_near_duplicate_alert_is_attached_with_an_edge(correlating, graph):
+    assert _record(correlating, "alert-disk-1", DISK_TITLE, _disk("db-1", 91, "10.0.0.12")) == "created"
+    assert _record(correlating, "alert-disk-2", DISK_TITLE, _disk("db-2", 95, "10.0.0.13")) == "correlated"
+    assert _record(correlating, "alert-cpu", "CPU saturated", CPU_PAYLOAD) == "created"
+
+    incident = _source(graph, graph.node_index, "alert-disk-1")
+    assert (incident["fire_count"], incident["correlated_alerts"], incident["status"]) == (2, 1, "Triggered")
+    assert not graph.es.exists(index=graph.node_index, id="alert-disk-2")
+    edge = _source(graph, graph.edge_index, "alert-disk-2:duplicate_of:alert-disk-1")
+    assert (edge["source"], edge["target"], edge["type"]) == ("alert-disk-2", "alert-disk-1", "duplicate_of")
+
+
+def test_apply_alerts_correlates_within_one_batch(correlating, graph):
+    failed = correlating.apply_alerts([
+        _alert("alert-disk-1", DISK_TITLE, _disk("db-1", 91, "10.0.0.12")),
+        _alert("alert-cpu", "CPU saturated", CPU_PAYLOAD),
+        dict(_alert("alert-disk-2", DISK_TITLE, _disk("db-2", 95, "10.0.0.13")), fire_count=3),
+    ])
+
+    assert failed == []
+    assert _source(graph, graph.node_index, "alert-disk-1")["fire_count"] == 4
+    assert _source(graph, graph.node_index, "alert-cpu")["fire_count"] == 1
+    assert not graph.es.exists(index=graph.node_index, id="alert-disk-2")
+    assert graph.es.exists(index=graph.edge_index, id="alert-disk-2:duplicate_of:alert-disk-1")
+
+
+def test_resolved_incident_stops_absorbing_alerts(correlating, graph):
+    _record(correlating, "alert-disk-1", DISK_TITLE, _disk("db-1", 91, "10.0.0.12"))
+    correlating.update_incident("alert-disk-1", status="Resolved")
+
+    assert "alert-disk-1" not in correlating.correlator
+    assert _record(correlating, "alert-disk-2", DISK_TITLE, _disk("db-2", 95, "10.0.0.13")) == "created"
+    assert _source(graph, graph.node_index, "alert-disk-1")["status"] == "Resolved"
@@ -0,0 +1,49 @@
+import embeddings
+from fake_embeddings import FakeEmbeddingProvider
+
+
+def test_memory_tier_serves_repeats_of_normalized_text():
+    embedder = FakeEmbeddingProvider(dims=8)
+    vector = embedder.embed("disk full on db-1")
+    assert embedder.embed("disk  full on\ndb-1") == vector
+    stats = embedder.stats()
+    assert (stats["api_calls"], stats["memory_hits"]) == (1, 1)
+
+
+def test_embed_many_requests_only_distinct_misses():
+    embedder = FakeEmbeddingProvider(dims=8)
+    embedder.embed("cached")
+    vectors = embedder.embed_many(["cached", "new", "new", "other"], batch_size=10)
+    assert vectors[1] == vectors[2]
+    assert embedder.api_calls == 2
+
+
+def test_disk_tier_is_shared_between_providers(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    first = FakeEmbeddingProvider(dims=8, disk_path=path)
+    vector = first.embed("checkout latency spike")
+
+    second = FakeEmbeddingProvider(dims=8, disk_path=path)
+    assert second.embed("checkout latency spike") == vector
+    assert second.embed("checkout latency spike") == vector
+    stats = second.stats()
+    assert (stats["api_calls"], stats["disk_hits"], stats["memory_hits"]) == (0, 1, 1)
+
+
+def test_disk_tier_prunes_the_oldest_rows(tmp_path):
+    store = embeddings.SqliteEmbeddingStore(str(tmp_path / "embeddings.db"), max_rows=5, prune_every=2)
+    for i in range(12):
+        store.set(f"key-{i}", [float(i)])
+    assert len(store) <= 6
+    assert store.get("key-0") is None
+    assert store.get("key-11") == [11.0]
+
+    store.prune()
+    assert len(store) == 5
+    assert [store.get(f"key-{i}") is not None for i in range(7, 12)] == [True] * 5
+
+
+def test_keys_differ_by_model_and_size():
+    assert embeddings.cache_key("m", "text") != embeddings.cache_key("m", "text", 256)
+    assert embeddings.cache_key("m", "text") != embeddings.cache_key("other", "text")
+    assert embeddings.cache_key("m", " text \n") == embeddings.cache_key("m", "text")
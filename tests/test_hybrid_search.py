@@ -0,0 +1,71 @@
+import main
+
+
+def _response(*ids):
+    return {"hits": {"hits": [{"_id": doc_id, "_source": {"node_id": doc_id}} for doc_id in ids]}}
+
+
+def _ids(docs):
+    return [doc["node_id"] for doc in docs]
+
+
+def test_rrf_ranks_documents_found_by_both_legs_first():
+    lexical = _response("a", "b", "c")
+    vector = _response("c", "d", "a")
+
+    # a: 1/61 + 1/63, c: 1/63 + 1/61, then b (1/62) and d (1/62)
+    assert _ids(main.GraphBase._fuse_rrf([lexical, vector], k=4)) == ["a", "c", "b", "d"]
+
+
+def test_rrf_breaks_ties_by_id_and_pages_with_offset():
+    lexical = _response("d", "b")
+    vector = _response("c", "a")
+
+    fused = main.GraphBase._fuse_rrf([lexical, vector], k=10)
+    assert _ids(fused) == ["c", "d", "a", "b"]
+    assert _ids(main.GraphBase._fuse_rrf([lexical, vector], k=2, offset=1)) == ["d", "a"]
+    assert main.GraphBase._fuse_rrf([lexical, vector], k=2, offset=4) == []
+
+
+def test_rrf_rank_constant_is_configurable(monkeypatch):
+    monkeypatch.setenv("HYBRID_RANK_CONSTANT", "0")
+    # with no constant the top hit of one leg (1/1) beats a document ranked 2nd and 3rd (1/2 + 1/3)
+    fused = main.GraphBase._fuse_rrf([_response("a", "b", "c"), _response("d", "x", "b")], k=1)
+    assert _ids(fused) == ["a"]
+
+
+def test_rank_window_covers_the_requested_page(monkeypatch):
+    monkeypatch.setenv("HYBRID_RANK_WINDOW", "5")
+    assert main.GraphBase._hybrid_window(k=3, offset=0) == 5
+    assert main.GraphBase._hybrid_window(k=3, offset=10) == 13
+
+
+def _incidents(manager):
+    manager.create_incident("inc-disk", "Disk full", "disk full on db-1", "High")
+    manager.create_incident("inc-cpu", "CPU high", "cpu saturated on web-1", "Medium")
+    manager.create_incident("inc-mem", "Memory pressure", "out of memory on db-1", "Low")
+
+
+def test_hybrid_search_finds_exact_incident_ids(manager):
+    _incidents(manager)
+
+    assert _ids(manager.search_hybrid("inc-cpu", k=1)) == ["inc-cpu"]
+
+
+def test_hybrid_search_pages_through_one_fused_ranking(manager):
+    _incidents(manager)
+
+    everything = _ids(manager.search_hybrid("db-1 disk", k=3))
+    assert everything[0] == "inc-disk"
+    assert _ids(manager.search_hybrid("db-1 disk", k=1, offset=1)) == everything[1:2]
+    assert all("embedding" not in doc for doc in manager.search_hybrid("db-1 disk", k=3))
+
+
+def test_hybrid_search_without_embedding_is_lexical_only(manager, embedder):
+    _incidents(manager)
+    calls = embedder.api_calls
+
+    results = manager.search_hybrid("memory", k=3, embed=False)
+
+    assert _ids(results) == ["inc-mem"]
+    assert embedder.api_calls == calls
@@ -0,0 +1,79 @@
+import time
+
+import fake_es
+import main
+
+
+def _node(graph, incident_id):
+    # read the stored document, not the node cache
+    return graph.es.get(index=graph.node_index, id=incident_id)["_source"]
+
+
+def test_resolved_at_is_stamped_when_an_incident_is_resolved(manager, graph):
+    manager.create_incident("inc-1", "Disk full", "disk full on db-1", "High")
+    assert "resolved_at" not in _node(graph, "inc-1")
+
+    manager.update_incident("inc-1", status="Resolved")
+    node = _node(graph, "inc-1")
+    assert node["resolved_at"] == node["updated_at"]
+
+
+def test_editing_a_resolved_incident_keeps_resolved_at(manager, graph):
+    manager.create_incident("inc-1", "Disk full", "disk full on db-1", "High")
+    manager.update_incident("inc-1", status="Resolved")
+    resolved_at = _node(graph, "inc-1")["resolved_at"]
+    time.sleep(0.01)
+
+    # the edit form always posts the status
+    manager.update_incident("inc-1", title="Disk full on db-1", status="Resolved")
+    manager.update_incident("inc-1", status="Closed")
+    node = _node(graph, "inc-1")
+    assert node["title"] == "Disk full on db-1"
+    assert node["status"] == "Closed"
+    assert node["resolved_at"] == resolved_at
+
+
+def test_reopened_incident_is_stamped_again_when_resolved(manager, graph):
+    manager.create_incident("inc-1", "Disk full", "disk full on db-1", "High")
+    manager.update_incident("inc-1", status="Resolved")
+    first = _node(graph, "inc-1")["resolved_at"]
+    time.sleep(0.01)
+
+    manager.update_incident("inc-1", status="In Progress")
+    manager.update_incident("inc-1", status="Resolved")
+    assert _node(graph, "inc-1")["resolved_at"] > first
+
+
+def test_updates_without_status_do_not_touch_resolved_at(manager, graph):
+    manager.create_incident("inc-1", "Disk full", "disk full on db-1", "High")
+    manager.update_incident("inc-1", priority="Low")
+    assert "resolved_at" not in _node(graph, "inc-1")
+    assert manager._status_script({"priority": "Low"}) is None
+    assert manager._status_script({"status": "Resolved"})["source"] == main.RESOLVE_UPDATE_SCRIPT
+
+
+def _record_writes(monkeypatch):
+    writes = []
+    dispatch = fake_es._dispatch
+
+    def recording(cluster, method, path, params, body):
+        if any(part in ("_update", "_doc", "_create", "_bulk") for part in path):
+            writes.append((method, "/".join(path)))
+        return dispatch(cluster, method, path, params, body)
+
+    monkeypatch.setattr(fake_es, "_dispatch", recording)
+    return writes
+
+
+def test_repeated_alert_firings_update_one_incident_with_one_write_each(manager, graph, monkeypatch):
+    writes = _record_writes(monkeypatch)
+
+    assert manager.record_alert("alert-cpu", "CPU high", "cpu at 95% on web-1", "High") == "created"
+    assert len(writes) == 1
+    assert manager.record_alert("alert-cpu", "CPU high", "cpu at 99% on web-1", "Critical") == "updated"
+    assert writes == [("POST", "incidents/_update/alert-cpu")] * 2
+
+    node = _node(graph, "alert-cpu")
+    assert node["fire_count"] == 2
+    assert (node["status"], node["priority"], node["description"]) == ("Triggered", "Critical", "cpu at 99% on web-1")
+    assert graph.es.count(index=graph.node_index)["count"] == 1
@@ -0,0 +1,133 @@
+import glob
+import json
+import os
+
+import pytest
+
+import ingest
+
+
+def _payload(rule_id, severity="High"):
+    return {"rule": {"id": rule_id, "name": f"Rule {rule_id}", "severity": severity}}
+
+
+class RecordingManager:
+    def __init__(self, fail=False, fail_ids=()):
+        self.batches = []
+        self.fail = fail
+        self.fail_ids = set(fail_ids)
+
+    def apply_alerts(self, alerts):
+        self.batches.append(alerts)
+        if self.fail:
+            raise ConnectionError("cluster unavailable")
+        return [alert["incident_id"] for alert in alerts if alert["incident_id"] in self.fail_ids]
+
+
+def _kept_entries(queue, spool):
+    entries = []
+    for path in glob.glob(f"{spool}.*"):
+        if path != queue._spool_file():
+            with open(path, encoding="utf-8") as f:
+                entries.extend(json.loads(line) for line in f)
+    return entries
+
+
+@pytest.fixture
+def make_queue():
+    queues = []
+
+    def make(manager, **kwargs):
+        queue = ingest.AlertQueue(manager, window=3600, **kwargs)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.stop()
+
+
+def test_repeated_firings_are_coalesced(make_queue):
+    manager = RecordingManager()
+    queue = make_queue(manager)
+    for _ in range(3):
+        assert queue.submit(_payload("cpu"))
+    assert queue.submit(_payload("disk"))
+
+    queue.flush(wait=True)
+
+    [batch] = manager.batches
+    assert {alert["incident_id"]: alert["fire_count"] for alert in batch} == {"alert-cpu": 3, "alert-disk": 1}
+    stats = queue.stats()
+    assert (stats["received"], stats["merged"], stats["flushed"], stats["depth"]) == (4, 2, 2, 0)
+
+
+def test_full_queue_drops_new_rules_but_merges_known_ones(make_queue):
+    queue = make_queue(RecordingManager(), max_depth=1)
+    assert queue.submit(_payload("cpu"))
+    assert not queue.submit(_payload("disk"))
+    assert queue.submit(_payload("cpu"))
+    assert queue.stats()["dropped"] == 1
+
+
+def test_spool_of_an_exited_worker_is_replayed(make_queue, manager, graph, tmp_path):
+    spool = str(tmp_path / "alerts.spool")
+    # left behind by a worker that exited before flushing
+    with open(f"{spool}.999999999", "w", encoding="utf-8") as f:
+        for payload in (_payload("cpu"), _payload("cpu"), _payload("disk", "Low")):
+            f.write(json.dumps(payload) + "\n")
+
+    queue = make_queue(manager, spool_path=spool)
+    queue.submit(_payload("cpu"))
+    queue.flush(wait=True)
+
+    node = graph.es.get(index=graph.node_index, id="alert-cpu")["_source"]
+    assert node["fire_count"] == 3
+    assert graph.es.get(index=graph.node_index, id="alert-disk")["_source"]["priority"] == "Low"
+    assert glob.glob(f"{spool}.*") == [queue._spool_file()]
+
+
+def test_spool_is_kept_when_a_flush_fails(make_queue, tmp_path):
+    spool = str(tmp_path / "alerts.spool")
+    manager = RecordingManager(fail=True)
+    queue = make_queue(manager, spool_path=spool)
+    queue.submit(_payload("cpu"))
+
+    queue.flush(wait=True)
+
+    assert queue.stats()["failed"] == 1
+    assert _kept_entries(queue, spool) == [{"incident_id": "alert-cpu", "payload": _payload("cpu")}]
+
+
+def test_partly_failed_flush_keeps_only_the_failed_alerts(make_queue, tmp_path):
+    spool = str(tmp_path / "alerts.spool")
+    queue = make_queue(RecordingManager(fail_ids={"alert-disk"}), spool_path=spool)
+    for rule_id in ("cpu", "disk", "cpu", "disk"):
+        queue.submit(_payload(rule_id))
+
+    queue.flush(wait=True)
+
+    stats = queue.stats()
+    assert (stats["flushed"], stats["failed"]) == (1, 1)
+    # the written alert is not replayed (and counted) a second time
+    assert _kept_entries(queue, spool) == [{"incident_id": "alert-disk", "payload": _payload("disk")}] * 2
+
+
+def test_replayed_alert_without_rule_id_updates_the_same_incident(make_queue, manager, graph, tmp_path):
+    spool = str(tmp_path / "alerts.spool")
+    failing = make_queue(RecordingManager(fail=True), spool_path=spool)
+    failing.submit({"rule": {"name": "Unnamed rule"}})
+    failing.flush(wait=True)
+    [entry] = _kept_entries(failing, spool)
+    # hand the kept spool over as if its worker had exited
+    for path in glob.glob(f"{spool}.*"):
+        if path != failing._spool_file():
+            os.rename(path, path.replace(f".{os.getpid()}", ".999999999", 1))
+
+    queue = make_queue(manager, spool_path=spool)
+    queue.submit(_payload("cpu"))
+    queue.flush(wait=True)
+
+    node = graph.es.get(index=graph.node_index, id=entry["incident_id"])["_source"]
+    assert node["title"] == "Unnamed rule" and node["fire_count"] == 1
+    assert graph.es.count(index=graph.node_index)["count"] == 2
@@ -0,0 +1,67 @@
+import main
+
+
+def _add(graph, node_id, **fields):
+    graph.add_node(node_id, dict({"type": "incident", "title": node_id, "embedding": [0.5] * 4}, **fields))
+
+
+def test_reads_go_through_the_cache(graph, cluster):
+    graph.es.index(index=graph.node_index, id="inc-1", document={"node_id": "inc-1", "title": "Disk full"})
+
+    assert graph.get_node("inc-1")["title"] == "Disk full"
+    requests = cluster.requests
+    assert graph.get_node("inc-1")["title"] == "Disk full"
+    assert cluster.requests == requests
+
+
+def test_cached_full_document_answers_projected_reads(graph, cluster):
+    _add(graph, "inc-1")
+    requests = cluster.requests
+
+    node = graph.get_node("inc-1", source=main.SOURCE_NO_EMBEDDING)
+    nodes = graph.get_nodes(["inc-1"], source={"includes": ["node_id", "title"]})
+
+    assert cluster.requests == requests
+    assert "embedding" not in node and node["title"] == "inc-1"
+    assert nodes == {"inc-1": {"node_id": "inc-1", "title": "inc-1"}}
+
+
+def test_lean_cached_copy_does_not_answer_a_full_read(graph, cluster):
+    graph.es.index(index=graph.node_index, id="inc-1", document={"node_id": "inc-1", "embedding": [0.5] * 4})
+    assert "embedding" not in graph.get_node("inc-1", source=main.SOURCE_NO_EMBEDDING)
+    requests = cluster.requests
+
+    assert graph.get_node("inc-1")["embedding"] == [0.5] * 4
+    assert cluster.requests == requests + 1
+
+
+def test_cached_copy_is_returned_by_value(graph):
+    _add(graph, "inc-1")
+
+    graph.get_node("inc-1")["title"] = "changed by the caller"
+
+    assert graph.get_node("inc-1")["title"] == "inc-1"
+
+
+def test_writes_invalidate_the_cached_node(manager, graph):
+    manager.create_incident("inc-1", "Disk full", "disk full on db-1", "High")
+    assert graph.get_node("inc-1")["status"] == "New"
+
+    manager.update_incident("inc-1", status="In Progress")
+    assert graph.get_node("inc-1")["status"] == "In Progress"
+
+    graph.upsert_node("inc-1", {"priority": "Low"}, {"priority": "Low"})
+    assert graph.get_node("inc-1")["priority"] == "Low"
+
+
+def test_get_nodes_only_fetches_uncached_nodes(graph, cluster):
+    _add(graph, "inc-1")
+    graph.es.index(index=graph.node_index, id="inc-2", document={"node_id": "inc-2", "title": "inc-2"})
+    requests = cluster.requests
+
+    nodes = graph.get_nodes(["inc-1", "inc-2", "inc-missing"])
+
+    assert sorted(nodes) == ["inc-1", "inc-2"]
+    assert cluster.requests == requests + 1
+    graph.get_nodes(["inc-1", "inc-2"])
+    assert cluster.requests == requests + 1
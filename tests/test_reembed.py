@@ -0,0 +1,86 @@
+import functools
+
+import reembed
+
+
+def _stale_count(manager):
+    return manager.graph.es.count(index=manager.graph.node_index, query=manager.stale_embedding_query())["count"]
+
+
+def test_migrate_knn_truncation_keeps_embeddings_current(manager, graph, embedder, monkeypatch):
+    for i in range(5):
+        manager.create_incident(f"inc-{i}", f"Latency {i}", f"checkout latency spike {i}", "High")
+    assert _stale_count(manager) == 0
+
+    graph.migrate_vector_index(dims=16, model=embedder.model)
+    monkeypatch.setenv("EMBEDDING_DIMENSIONS", "16")
+    embedder.dimensions = 16
+
+    node = graph.es.get(index=graph.node_index, id="inc-0")["_source"]
+    assert len(node["embedding"]) == 16
+    assert node["embedding_model"] == embedder.version == "fake-embedding/16"
+    assert _stale_count(manager) == 0
+
+
+def test_migrate_knn_truncation_leaves_other_models_stale(manager, graph):
+    manager.create_incident("inc-1", "Latency", "checkout latency spike", "High")
+
+    graph.migrate_vector_index(dims=16, model="text-embedding-3-small")
+
+    node = graph.es.get(index=graph.node_index, id="inc-1")["_source"]
+    assert len(node["embedding"]) == 16
+    assert node["embedding_model"] == "fake-embedding"
+
+
+def test_migrate_reindexes_without_timeout_or_retries(manager, graph, monkeypatch):
+    manager.create_incident("inc-1", "Latency", "checkout latency spike", "High")
+    reindexed = []
+    options = graph.es.options
+
+    def recording_options(**kwargs):
+        client = options(**kwargs)
+        reindex = client.reindex
+        monkeypatch.setattr(client, "reindex", lambda **kw: reindexed.append(kwargs) or reindex(**kw))
+        return client
+
+    monkeypatch.setattr(graph.es, "options", recording_options)
+    graph.migrate_vector_index()
+
+    assert reindexed == [{"request_timeout": None, "retry_on_timeout": False}]
+    assert graph.es.count(index=graph.node_index)["count"] == 1
+
+
+def test_reembed_reopens_an_expired_point_in_time(manager, graph, embedder, cluster, monkeypatch):
+    for i in range(7):
+        manager.create_incident(f"inc-{i}", f"Latency {i}", f"checkout latency spike {i}", "High")
+    embedder.model = "fake-embedding-v2"
+    assert _stale_count(manager) == 7
+
+    monkeypatch.setattr(graph, "iter_nodes", functools.partial(graph.iter_nodes, page_size=2))
+    search = cluster.search
+    pit_searches = []
+
+    def expiring_search(target, body):
+        if body and "pit" in body:
+            pit_searches.append(body["pit"]["id"])
+            if len(pit_searches) == 2:
+                cluster.pits.clear()
+        return search(target, body)
+
+    monkeypatch.setattr(cluster, "search", expiring_search)
+    report = reembed.ReembedJob(manager, batch_size=2, workers=1).run()
+
+    assert report["done"] and report["error"] is None
+    assert report["embedded"] == 7
+    assert _stale_count(manager) == 0
+
+
+def test_reembed_sorts_by_keyword_node_ids(manager, graph, monkeypatch):
+    calls = []
+    iter_nodes = graph.iter_nodes
+    monkeypatch.setattr(graph, "iter_nodes", lambda *a, **kw: calls.append(kw) or iter_nodes(*a, **kw))
+
+    reembed.ReembedJob(manager).run()
+
+    assert calls[0]["sort_field"] == "node_id.keyword"
+    assert calls[0]["unmapped_type"] == "keyword"
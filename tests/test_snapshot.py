@@ -0,0 +1,106 @@
+import pytest
+
+import fake_es
+import main
+import snapshot
+
+
+def _sources(graph):
+    return {doc["node_id"]: doc for doc in graph.iter_nodes(history=True)}
+
+
+def _edges(graph):
+    return {doc["edge_id"]: doc for doc in graph.iter_edges()}
+
+
+@pytest.fixture
+def populated(manager, graph):
+    for i in range(5):
+        manager.create_incident(f"inc-{i}", f"Incident {i}", f"checkout latency spike {i}", "High")
+    manager.update_incident("inc-0", status="Resolved")
+    manager.link("inc-1", "svc-checkout", relation="affects")
+    manager.link("inc-2", "inc-1", relation="duplicate_of")
+    return graph
+
+
+@pytest.mark.parametrize("compression, embeddings", [("gzip", "inline"), ("none", "sidecar")])
+def test_export_import_round_trip(populated, tmp_path, compression, embeddings):
+    manifest = snapshot.export_graph(populated, str(tmp_path), compression=compression, embeddings=embeddings)
+    assert (manifest["nodes"], manifest["edges"]) == (5, 2)
+
+    target = main.ElasticsearchGraph(fake_es.client(fake_es.FakeCluster()), node_index="incidents", bootstrap="always")
+    report = snapshot.import_graph(target, str(tmp_path), expected_dims=manifest["dims"])
+
+    assert (report["nodes"], report["edges"], report["failed_ids"]) == (5, 2, [])
+    assert _edges(target) == _edges(populated)
+    imported, original = _sources(target), _sources(populated)
+    assert imported.keys() == original.keys()
+    for node_id, doc in original.items():
+        vector = doc.pop("embedding")
+        copy = imported[node_id]
+        # sidecar vectors go through float32
+        assert copy.pop("embedding") == pytest.approx(vector, abs=1e-6)
+        assert copy == doc
+
+
+def test_import_without_embeddings_marks_nodes_pending(populated, tmp_path):
+    snapshot.export_graph(populated, str(tmp_path))
+
+    target = main.ElasticsearchGraph(fake_es.client(fake_es.FakeCluster()), node_index="incidents", bootstrap="always")
+    snapshot.import_graph(target, str(tmp_path), skip_embeddings=True)
+
+    for doc in _sources(target).values():
+        assert "embedding" not in doc and "embedding_model" not in doc
+        assert doc["embedding_pending"] is True
+
+
+def test_import_rejects_vectors_of_another_size(populated, tmp_path):
+    manifest = snapshot.export_graph(populated, str(tmp_path))
+
+    with pytest.raises(ValueError):
+        snapshot.import_graph(populated, str(tmp_path), expected_dims=manifest["dims"] * 2)
+
+
+def test_incomplete_snapshot_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        snapshot.read_manifest(str(tmp_path))
+
+
+@pytest.fixture
+def archived(cluster, embedder):
+    graph = main.ElasticsearchGraph(fake_es.client(cluster), node_index="incidents", bootstrap="always", history=True)
+    manager = main.IncidentManager(graph, embedder=embedder)
+    for i in range(3):
+        manager.create_incident(f"inc-{i}", f"Incident {i}", f"checkout latency spike {i}", "High")
+    manager.update_incident("inc-0", status="Resolved")
+    assert graph.archive_nodes({"ids": {"values": ["inc-0"]}})["archived"] == 1
+    return graph
+
+
+def _history_ids(graph):
+    return {doc["node_id"] for doc in graph.iter_archived()}
+
+
+def test_archived_nodes_are_imported_back_into_history(archived, tmp_path):
+    manifest = snapshot.export_graph(archived, str(tmp_path), embeddings="sidecar")
+    assert (manifest["nodes"], manifest["archived"]) == (3, 1)
+
+    target = main.ElasticsearchGraph(fake_es.client(fake_es.FakeCluster()), node_index="incidents", bootstrap="always",
+                                     history=True)
+    report = snapshot.import_graph(target, str(tmp_path))
+
+    assert (report["nodes"], report["archived"], report["failed_ids"]) == (3, 1, [])
+    assert _history_ids(target) == {"inc-0"}
+    assert {doc["node_id"] for doc in target.iter_nodes()} == {"inc-1", "inc-2"}
+    assert _sources(target)["inc-0"]["status"] == "Resolved"
+    assert "archived" not in _sources(target)["inc-0"]
+
+
+def test_archived_nodes_stay_current_without_history(archived, tmp_path):
+    snapshot.export_graph(archived, str(tmp_path))
+
+    target = main.ElasticsearchGraph(fake_es.client(fake_es.FakeCluster()), node_index="incidents", bootstrap="always")
+    report = snapshot.import_graph(target, str(tmp_path))
+
+    assert (report["nodes"], report["archived"]) == (3, 0)
+    assert {doc["node_id"] for doc in target.iter_nodes()} == {"inc-0", "inc-1", "inc-2"}
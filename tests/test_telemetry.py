@@ -0,0 +1,70 @@
+import pytest
+
+import telemetry
+
+
+class Histogram:
+    def __init__(self):
+        self.samples = []
+
+    def record(self, value, attributes=None):
+        self.samples.append((value, dict(attributes or {})))
+
+
+@pytest.fixture
+def durations(monkeypatch):
+    histogram = Histogram()
+    monkeypatch.setattr(telemetry, "_telemetry", lambda: {"spans": False, "tracer": None, "operation_duration": histogram})
+    return histogram.samples
+
+
+@telemetry.trace_methods("test")
+class Store:
+    def __init__(self, items):
+        self.items = items
+
+    def count(self):
+        return len(self.items)
+
+    def iter_items(self):
+        # returns a generator without being a generator function, like ElasticsearchGraph.iter_nodes
+        return self._scan()
+
+    def _scan(self):
+        for item in self.items:
+            yield item
+
+    def fail(self):
+        raise KeyError("missing")
+
+
+def test_plain_methods_record_one_sample(durations):
+    assert Store([1, 2]).count() == 2
+    assert [attrs for _, attrs in durations] == [{"operation": "test.count", "outcome": "ok"}]
+
+
+def test_returned_generators_are_timed_until_exhausted(durations):
+    items = Store([1, 2, 3]).iter_items()
+    assert next(items) == 1
+    assert durations == []
+
+    assert list(items) == [2, 3]
+    assert [attrs for _, attrs in durations] == [{"operation": "test.iter_items", "outcome": "ok"}]
+
+
+def test_abandoned_generators_are_recorded_when_closed(durations):
+    items = Store([1, 2, 3]).iter_items()
+    next(items)
+    items.close()
+    assert len(durations) == 1
+
+
+def test_failures_are_recorded_as_errors(durations):
+    with pytest.raises(KeyError):
+        Store([]).fail()
+    assert [attrs for _, attrs in durations] == [{"operation": "test.fail", "outcome": "error"}]
+
+
+def test_tracing_is_free_when_telemetry_is_off(monkeypatch):
+    monkeypatch.setattr(telemetry, "_telemetry", lambda: None)
+    assert list(Store([1]).iter_items()) == [1]
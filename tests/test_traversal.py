@@ -0,0 +1,65 @@
+import main
+
+
+def _chain(manager):
+    for incident_id in ("inc-1", "inc-2", "inc-3"):
+        manager.create_incident(incident_id, f"Incident {incident_id}", "api latency", "High")
+    manager.link("inc-1", "svc-api", relation="affects")
+    manager.link("inc-2", "svc-api", relation="affects")
+    manager.link("inc-2", "inc-3", relation="duplicate_of")
+
+
+def _count_pits(graph, monkeypatch):
+    opened = []
+    open_pit = graph.es.open_point_in_time
+
+    def counting(*args, **kwargs):
+        opened.append(kwargs.get("index"))
+        return open_pit(*args, **kwargs)
+
+    monkeypatch.setattr(graph.es, "open_point_in_time", counting)
+    return opened
+
+
+def test_neighbors_by_direction_and_edge_type(manager, graph):
+    _chain(manager)
+
+    assert graph.neighbors("svc-api", direction="in") == {"svc-api": {"inc-1", "inc-2"}}
+    assert graph.neighbors("svc-api", direction="out") == {"svc-api": set()}
+    assert graph.neighbors(["inc-2", "inc-3"]) == {"inc-2": {"svc-api", "inc-3"}, "inc-3": {"inc-2"}}
+    assert graph.neighbors("inc-2", edge_type="duplicate_of") == {"inc-2": {"inc-3"}}
+
+
+def test_traverse_reports_hop_distances(manager, graph):
+    _chain(manager)
+
+    assert graph.traverse("inc-1") == {"inc-1": 0, "svc-api": 1, "inc-2": 2, "inc-3": 3}
+    assert graph.traverse("inc-1", max_hops=2) == {"inc-1": 0, "svc-api": 1, "inc-2": 2}
+    assert graph.traverse("inc-1", direction="out") == {"inc-1": 0, "svc-api": 1}
+
+
+def test_related_incidents_are_nearest_first(manager):
+    _chain(manager)
+
+    related = manager.related_incidents("inc-1")
+
+    assert [(inc["node_id"], inc["hops"]) for inc in related] == [("inc-2", 2), ("inc-3", 3)]
+
+
+def test_small_frontiers_need_no_point_in_time(manager, graph, monkeypatch):
+    _chain(manager)
+    opened = _count_pits(graph, monkeypatch)
+
+    graph.traverse("inc-1")
+
+    assert opened == []
+
+
+def test_frontier_with_more_edges_than_one_search_pages_with_a_pit(manager, graph, monkeypatch):
+    monkeypatch.setattr(main, "TERMS_CHUNK", 2)
+    _chain(manager)
+    manager.link("inc-3", "svc-api", relation="affects")
+    opened = _count_pits(graph, monkeypatch)
+
+    assert graph.neighbors("svc-api") == {"svc-api": {"inc-1", "inc-2", "inc-3"}}
+    assert opened == [graph.edge_index]
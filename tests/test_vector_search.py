@@ -0,0 +1,116 @@
+import elastic_transport
+import pytest
+
+import fake_es
+import main
+import vector_index
+from conftest import DIMS
+
+
+@pytest.fixture
+def legacy_graph(cluster, embedder):
+    # an index from before the embedding was indexed for kNN
+    cluster.create_index("incidents", {"mappings": {"properties": {
+        "embedding": {"type": "dense_vector", "dims": DIMS, "index": False},
+    }}})
+    graph = main.ElasticsearchGraph(fake_es.client(cluster), node_index="incidents", bootstrap="never")
+    for i, text in enumerate(("disk full on db-1", "checkout latency spike", "dns resolution failures")):
+        graph.es.index(index="incidents", id=f"inc-{i}", refresh=True, document={
+            "node_id": f"inc-{i}", "type": "incident", "status": "Open", "description": text,
+            "embedding": embedder.embed(text),
+        })
+    return graph
+
+
+def _searches(cluster, monkeypatch):
+    bodies = []
+    search = cluster.search
+
+    def recording_search(target, body):
+        bodies.append(body)
+        return search(target, body)
+
+    monkeypatch.setattr(cluster, "search", recording_search)
+    return bodies
+
+
+def test_rejected_knn_falls_back_to_exact_scoring(legacy_graph, cluster, embedder, monkeypatch):
+    bodies = _searches(cluster, monkeypatch)
+
+    hits = legacy_graph.search_by_vector(embedder.embed("disk full"), k=1)
+
+    assert hits[0]["node_id"] == "inc-0"
+    assert legacy_graph.vector_indexed is False
+    assert ["knn" in body for body in bodies] == [True, False]
+
+    bodies.clear()
+    legacy_graph.search_by_vector(embedder.embed("disk full"), k=1)
+    assert ["knn" in body for body in bodies] == [False]
+
+
+def test_knn_is_retried_after_the_cooldown(legacy_graph, cluster, embedder, monkeypatch):
+    monkeypatch.setenv("KNN_RETRY_SECONDS", "0")
+    legacy_graph.search_by_vector(embedder.embed("disk full"), k=1)
+    assert legacy_graph.vector_indexed is False
+
+    # another process migrated the index meanwhile
+    cluster.indices["incidents"]["mappings"]["properties"]["embedding"]["index"] = True
+    bodies = _searches(cluster, monkeypatch)
+    hits = legacy_graph.search_by_vector(embedder.embed("disk full"), k=1)
+
+    assert hits[0]["node_id"] == "inc-0"
+    assert ["knn" in body for body in bodies] == [True]
+    assert legacy_graph.vector_indexed is True
+
+
+def test_transport_errors_do_not_disable_knn(graph, cluster, embedder, monkeypatch):
+    def unreachable(target, body):
+        raise elastic_transport.ConnectionError("connection refused")
+
+    monkeypatch.setattr(cluster, "search", unreachable)
+    with pytest.raises(elastic_transport.ConnectionError):
+        graph.search_by_vector(embedder.embed("disk full"), k=1)
+    assert graph.vector_indexed is True
+
+
+def test_rejected_knn_leg_of_hybrid_search_falls_back(legacy_graph, embedder):
+    hits = legacy_graph.search_hybrid("disk", embedder.embed("disk full"), k=1)
+
+    assert hits[0]["node_id"] == "inc-0"
+    assert legacy_graph.vector_indexed is False
+
+
+@pytest.fixture
+def local_manager(graph, embedder, monkeypatch):
+    monkeypatch.setenv("LOCAL_VECTOR_INDEX_MIN_SCORE", "-1")
+    manager = main.IncidentManager(graph, embedder=embedder, vector_index=vector_index.LocalVectorIndex())
+    manager.create_incident("inc-open", "Disk", "disk full on db-1", "High")
+    manager.create_incident("inc-resolved", "Disk", "disk full on db-1 again", "High")
+    manager.update_incident("inc-resolved", status="Resolved")
+    return manager
+
+
+def test_local_index_answers_searches_for_open_incidents(local_manager, embedder, cluster, monkeypatch):
+    local_manager.search_semantic(embedder.embed("disk full"), k=1)
+    bodies = _searches(cluster, monkeypatch)
+
+    hits = local_manager.search_semantic(embedder.embed("disk full"), k=1, filters={"status": "New"})
+
+    assert [hit["node_id"] for hit in hits] == ["inc-open"]
+    assert bodies == []
+
+
+def test_local_index_does_not_hide_other_statuses(local_manager, embedder):
+    hits = local_manager.search_semantic(embedder.embed("disk full on db-1 again"), k=1,
+                                         filters={"status": ["New", "Resolved"]})
+
+    assert [hit["node_id"] for hit in hits] == ["inc-resolved"]
+
+
+def test_history_searches_skip_the_local_index(local_manager, embedder, cluster, monkeypatch):
+    local_manager.search_semantic(embedder.embed("disk full"), k=1)
+    bodies = _searches(cluster, monkeypatch)
+
+    local_manager.search_semantic(embedder.embed("disk full"), k=1, history=True)
+
+    assert len(bodies) == 1
@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+
+# numpy is optional (the local index is disabled without it) and imported on first use
+np = None
+
+def _load_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return None
+        np = numpy
+    return np
+
+# Incident statuses kept in the local index; resolved/closed incidents are served by Elasticsearch
+OPEN_STATUSES = ("New", "In Progress", "Triggered")
+
+class LocalVectorIndex:
+    """
+    In-process vector index over open incidents.
+
+    Embeddings are L2-normalized and stored as rows of one contiguous matrix
+    (float32, or int8 scaled by 127 to cut memory by 4x), so a query is a single
+    matrix-vector product followed by argpartition for the top k.
+    Incident fields (minus the embedding) are kept alongside for returning results.
+    """
+    def __init__(self, dtype="float32", capacity=1024, resync_interval=300.0):
+        if _load_numpy() is None:
+            raise RuntimeError("numpy is required for the local vector index")
+        if dtype not in ("float32", "int8"):
+            raise ValueError("dtype must be 'float32' or 'int8'")
+        self.dtype = dtype
+        self.resync_interval = resync_interval
+        self.last_sync = None
+        self._capacity = capacity
+        self._matrix = None
+        self._ids = []
+        self._rows = {}
+        self._docs = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, node_id):
+        return node_id in self._rows
+
+    def _encode(self, vector):
+        vec = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        if norm:
+            vec = vec / norm
+        if self.dtype == "int8":
+            return np.round(vec * 127.0).astype(np.int8)
+        return vec
+
+    def _ensure_capacity(self, dims):
+        if self._matrix is None:
+            self._matrix = np.zeros((self._capacity, dims), dtype=self.dtype)
+        elif self._matrix.shape[1] != dims:
+            raise ValueError(f"vector has {dims} dims, index has {self._matrix.shape[1]}")
+        elif len(self._ids) >= self._matrix.shape[0]:
+            grown = np.zeros((self._matrix.shape[0] * 2, dims), dtype=self.dtype)
+            grown[: len(self._ids)] = self._matrix[: len(self._ids)]
+            self._matrix = grown
+
+    def upsert(self, node_id, vector, doc=None):
+        """Add or replace a node's vector (and its fields, without the embedding)."""
+        row_vec = self._encode(vector)
+        with self._lock:
+            self._ensure_capacity(row_vec.shape[0])
+            row = self._rows.get(node_id)
+            if row is None:
+                row = len(self._ids)
+                self._ids.append(node_id)
+                self._rows[node_id] = row
+            self._matrix[row] = row_vec
+            if doc is not None:
+                self._docs[node_id] = {k: v for k, v in doc.items() if k != "embedding"}
+
+    def update_doc(self, node_id, fields):
+        """Merge changed fields into a stored node without touching its vector."""
+        with self._lock:
+            if node_id in self._docs:
+                self._docs[node_id].update({k: v for k, v in fields.items() if k != "embedding"})
+
+    def remove(self, node_id):
+        """Drop a node, moving the last row into its slot to keep the matrix contiguous."""
+        with self._lock:
+            row = self._rows.pop(node_id, None)
+            if row is None:
+                return
+            self._docs.pop(node_id, None)
+            last = len(self._ids) - 1
+            if row != last:
+                moved = self._ids[last]
+                self._matrix[row] = self._matrix[last]
+                self._ids[row] = moved
+                self._rows[moved] = row
+            self._ids.pop()
+
+    def search(self, vector, k=10, filters=None):
+        """Return up to k (cosine similarity, doc) pairs, best first."""
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        with self._lock:
+            n = len(self._ids)
+            if n == 0 or k <= 0:
+                return []
+            scores = self._matrix[:n] @ query
+            if self.dtype == "int8":
+                scores = scores / 127.0
+            if filters:
+                mask = np.array([_matches(self._docs.get(node_id, {}), filters) for node_id in self._ids], dtype=bool)
+                scores = np.where(mask, scores, -np.inf)
+            if k < n:
+                top = np.argpartition(-scores, k)[:k]
+            else:
+                top = np.arange(n)
+            top = top[np.argsort(-scores[top])]
+            return [
+                (float(scores[i]), dict(self._docs.get(self._ids[i], {"node_id": self._ids[i]})))
+                for i in top if np.isfinite(scores[i])
+            ]
+
+    def replace_all(self, docs):
+        """Rebuild the index from (node_id, doc) pairs where doc carries an embedding."""
+        fresh = LocalVectorIndex(dtype=self.dtype, capacity=self._capacity, resync_interval=self.resync_interval)
+        for node_id, doc in docs:
+            if doc.get("embedding"):
+                fresh.upsert(node_id, doc["embedding"], doc)
+        with self._lock:
+            self._matrix, self._ids, self._rows, self._docs = fresh._matrix, fresh._ids, fresh._rows, fresh._docs
+            self.last_sync = time.monotonic()
+
+    def needs_resync(self):
+        return self.last_sync is None or time.monotonic() - self.last_sync > self.resync_interval
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._ids),
+                "dtype": self.dtype,
+                "bytes": int(self._matrix[: len(self._ids)].nbytes) if self._matrix is not None else 0,
+                "seconds_since_sync": None if self.last_sync is None else round(time.monotonic() - self.last_sync, 1),
+            }
+
+def _matches(doc, filters):
+    for field in ("status", "priority"):
+        value = filters.get(field)
+        if value:
+            values = value if isinstance(value, (list, tuple)) else [value]
+            if doc.get(field) not in values:
+                return False
+    return True
+
+def supports_filters(filters):
+    """The local index evaluates status/priority filters; time bounds need Elasticsearch."""
+    return not filters or not (filters.get("since") or filters.get("until"))
+
+def covers_statuses(filters):
+    """
+    Whether local results can stand in for Elasticsearch: the status filter, if any, only
+    asks for open incidents. Other statuses are never held locally.
+    """
+    value = (filters or {}).get("status")
+    values = value if isinstance(value, (list, tuple)) else [value] if value else []
+    return all(status in OPEN_STATUSES for status in values)
+
+def index_from_env():
+    """
+    Build the local vector index from the environment, or return None when disabled.
+    LOCAL_VECTOR_INDEX (default false), LOCAL_VECTOR_INDEX_DTYPE (float32 or int8),
+    LOCAL_VECTOR_INDEX_RESYNC (seconds between full resyncs from Elasticsearch, default 300).
+    """
+    if os.getenv("LOCAL_VECTOR_INDEX", "false").lower() not in ("1", "true", "yes") or _load_numpy() is None:
+        return None
+    return LocalVectorIndex(
+        dtype=os.getenv("LOCAL_VECTOR_INDEX_DTYPE", "float32"),
+        resync_interval=float(os.getenv("LOCAL_VECTOR_INDEX_RESYNC", "300")),
+    )